@@ -0,0 +1,87 @@
+"""
+Benchmark calculator_client against one-request-per-call scripts
+
+Starts the app with uvicorn and times the same calculations made:
+    - like a typical script, with a fresh connection per call
+    - through CalculatorClient from one thread (keep-alive only)
+    - through CalculatorClient from many threads (keep-alive plus batching)
+
+Usage:
+    python benchmarks/client_throughput.py [--number 2000] [--threads 32] [--port 8766]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from calculator_client import CalculatorClient  # noqa: E402
+
+
+def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def report(label: str, number: int, seconds: float) -> None:
+    print(f"{label:<34} {number / seconds:>10,.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the client library")
+    parser.add_argument("--number", type=int, default=2000, help="Calculations per scenario")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args(argv)
+
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=dict(os.environ),
+    )
+    try:
+        wait_until_ready(url)
+        print(f"{'scenario':<34} {'calls/s':>10}")
+
+        started = time.perf_counter()
+        for i in range(args.number):
+            httpx.post(f"{url}/calculate", json={"num1": i, "num2": 2, "operation": "multiply"})
+        report("new connection per call", args.number, time.perf_counter() - started)
+
+        with CalculatorClient(url) as client:
+            started = time.perf_counter()
+            for i in range(args.number):
+                client.calculate(i, 2, "multiply")
+            report("CalculatorClient, 1 thread", args.number, time.perf_counter() - started)
+
+        with CalculatorClient(url) as client, ThreadPoolExecutor(args.threads) as pool:
+            started = time.perf_counter()
+            list(pool.map(lambda i: client.calculate(i, 2, "multiply"), range(args.number)))
+            elapsed = time.perf_counter() - started
+            report(f"CalculatorClient, {args.threads} threads", args.number, elapsed)
+            stats = client.metrics.snapshot()
+            print(f"  {stats['http_requests']} HTTP requests, p50 {stats['p50_ms']:.1f} ms, "
+                  f"p99 {stats['p99_ms']:.1f} ms")
+    finally:
+        server.terminate()
+        server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Benchmark operations.calculate in each numeric mode
+
+Usage:
+    python benchmarks/numeric_modes.py [--number 200000]
+
+Logging is raised to WARNING so the numbers measure arithmetic and dispatch
+rather than log formatting.
+"""
+import argparse
+import logging
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from operations import calculate, NUMERIC_MODES  # noqa: E402
+
+CASES = {
+    "small": (1234.0, 56.0),
+    "large int": (2 ** 200 + 1, 3 ** 100),
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark numeric modes")
+    parser.add_argument("--number", type=int, default=200000, help="Calls per measurement")
+    args = parser.parse_args(argv)
+    logging.getLogger("fastapi_calculator").setLevel(logging.WARNING)
+
+    print(f"{'mode':<10} {'operands':<10} {'operation':<10} {'ns/call':>10}")
+    for mode in NUMERIC_MODES:
+        for case, (num1, num2) in CASES.items():
+            if mode == "float" and case == "large int":
+                num1, num2 = float(num1), float(num2)
+            for operation in ("add", "multiply", "divide"):
+                if mode == "int" and operation == "divide":
+                    continue  # exact division only; the operands are not multiples
+                seconds = min(timeit.repeat(
+                    lambda: calculate(num1, num2, operation, mode), number=args.number, repeat=3
+                ))
+                print(f"{mode:<10} {case:<10} {operation:<10} {seconds / args.number * 1e9:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Benchmark the shared-memory parallel engine against single-process numpy
+
+Usage:
+    python benchmarks/parallel_engine.py [--rows 20000000] [--operation divide]
+
+Times ParallelEngine.calculate for 1..cpu_count workers (after a warm-up
+call that starts the pool) next to operations.calculate_arrays.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from operations import calculate_arrays, registry  # noqa: E402
+from parallel_engine import ParallelEngine  # noqa: E402
+
+
+def best_of(function, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the parallel engine")
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--operation", default="divide")
+    parser.add_argument("--chunk-size", type=int, default=262_144)
+    args = parser.parse_args(argv)
+    logging.getLogger("fastapi_calculator").setLevel(logging.WARNING)
+
+    rng = np.random.default_rng(0)
+    num1 = rng.random(args.rows)
+    num2 = rng.random(args.rows)
+    operation = registry.get(args.operation)
+
+    single = best_of(lambda: calculate_arrays(num1, num2, operation))
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    print(f"{'numpy':>8} {single:>10.3f} {1.0:>8.2f}")
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        engine = ParallelEngine(workers=workers, threshold=0, chunk_size=args.chunk_size)
+        # workers=1 would bypass the pool; force it to measure pool overhead
+        run = (lambda: engine._calculate_parallel(num1, num2, operation))
+        run()
+        seconds = best_of(run)
+        engine.close()
+        print(f"{workers:>8} {seconds:>10.3f} {single / seconds:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Benchmark the Unix socket listener against HTTP POST /calculate
+
+Starts the app with uvicorn (UDS_PATH set) and times the same calculations
+over a keep-alive HTTP connection, over the socket one request at a time,
+and over the socket pipelined.
+
+Usage:
+    python benchmarks/uds_vs_http.py [--number 5000] [--port 8765]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from uds_server import UnixSocketClient  # noqa: E402
+
+
+def wait_until_ready(url: str, path: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200 and os.path.exists(path):
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def report(label: str, number: int, seconds: float) -> None:
+    print(f"{label:<22} {number / seconds:>12,.0f} {seconds / number * 1e6:>12.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Unix socket vs HTTP")
+    parser.add_argument("--number", type=int, default=5000, help="Calculations per transport")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    path = str(Path(tempfile.mkdtemp()) / "calculator.sock")
+    url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, UDS_PATH=path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        wait_until_ready(url, path)
+        items = [("multiply", float(i), 1.5) for i in range(args.number)]
+        print(f"{'transport':<22} {'calls/s':>12} {'us/call':>12}")
+
+        with httpx.Client(base_url=url) as client:
+            started = time.perf_counter()
+            for operation, num1, num2 in items:
+                client.post("/calculate", json={"num1": num1, "num2": num2, "operation": operation})
+            report("HTTP keep-alive", args.number, time.perf_counter() - started)
+
+        with UnixSocketClient(path) as client:
+            started = time.perf_counter()
+            for operation, num1, num2 in items:
+                client.calculate(operation, num1, num2)
+            report("Unix socket", args.number, time.perf_counter() - started)
+
+            started = time.perf_counter()
+            client.calculate_many(items)
+            report("Unix socket pipelined", args.number, time.perf_counter() - started)
+    finally:
+        server.terminate()
+        server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,481 @@
+"""
+Client library for the calculator API
+CalculatorClient (threads) and AsyncCalculatorClient (asyncio) keep one
+keep-alive connection pool per client. Calls made while earlier requests
+are still in flight are queued and sent together through
+POST /calculate/batch, each caller waiting on its own future; a lone call
+goes straight to POST /calculate, so sequential scripts pay no batching
+delay. If the server rejects a whole batch (400/422, e.g. one malformed
+item), its calls are resent one by one so only the bad call fails.
+Transient failures (connection errors, 429, 502-504) are retried with
+full-jitter exponential backoff; batches carry no Idempotency-Key, so they
+are only retried when the server cannot have run them (connection refused,
+429, 503). Every call's latency is recorded in ClientMetrics.
+
+    from calculator_client import CalculatorClient
+    with CalculatorClient("http://localhost:8000") as client:
+        client.calculate(10, 4, "divide")   # 2.5
+
+Scripts written against requests can switch with only the import:
+"from calculator_client import post" routes post(f"{url}/calculate",
+json=...) through a shared client per base URL.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.05
+MAX_BACKOFF = 2.0
+RETRY_STATUSES = (429, 502, 503, 504)
+# Batches are not idempotent: retry only responses sent before running them
+BATCH_RETRY_STATUSES = (429, 503)
+BATCH_PATH = "/calculate/batch"
+
+
+class CalculatorError(Exception):
+    """Raised when a request fails after retries or the server rejects it"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CalculationError(CalculatorError):
+    """Raised when the server rejects one calculation (e.g. division by zero)"""
+    pass
+
+
+class ClientMetrics:
+    """Client-side counters and a bounded reservoir of call latencies"""
+
+    def __init__(self, reservoir: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=reservoir)
+        self.calls = 0
+        self.failures = 0
+        self.http_requests = 0
+        self.batched_calls = 0
+        self.retries = 0
+
+    def record_call(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += 0 if ok else 1
+            self._latencies.append(seconds)
+
+    def record_request(self, calls: int, retries: int) -> None:
+        with self._lock:
+            self.http_requests += 1
+            self.retries += retries
+            if calls > 1:
+                self.batched_calls += calls
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus latency percentiles in milliseconds over recent calls"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data = {
+                "calls": self.calls,
+                "failures": self.failures,
+                "http_requests": self.http_requests,
+                "batched_calls": self.batched_calls,
+                "retries": self.retries,
+            }
+        for name, quantile in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)):
+            data[name] = (
+                latencies[min(int(quantile * len(latencies)), len(latencies) - 1)] * 1000
+                if latencies else None
+            )
+        data["max_ms"] = latencies[-1] * 1000 if latencies else None
+        return data
+
+
+class _Call:
+    """One queued calculation"""
+    __slots__ = ("num1", "num2", "operation", "mode", "user_id", "future", "started")
+
+    def __init__(self, num1, num2, operation: str, mode: str, user_id: Optional[int], future):
+        self.num1 = num1
+        self.num2 = num2
+        self.operation = operation
+        self.mode = mode
+        self.user_id = user_id
+        self.future = future
+        self.started = time.perf_counter()
+
+
+class _ClientBase:
+    """Request planning, response parsing and retry policy shared by both clients"""
+
+    def __init__(self, max_batch: int, max_in_flight: int, batch_window: float,
+                 retries: int, backoff: float):
+        if max_batch < 1 or max_in_flight < 1:
+            raise ValueError("max_batch and max_in_flight must be at least 1")
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self.batch_window = batch_window
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = ClientMetrics()
+
+    @staticmethod
+    def _plan(calls: List[_Call]) -> List[Tuple[List[_Call], str, Dict, Dict]]:
+        """(calls, path, json, headers) per request; batches cannot mix modes"""
+        if len(calls) == 1:
+            call = calls[0]
+            payload = {"num1": call.num1, "num2": call.num2, "operation": call.operation,
+                       "mode": call.mode}
+            if call.user_id is not None:
+                payload["user_id"] = call.user_id
+            # Lets the server replay instead of recomputing if a retry repeats it
+            return [(calls, "/calculate", payload, {"Idempotency-Key": uuid.uuid4().hex})]
+        by_mode: Dict[str, List[_Call]] = {}
+        for call in calls:
+            by_mode.setdefault(call.mode, []).append(call)
+        plans = []
+        for mode, group in by_mode.items():
+            if len(group) == 1:
+                plans.extend(_ClientBase._plan(group))
+                continue
+            items = [
+                {"num1": c.num1, "num2": c.num2, "operation": c.operation, "user_id": c.user_id}
+                for c in group
+            ]
+            plans.append((group, BATCH_PATH, {"items": items, "mode": mode}, {}))
+        return plans
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response],
+               error: Optional[Exception] = None, batch: bool = False) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the failure is final"""
+        if attempt >= self.retries:
+            return None
+        if batch and response is None and not isinstance(
+                error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            # The batch may have run; without a key a retry could run it twice
+            return None
+        if response is not None:
+            if response.status_code not in (BATCH_RETRY_STATUSES if batch else RETRY_STATUSES):
+                return None
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return min(float(retry_after), MAX_BACKOFF * 4)
+                except ValueError:
+                    pass
+        # Full jitter keeps many clients from retrying in lockstep
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def _split(calls: List[_Call], path: str, response: Optional[httpx.Response]) -> bool:
+        """Whether a rejected batch should be resent one call at a time"""
+        return (path == BATCH_PATH and response is not None
+                and response.status_code in (400, 422) and len(calls) > 1)
+
+    @staticmethod
+    def _outcomes(calls: List[_Call], response: Optional[httpx.Response],
+                  error: Optional[Exception]) -> List[Tuple[Any, Optional[Exception]]]:
+        """(result, exception) per call from a final response or transport error"""
+        if error is not None:
+            failure = CalculatorError(f"Request failed: {error}")
+            return [(None, failure)] * len(calls)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code != 200:
+            detail = data.get("detail", response.text) if isinstance(data, dict) else response.text
+            error_type = CalculationError if response.status_code in (400, 422) else CalculatorError
+            failure = error_type(str(detail), response.status_code)
+            return [(None, failure)] * len(calls)
+        if "results" not in data:
+            return [(data["result"], None)]
+        return [
+            (None, CalculationError(item["error"], 400)) if item.get("error") is not None
+            else (item["result"], None)
+            for item in data["results"]
+        ]
+
+
+class CalculatorClient(_ClientBase):
+    """Thread-safe blocking client with automatic batching"""
+
+    def __init__(self, base_url: str = "http://localhost:8000", *, timeout: float = 10.0,
+                 max_batch: int = DEFAULT_MAX_BATCH, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 batch_window: float = 0.0, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF, http_client: Optional[httpx.Client] = None):
+        """
+        Args:
+            base_url: Calculator API URL
+            timeout: Per-request timeout in seconds
+            max_batch: Most calls per batch request
+            max_in_flight: Concurrent HTTP requests (sender threads)
+            batch_window: Seconds a sender waits for more calls before
+                sending; 0 sends whatever is queued immediately
+            retries: Retries for transient failures
+            backoff: Base of the exponential backoff in seconds
+            http_client: Existing httpx.Client to use instead of a new pool
+        """
+        super().__init__(max_batch, max_in_flight, batch_window, retries, backoff)
+        self._http = http_client or httpx.Client(
+            base_url=base_url, timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight,
+                                max_keepalive_connections=max_in_flight),
+        )
+        self._queue: "queue.Queue" = queue.Queue()
+        self._senders: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "CalculatorClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, num1, num2, operation: str, mode: str = "float",
+               user_id: Optional[int] = None) -> Future:
+        """Queue a calculation; the future resolves to its result"""
+        self._start()
+        future: Future = Future()
+        self._queue.put(_Call(num1, num2, operation, mode, user_id, future))
+        return future
+
+    def calculate(self, num1, num2, operation: str, mode: str = "float",
+                  user_id: Optional[int] = None):
+        """
+        Perform one calculation
+
+        Raises:
+            CalculationError: If the server rejected the calculation
+            CalculatorError: If the request failed after retries
+        """
+        return self.submit(num1, num2, operation, mode, user_id).result()
+
+    def close(self) -> None:
+        """Finish queued calls, stop the senders and close the connection pool"""
+        with self._lock:
+            senders, self._senders = self._senders, []
+        for _ in senders:
+            self._queue.put(None)
+        for sender in senders:
+            sender.join()
+        self._http.close()
+
+    def _start(self) -> None:
+        if self._senders:
+            return
+        with self._lock:
+            if not self._senders:
+                self._senders = [
+                    threading.Thread(target=self._send_loop, name=f"calculator-client-{i}",
+                                     daemon=True)
+                    for i in range(self.max_in_flight)
+                ]
+                for sender in self._senders:
+                    sender.start()
+
+    def _send_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            calls = [first]
+            deadline = time.monotonic() + self.batch_window
+            while len(calls) < self.max_batch:
+                try:
+                    if self.batch_window > 0:
+                        call = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    else:
+                        call = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if call is None:
+                    # Leave the stop signal for this thread's next loop
+                    self._queue.put(None)
+                    break
+                calls.append(call)
+            for group, path, payload, headers in self._plan(calls):
+                self._send(group, path, payload, headers)
+
+    def _send(self, calls: List[_Call], path: str, payload: Dict, headers: Dict) -> None:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = self._http.post(path, json=payload, headers=headers)
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and response.status_code == 200:
+                break
+            delay = self._delay(attempt, response, error, path == BATCH_PATH)
+            if delay is None:
+                break
+            attempt += 1
+            time.sleep(delay)
+        self.metrics.record_request(len(calls), attempt)
+        if self._split(calls, path, response):
+            for call in calls:
+                self._send(*self._plan([call])[0])
+            return
+        now = time.perf_counter()
+        for call, (result, failure) in zip(calls, self._outcomes(calls, response, error)):
+            self.metrics.record_call(now - call.started, failure is None)
+            if failure is None:
+                call.future.set_result(result)
+            else:
+                call.future.set_exception(failure)
+
+
+class AsyncCalculatorClient(_ClientBase):
+    """asyncio client with automatic batching"""
+
+    def __init__(self, base_url: str = "http://localhost:8000", *, timeout: float = 10.0,
+                 max_batch: int = DEFAULT_MAX_BATCH, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 batch_window: float = 0.0, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        """Arguments as for CalculatorClient; max_in_flight bounds concurrent requests"""
+        super().__init__(max_batch, max_in_flight, batch_window, retries, backoff)
+        self._http = http_client or httpx.AsyncClient(
+            base_url=base_url, timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight,
+                                max_keepalive_connections=max_in_flight),
+        )
+        self._pending: List[_Call] = []
+        self._flushers = set()
+
+    async def __aenter__(self) -> "AsyncCalculatorClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def calculate(self, num1, num2, operation: str, mode: str = "float",
+                        user_id: Optional[int] = None):
+        """
+        Perform one calculation
+
+        Raises:
+            CalculationError: If the server rejected the calculation
+            CalculatorError: If the request failed after retries
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Call(num1, num2, operation, mode, user_id, future))
+        if len(self._flushers) < self.max_in_flight:
+            flusher = asyncio.ensure_future(self._flush())
+            self._flushers.add(flusher)
+            flusher.add_done_callback(self._flushers.discard)
+        return await future
+
+    async def close(self) -> None:
+        """Wait for queued calls and close the connection pool"""
+        while self._flushers:
+            await asyncio.gather(*list(self._flushers), return_exceptions=True)
+        await self._http.aclose()
+
+    async def _flush(self) -> None:
+        # Yield once (or for the window) so calls made in the same tick join
+        await asyncio.sleep(self.batch_window)
+        while self._pending:
+            calls, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            for group, path, payload, headers in self._plan(calls):
+                await self._send(group, path, payload, headers)
+
+    async def _send(self, calls: List[_Call], path: str, payload: Dict, headers: Dict) -> None:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await self._http.post(path, json=payload, headers=headers)
+            except httpx.TransportError as e:
+                error = e
+            if response is not None and response.status_code == 200:
+                break
+            delay = self._delay(attempt, response, error, path == BATCH_PATH)
+            if delay is None:
+                break
+            attempt += 1
+            await asyncio.sleep(delay)
+        self.metrics.record_request(len(calls), attempt)
+        if self._split(calls, path, response):
+            for call in calls:
+                await self._send(*self._plan([call])[0])
+            return
+        now = time.perf_counter()
+        for call, (result, failure) in zip(calls, self._outcomes(calls, response, error)):
+            self.metrics.record_call(now - call.started, failure is None)
+            if call.future.done():
+                continue
+            if failure is None:
+                call.future.set_result(result)
+            else:
+                call.future.set_exception(failure)
+
+
+class CalculatorResponse:
+    """Minimal requests.Response look-alike returned by post()"""
+
+    def __init__(self, status_code: int, data: Any):
+        self.status_code = status_code
+        self._data = data
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        return self._data
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise CalculatorError(str(self._data.get("detail", self._data)), self.status_code)
+
+
+_shared_clients: Dict[str, CalculatorClient] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_client(base_url: Optional[str] = None) -> CalculatorClient:
+    """Process-wide client per base URL (default CALCULATOR_URL)"""
+    base_url = (base_url or os.getenv("CALCULATOR_URL", "http://localhost:8000")).rstrip("/")
+    with _shared_lock:
+        client = _shared_clients.get(base_url)
+        if client is None:
+            client = _shared_clients[base_url] = CalculatorClient(base_url)
+        return client
+
+
+def post(url: str, json: Optional[Dict] = None, **kwargs) -> CalculatorResponse:
+    """
+    Drop-in for requests.post(f"{base}/calculate", json={...})
+
+    The call goes through the shared client for the URL's base, so it reuses
+    pooled connections and is batched with calls from other threads. Only
+    the /calculate endpoint is supported; other keyword arguments of
+    requests.post are ignored.
+    """
+    parts = urlsplit(url)
+    if parts.path.rstrip("/") != "/calculate" or json is None:
+        raise ValueError("calculator_client.post only supports POST /calculate with a json body")
+    client = shared_client(f"{parts.scheme}://{parts.netloc}")
+    try:
+        result = client.calculate(json["num1"], json["num2"], json["operation"],
+                                  json.get("mode", "float"), json.get("user_id"))
+    except CalculatorError as e:
+        return CalculatorResponse(e.status_code or 503, {"detail": str(e)})
+    return CalculatorResponse(200, {
+        "result": result, "operation": str(json["operation"]).lower(),
+        "num1": json["num1"], "num2": json["num2"],
+    })
@@ -0,0 +1,148 @@
+"""
+Database access module
+Optional PostgreSQL connectivity configured through DATABASE_URL
+"""
+import os
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+
+from logger_config import get_logger
+
+# Initialize logger
+logger = get_logger(__name__)
+
+POSTGRES_SCHEMES = ("postgresql://", "postgres://")
+
+
+class DatabaseUnavailableError(Exception):
+    """Custom exception for a missing database configuration or driver"""
+    pass
+
+
+def get_database_url() -> Optional[str]:
+    """Return DATABASE_URL, or None if it is unset or empty"""
+    return os.getenv("DATABASE_URL") or None
+
+
+def is_postgres_url(url: Optional[str]) -> bool:
+    """Whether a database URL points at PostgreSQL"""
+    return bool(url) and url.startswith(POSTGRES_SCHEMES)
+
+
+@contextmanager
+def connect(url: Optional[str] = None) -> Iterator:
+    """
+    Open a PostgreSQL connection
+
+    The connection commits when the block exits normally and rolls back if
+    it raises.
+
+    Args:
+        url: Connection URL (defaults to DATABASE_URL)
+
+    Yields:
+        psycopg connection
+
+    Raises:
+        DatabaseUnavailableError: If no PostgreSQL URL is configured or
+            psycopg is not installed
+    """
+    url = url or get_database_url()
+    if not is_postgres_url(url):
+        raise DatabaseUnavailableError("DATABASE_URL is not set to a PostgreSQL URL")
+    try:
+        import psycopg
+    except ImportError:
+        raise DatabaseUnavailableError("psycopg is not installed")
+    try:
+        conn = psycopg.connect(url)
+    except psycopg.OperationalError as e:
+        logger.error("Database connection failed: %s", e)
+        raise DatabaseUnavailableError("Database connection failed")
+    with conn:
+        yield conn
+
+
+def uses_operation_codes(conn) -> bool:
+    """
+    Whether calculations stores SMALLINT operation codes
+
+    True for the partitioned layout (sql/06_partitioned_calculations.sql),
+    False for the layout from sql/01_create_tables.sql.
+
+    Raises:
+        DatabaseUnavailableError: If there is no calculations table
+    """
+    row = conn.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'calculations' AND column_name = 'operation' "
+        "AND table_schema = ANY(current_schemas(false))"
+    ).fetchone()
+    if row is None:
+        raise DatabaseUnavailableError("calculations table not found")
+    return row[0] == "smallint"
+
+
+def fetch_daily_stats(conn, user_id: Optional[int] = None, operation: Optional[str] = None,
+                      start: Optional[date] = None, end: Optional[date] = None,
+                      granularity: str = "day", limit: int = 1000) -> List[Dict]:
+    """
+    Read per-user, per-operation aggregates from calculation_daily_stats
+
+    Args:
+        conn: Database connection
+        user_id: Only this user
+        operation: Only this operation
+        start: First day included
+        end: Last day included
+        granularity: "day" for one row per day, "total" to sum over the range
+        limit: Maximum number of rows
+
+    Returns:
+        List of aggregate rows
+    """
+    conditions = []
+    params: Dict = {"limit": limit}
+    if user_id is not None:
+        conditions.append("user_id = %(user_id)s")
+        params["user_id"] = user_id
+    if operation is not None:
+        conditions.append("operation = %(operation)s")
+        params["operation"] = operation.lower()
+    if start is not None:
+        conditions.append("day >= %(start)s")
+        params["start"] = start
+    if end is not None:
+        conditions.append("day <= %(end)s")
+        params["end"] = end
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if granularity == "total":
+        query = f"""
+            SELECT user_id, operation, NULL::DATE AS day,
+                   sum(calculation_count) AS count, sum(result_sum) AS sum,
+                   min(result_min) AS min, max(result_max) AS max,
+                   max(last_activity) AS last_activity
+            FROM calculation_daily_stats {where}
+            GROUP BY user_id, operation
+            ORDER BY user_id, operation
+            LIMIT %(limit)s
+        """
+    else:
+        query = f"""
+            SELECT user_id, operation, day, calculation_count AS count,
+                   result_sum AS sum, result_min AS min, result_max AS max,
+                   last_activity
+            FROM calculation_daily_stats {where}
+            ORDER BY day DESC, user_id, operation
+            LIMIT %(limit)s
+        """
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        columns = [column.name for column in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    for row in rows:
+        row["count"] = int(row["count"])
+        row["avg"] = row["sum"] / row["count"] if row["count"] else None
+    return rows
@@ -0,0 +1,228 @@
+"""
+Memory diagnostics module
+Runtime control of tracemalloc for leak hunting in long-running workers
+"""
+import json
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from logger_config import get_logger
+
+# Initialize logger
+logger = get_logger(__name__)
+
+# Grouping keys accepted by tracemalloc.Snapshot.statistics()
+KEY_TYPES = ("lineno", "filename", "traceback")
+
+
+class DiagnosticsError(Exception):
+    """Custom exception for invalid diagnostics requests"""
+    pass
+
+
+class MemoryDiagnostics:
+    """
+    Start/stop tracemalloc at runtime and keep a bounded set of snapshots.
+
+    Nothing is traced until start() is called, so an idle instance adds no
+    cost to the request path.
+    """
+
+    def __init__(self, max_snapshots: int = 10, dump_dir: Path = Path("logs")):
+        self.max_snapshots = max_snapshots
+        self.dump_dir = dump_dir
+        self._snapshots: Dict[str, tracemalloc.Snapshot] = {}
+        self._taken_at: Dict[str, str] = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_tracing(self) -> bool:
+        """Whether tracemalloc is currently tracing allocations"""
+        return tracemalloc.is_tracing()
+
+    def start(self, nframes: int = 1) -> Dict:
+        """
+        Start tracing allocations
+
+        Args:
+            nframes: Number of frames stored per allocation traceback
+
+        Returns:
+            Current tracing status
+        """
+        if nframes < 1:
+            raise DiagnosticsError("nframes must be at least 1")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframes)
+            logger.warning("tracemalloc started with nframes=%d", nframes)
+        return self.status()
+
+    def stop(self) -> Dict:
+        """
+        Stop tracing and drop all stored snapshots
+
+        Returns:
+            Current tracing status
+        """
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.warning("tracemalloc stopped")
+        with self._lock:
+            self._snapshots.clear()
+            self._taken_at.clear()
+        return self.status()
+
+    def status(self) -> Dict:
+        """Return tracing state, traced memory and stored snapshot ids"""
+        current, peak = tracemalloc.get_traced_memory() if self.is_tracing else (0, 0)
+        with self._lock:
+            snapshots = [
+                {"id": snapshot_id, "taken_at": self._taken_at[snapshot_id]}
+                for snapshot_id in self._snapshots
+            ]
+        return {
+            "tracing": self.is_tracing,
+            "traceback_limit": tracemalloc.get_traceback_limit() if self.is_tracing else 0,
+            "traced_current_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": snapshots,
+        }
+
+    def take_snapshot(self) -> str:
+        """
+        Take a snapshot of current allocations
+
+        Returns:
+            Identifier of the stored snapshot
+
+        Raises:
+            DiagnosticsError: If tracing is not running
+        """
+        if not self.is_tracing:
+            raise DiagnosticsError("tracemalloc is not running; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        with self._lock:
+            self._counter += 1
+            snapshot_id = f"s{self._counter}"
+            self._snapshots[snapshot_id] = snapshot
+            self._taken_at[snapshot_id] = datetime.now().isoformat(timespec="seconds")
+            # Evict the oldest snapshots beyond the limit
+            while len(self._snapshots) > self.max_snapshots:
+                oldest = next(iter(self._snapshots))
+                del self._snapshots[oldest]
+                del self._taken_at[oldest]
+        logger.info("tracemalloc snapshot taken: %s", snapshot_id)
+        return snapshot_id
+
+    def _get(self, snapshot_id: str) -> tracemalloc.Snapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is None:
+            raise DiagnosticsError(f"Unknown snapshot: {snapshot_id}")
+        return snapshot
+
+    @staticmethod
+    def _check_key_type(key_type: str) -> None:
+        if key_type not in KEY_TYPES:
+            raise DiagnosticsError(
+                f"Invalid key_type: {key_type}. "
+                f"Supported key types: {', '.join(KEY_TYPES)}"
+            )
+
+    def top(self, snapshot_id: str, limit: int = 20, key_type: str = "lineno") -> Dict:
+        """
+        Top allocation sites of a snapshot
+
+        Args:
+            snapshot_id: Snapshot identifier
+            limit: Number of allocation sites to return
+            key_type: Grouping key (lineno, filename, traceback)
+
+        Returns:
+            JSON-serializable report
+        """
+        self._check_key_type(key_type)
+        stats = self._get(snapshot_id).statistics(key_type)
+        return {
+            "snapshot": snapshot_id,
+            "key_type": key_type,
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [_stat_to_dict(stat) for stat in stats[:limit]],
+        }
+
+    def diff(self, base_id: str, target_id: str, limit: int = 20,
+             key_type: str = "lineno") -> Dict:
+        """
+        Allocation growth between two snapshots
+
+        Args:
+            base_id: Identifier of the older snapshot
+            target_id: Identifier of the newer snapshot
+            limit: Number of allocation sites to return
+            key_type: Grouping key (lineno, filename, traceback)
+
+        Returns:
+            JSON-serializable report sorted by absolute size difference
+        """
+        self._check_key_type(key_type)
+        stats = self._get(target_id).compare_to(self._get(base_id), key_type)
+        return {
+            "base": base_id,
+            "target": target_id,
+            "key_type": key_type,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [_stat_diff_to_dict(stat) for stat in stats[:limit]],
+        }
+
+    def dump(self, report: Dict, name: str) -> Path:
+        """
+        Write a report as JSON into the dump directory
+
+        Args:
+            report: Report returned by top() or diff()
+            name: Short report name used in the file name
+
+        Returns:
+            Path of the written file
+        """
+        self.dump_dir.mkdir(exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = self.dump_dir / f"tracemalloc-{name}-{stamp}.json"
+        path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        logger.info("tracemalloc report written to %s", path)
+        return path
+
+
+def _frames(traceback: tracemalloc.Traceback) -> List[Dict]:
+    return [{"filename": frame.filename, "lineno": frame.lineno} for frame in traceback]
+
+
+def _stat_to_dict(stat: tracemalloc.Statistic) -> Dict:
+    return {
+        "size_bytes": stat.size,
+        "count": stat.count,
+        "traceback": _frames(stat.traceback),
+    }
+
+
+def _stat_diff_to_dict(stat: tracemalloc.StatisticDiff) -> Dict:
+    return {
+        "size_bytes": stat.size,
+        "size_diff_bytes": stat.size_diff,
+        "count": stat.count,
+        "count_diff": stat.count_diff,
+        "traceback": _frames(stat.traceback),
+    }
+
+
+# Shared instance used by the admin endpoints
+memory_diagnostics = MemoryDiagnostics()
@@ -0,0 +1,257 @@
+"""
+Streaming export of calculation history
+Reads calculations through a server-side cursor in fixed-size batches, so
+memory stays bounded by the batch size whatever the size of the table, and
+writes them as CSV or Parquet. The API streams the same CSV at
+GET /calculations/export.
+
+Usage:
+    python export_calculations.py --output history.csv
+    python export_calculations.py --format parquet --output history.parquet \\
+        --user-id 1 --start 2025-01-01 --end 2025-02-01
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import connect, uses_operation_codes, DatabaseUnavailableError
+
+COLUMNS = ("id", "operation", "operand_a", "operand_b", "result", "timestamp", "user_id")
+DEFAULT_BATCH_SIZE = 10000
+
+
+class ExportError(Exception):
+    """Custom exception for exports that cannot be written"""
+    pass
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to the naive UTC timestamps stored in the table"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_export_query(operation_codes: bool, user_id: Optional[int] = None,
+                       start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Tuple[str, Dict]:
+    """
+    Build the export SELECT for either calculations layout
+
+    Args:
+        operation_codes: Whether operation is stored as a SMALLINT code
+        user_id: Only this user
+        start: First timestamp included
+        end: First timestamp excluded
+
+    Returns:
+        (query, params)
+    """
+    conditions = []
+    params: Dict = {}
+    if user_id is not None:
+        conditions.append("c.user_id = %(user_id)s")
+        params["user_id"] = user_id
+    if start is not None:
+        conditions.append("c.timestamp >= %(start)s")
+        params["start"] = to_naive_utc(start)
+    if end is not None:
+        conditions.append("c.timestamp < %(end)s")
+        params["end"] = to_naive_utc(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if operation_codes:
+        operation = "o.name"
+        source = "calculations c JOIN operation_codes o ON o.code = c.operation"
+    else:
+        operation = "lower(c.operation)"
+        source = "calculations c"
+    query = f"""
+        SELECT c.id, {operation}, c.operand_a, c.operand_b, c.result,
+               c.timestamp, c.user_id
+        FROM {source} {where}
+        ORDER BY c.id
+    """
+    return query, params
+
+
+def iter_calculation_batches(conn, user_id: Optional[int] = None,
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """
+    Read calculations in batches through a server-side cursor
+
+    The table layout is detected immediately, so a missing table fails here
+    rather than on the first batch; rows are only fetched while iterating.
+
+    Args:
+        conn: Database connection (not in autocommit mode)
+        user_id: Only this user
+        start: First timestamp included
+        end: First timestamp excluded
+        batch_size: Rows fetched per round trip
+
+    Returns:
+        Iterator of row lists in COLUMNS order
+
+    Raises:
+        DatabaseUnavailableError: If there is no calculations table
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    query, params = build_export_query(uses_operation_codes(conn), user_id, start, end)
+
+    def batches() -> Iterator[List[tuple]]:
+        with conn.cursor(name="calculations_export") as cur:
+            cur.itersize = batch_size
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    return batches()
+
+
+def iter_csv(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encode batches as CSV, one chunk per batch
+
+    Args:
+        batches: Row lists in COLUMNS order
+
+    Yields:
+        UTF-8 CSV chunks, starting with the header
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (row[:5] + (row[5].isoformat() if row[5] is not None else "", row[6]))
+            for row in rows
+        )
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_csv(batches: Iterable[List[tuple]], handle: BinaryIO) -> int:
+    """
+    Write batches as CSV to a binary file object
+
+    Returns:
+        Number of rows written
+    """
+    rows_written = 0
+
+    def counted() -> Iterator[List[tuple]]:
+        nonlocal rows_written
+        for rows in batches:
+            rows_written += len(rows)
+            yield rows
+
+    for chunk in iter_csv(counted()):
+        handle.write(chunk)
+    return rows_written
+
+
+def write_parquet(batches: Iterable[List[tuple]], path: Path) -> int:
+    """
+    Write batches to a Parquet file, one row group per batch
+
+    Args:
+        batches: Row lists in COLUMNS order
+        path: Output file
+
+    Returns:
+        Number of rows written
+
+    Raises:
+        ExportError: If pyarrow is not installed
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("pyarrow is required for Parquet export (pip install pyarrow)")
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("operation", pa.string()),
+        ("operand_a", pa.float64()),
+        ("operand_b", pa.float64()),
+        ("result", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+        ("user_id", pa.int32()),
+    ])
+    rows_written = 0
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            rows_written += len(rows)
+    return rows_written
+
+
+def parse_timestamp(value: str) -> datetime:
+    """argparse type for ISO dates and timestamps"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid ISO timestamp: {value!r}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export calculation history")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Output file (CSV defaults to stdout)")
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--start", type=parse_timestamp, default=None,
+                        help="First timestamp included (ISO format)")
+    parser.add_argument("--end", type=parse_timestamp, default=None,
+                        help="First timestamp excluded (ISO format)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows fetched per round trip")
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and args.output is None:
+        parser.error("--output is required for Parquet")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    try:
+        with connect(args.database_url) as conn:
+            batches = iter_calculation_batches(
+                conn, args.user_id, args.start, args.end, args.batch_size
+            )
+            if args.format == "parquet":
+                rows = write_parquet(batches, args.output)
+            elif args.output is None:
+                rows = write_csv(batches, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            else:
+                with open(args.output, "wb") as handle:
+                    rows = write_csv(batches, handle)
+    except (DatabaseUnavailableError, ExportError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps({"rows_exported": rows}), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Batch expression evaluator
+Arithmetic expressions such as "(12.5 + 3) / 4" are parsed into trees and
+merged into one DAG for the whole batch. Identical subexpressions become a
+single node (operands of commutative operations are put in a canonical
+order first, so "a + b" and "b + a" are shared too). Nodes are then grouped
+by depth and operation, and each group is evaluated with one call to the
+operation's vectorized kernel, so every unique node is computed exactly
+once however many expressions contain it.
+"""
+import ast
+import math
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from logger_config import get_logger
+from operations import calculate_arrays, registry, InvalidOperationError
+
+# Initialize logger
+logger = get_logger(__name__)
+
+MAX_EXPRESSION_LENGTH = 1000
+MAX_EXPRESSIONS = 10000
+
+_BINARY_OPERATORS = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Div: "divide",
+}
+
+# Parsed form: ("const", value) or (operation, left, right)
+Tree = Tuple
+
+
+class ExpressionError(Exception):
+    """Raised when an expression cannot be parsed or its result is out of range"""
+    pass
+
+
+def parse(expression: str) -> Tree:
+    """
+    Parse an arithmetic expression
+
+    Numbers, parentheses, unary minus, + - * / and calls of registered
+    operations with two arguments (e.g. "divide(1, 3)") are accepted.
+
+    Raises:
+        ExpressionError: If the expression is too long or uses anything else
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        body = ast.parse(expression.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}")
+    return _convert(body)
+
+
+def _convert(node: ast.AST) -> Tree:
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        try:
+            return ("const", float(node.value))
+        except OverflowError:
+            raise ExpressionError(f"Number {node.value} is out of float range")
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _convert(node.operand)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        if operand[0] == "const":
+            return ("const", -operand[1])
+        return ("multiply", ("const", -1.0), operand)
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return (_BINARY_OPERATORS[type(node.op)], _convert(node.left), _convert(node.right))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and len(node.args) == 2 and not node.keywords):
+        name = node.func.id.lower()
+        if name not in registry or registry.get(name).vectorized is None:
+            raise ExpressionError(f"Unknown function {node.func.id}")
+        return (name, _convert(node.args[0]), _convert(node.args[1]))
+    raise ExpressionError(f"Unsupported syntax: {ast.unparse(node)[:60]}")
+
+
+@dataclass
+class EvaluationReport:
+    """How much work deduplication saved for one batch"""
+    expressions: int
+    # Operation nodes across all expression trees, as if evaluated one by one
+    operations_submitted: int
+    # Unique operation nodes in the merged DAG, each evaluated once
+    operations_evaluated: int
+    operations_saved: int
+    savings_ratio: float
+    # Vectorized kernel calls (one per depth and operation)
+    kernel_calls: int
+    depth: int
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class ExpressionDAG:
+    """Hash-consed DAG of operation and constant nodes"""
+
+    def __init__(self):
+        self._ids: Dict[Tuple, int] = {}
+        # Hash-consing key of each node, to undo a failed add
+        self._keys: List[Tuple] = []
+        self.operations: List[str] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        self.constants: List[float] = []
+        self.depth: List[int] = []
+        self.submitted = 0
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def add(self, tree: Tree) -> int:
+        """
+        Add a parsed expression; returns the ID of its root node
+
+        If adding fails part way (e.g. RecursionError on a very deep tree),
+        the nodes it created are removed again, so they are neither
+        evaluated nor counted.
+        """
+        size, submitted = len(self.operations), self.submitted
+        try:
+            return self._add(tree)
+        except Exception:
+            for key in self._keys[size:]:
+                del self._ids[key]
+            for nodes in (self._keys, self.operations, self.left, self.right,
+                          self.constants, self.depth):
+                del nodes[size:]
+            self.submitted = submitted
+            raise
+
+    def _add(self, tree: Tree) -> int:
+        if tree[0] == "const":
+            # float.hex keeps 0.0 and -0.0 apart
+            return self._node(("const", tree[1].hex()), "const", -1, -1, tree[1], 0)
+        self.submitted += 1
+        name, left, right = tree[0], self._add(tree[1]), self._add(tree[2])
+        if registry.get(name).commutative and left > right:
+            left, right = right, left
+        depth = max(self.depth[left], self.depth[right]) + 1
+        return self._node((name, left, right), name, left, right, np.nan, depth)
+
+    def _node(self, key: Tuple, operation: str, left: int, right: int, constant: float,
+              depth: int) -> int:
+        node = self._ids.get(key)
+        if node is None:
+            node = len(self.operations)
+            self._ids[key] = node
+            self._keys.append(key)
+            self.operations.append(operation)
+            self.left.append(left)
+            self.right.append(right)
+            self.constants.append(constant)
+            self.depth.append(depth)
+        return node
+
+    def evaluate(self) -> Tuple[np.ndarray, List[str], int]:
+        """
+        Evaluate every node once, one kernel call per (depth, operation)
+
+        Returns:
+            (values, errors, kernel_calls) where errors[i] is the message
+            for node i, or "" if it succeeded; failed nodes are NaN and
+            their failure propagates to every node that uses them
+        """
+        values = np.asarray(self.constants, dtype=np.float64)
+        # Error codes index messages; 0 means no error
+        messages = [""]
+        codes = np.zeros(len(self), dtype=np.int32)
+        left = np.asarray(self.left, dtype=np.int64)
+        right = np.asarray(self.right, dtype=np.int64)
+        groups: Dict[Tuple[int, str], List[int]] = {}
+        for node, (operation, depth) in enumerate(zip(self.operations, self.depth)):
+            if depth:
+                groups.setdefault((depth, operation), []).append(node)
+
+        for depth, operation in sorted(groups):
+            nodes = np.asarray(groups[(depth, operation)], dtype=np.int64)
+            op = registry.get(operation)
+            num1, num2 = values[left[nodes]], values[right[nodes]]
+            results, invalid = calculate_arrays(num1, num2, op)
+            node_codes = np.where(codes[left[nodes]] != 0, codes[left[nodes]], codes[right[nodes]])
+            pending = invalid & (node_codes == 0)
+            for rule in op.validators:
+                hits = pending & np.asarray(rule.invalid(num1, num2), dtype=bool)
+                if hits.any():
+                    if rule.message not in messages:
+                        messages.append(rule.message)
+                    node_codes[hits] = messages.index(rule.message)
+                    pending &= ~hits
+            results[node_codes != 0] = np.nan
+            values[nodes] = results
+            codes[nodes] = node_codes
+        return values, [messages[code] for code in codes.tolist()], len(groups)
+
+
+def evaluate_expressions(expressions: List[str]) -> Tuple[List[Union[float, Exception]],
+                                                          EvaluationReport]:
+    """
+    Evaluate a batch of expressions through one shared DAG
+
+    Args:
+        expressions: Arithmetic expressions (see parse)
+
+    Returns:
+        (outcomes, report) where outcomes[i] is the float result of
+        expressions[i] or the exception explaining why it has none; results
+        that overflow to infinity or NaN count as errors
+    """
+    dag = ExpressionDAG()
+    roots: List[Union[int, Exception]] = []
+    for expression in expressions:
+        try:
+            roots.append(dag.add(parse(expression)))
+        except ExpressionError as e:
+            roots.append(e)
+        except RecursionError:
+            roots.append(ExpressionError("Expression is nested too deeply"))
+
+    values, errors, kernel_calls = dag.evaluate()
+    outcomes: List[Union[float, Exception]] = []
+    for root in roots:
+        if isinstance(root, Exception):
+            outcomes.append(root)
+        elif errors[root]:
+            outcomes.append(_error_for(errors[root]))
+        else:
+            value = float(values[root])
+            outcomes.append(value if math.isfinite(value) else ExpressionError("Result out of range"))
+
+    evaluated = sum(1 for depth in dag.depth if depth)
+    report = EvaluationReport(
+        expressions=len(expressions),
+        operations_submitted=dag.submitted,
+        operations_evaluated=evaluated,
+        operations_saved=dag.submitted - evaluated,
+        savings_ratio=(dag.submitted - evaluated) / dag.submitted if dag.submitted else 0.0,
+        kernel_calls=kernel_calls,
+        depth=max(dag.depth, default=0),
+    )
+    logger.info(
+        "Evaluated %d expressions: %d of %d operations after deduplication in %d kernel calls",
+        report.expressions, evaluated, dag.submitted, kernel_calls,
+        extra={"sample_key": "calculate"}
+    )
+    return outcomes, report
+
+
+def _error_for(message: str) -> Exception:
+    """Exception type matching a validation rule message"""
+    for op in registry:
+        for rule in op.validators:
+            if rule.message == message:
+                return rule.error(message)
+    return InvalidOperationError(message)
+
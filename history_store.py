@@ -0,0 +1,353 @@
+"""
+Calculation history store
+Records successful calculations off the request path. The backend follows
+DATABASE_URL:
+    unset                  -> NullHistoryStore (nothing recorded)
+    sqlite:///history.db   -> SQLiteHistoryStore (embedded, single node)
+    postgresql://...       -> PostgresHistoryStore
+"""
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from database import get_database_url, is_postgres_url, uses_operation_codes
+from logger_config import get_logger
+from tracing import tracer
+
+# Initialize logger
+logger = get_logger(__name__)
+
+SQLITE_PREFIX = "sqlite:///"
+
+# (operation, operand_a, operand_b, result, timestamp, user_id)
+HistoryRow = Tuple[str, float, float, float, datetime, Optional[int]]
+
+# Mirrors sql/01_create_tables.sql. calculations.user_id is nullable here
+# so anonymous API calculations are recorded too. Nothing in the app fills
+# users, so the embedded store leaves foreign keys unenforced and any
+# user_id is kept as given.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS calculations (
+    id INTEGER PRIMARY KEY,
+    operation VARCHAR(20) NOT NULL,
+    operand_a FLOAT NOT NULL,
+    operand_b FLOAT NOT NULL,
+    result FLOAT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS calculations_user_id_idx ON calculations (user_id);
+"""
+
+SQLITE_INSERT = (
+    "INSERT INTO calculations (operation, operand_a, operand_b, result, timestamp, user_id) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+class HistoryStoreError(Exception):
+    """Custom exception for an unusable history store configuration"""
+    pass
+
+
+class HistoryStore(ABC):
+    """Interface for recording calculations"""
+
+    backend = "none"
+
+    @abstractmethod
+    def record(self, operation: str, operand_a: float, operand_b: float, result: float,
+               user_id: Optional[int] = None) -> bool:
+        """
+        Queue a calculation for writing
+
+        Returns:
+            False if the calculation was not accepted
+        """
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything recorded so far is written"""
+        return True
+
+    def close(self) -> None:
+        """Write pending calculations and release resources"""
+
+    def stats(self) -> Dict:
+        """Counters for monitoring"""
+        return {"backend": self.backend}
+
+
+class NullHistoryStore(HistoryStore):
+    """History store used when no database is configured"""
+
+    def record(self, operation: str, operand_a: float, operand_b: float, result: float,
+               user_id: Optional[int] = None) -> bool:
+        return False
+
+
+class BatchingHistoryStore(HistoryStore):
+    """
+    Base class for stores written by a dedicated writer thread
+
+    record() only puts a tuple on a bounded queue. The writer thread takes
+    whatever has accumulated (up to batch_size rows) and writes it in one
+    transaction. When the queue is full, new calculations are dropped and
+    counted rather than blocking requests.
+    """
+
+    def __init__(self, batch_size: int = 1000, max_queue: int = 100000):
+        if batch_size < 1:
+            raise HistoryStoreError("batch_size must be at least 1")
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._closed = False
+        self._conn = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.backend}-history-writer", daemon=True
+        )
+        self._thread.start()
+
+    @abstractmethod
+    def _open(self):
+        """Open the connection used by the writer thread"""
+
+    @abstractmethod
+    def _write(self, conn, rows: List[HistoryRow]) -> None:
+        """Write rows in one transaction"""
+
+    def _close_connection(self, conn) -> None:
+        conn.close()
+
+    def record(self, operation: str, operand_a: float, operand_b: float, result: float,
+               user_id: Optional[int] = None) -> bool:
+        if self._closed:
+            return False
+        timestamp = datetime.now(timezone.utc).replace(tzinfo=None)
+        try:
+            self._queue.put_nowait((operation, operand_a, operand_b, result, timestamp, user_id))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if not self._thread.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def _connect(self) -> bool:
+        if self._conn is None:
+            try:
+                self._conn = self._open()
+            except Exception as e:
+                logger.error("History store unavailable: %s", e)
+                return False
+        return True
+
+    def _run(self) -> None:
+        # Connect up front so the schema exists before the first write
+        self._connect()
+        stopping = False
+        while not stopping:
+            rows: List[HistoryRow] = []
+            waiters: List[threading.Event] = []
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    rows.append(item)
+                if stopping or len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if rows:
+                # Writes run off the request path, so each batch is its own trace
+                with tracer.trace("history.write", backend=self.backend, rows=len(rows)):
+                    self._write_batch(rows)
+            for waiter in waiters:
+                waiter.set()
+        if self._conn is not None:
+            self._close_connection(self._conn)
+
+    def _write_batch(self, rows: List[HistoryRow]) -> None:
+        if not self._connect():
+            self.failed += len(rows)
+            return
+        try:
+            self._write(self._conn, rows)
+            self.written += len(rows)
+            return
+        except Exception as e:
+            logger.warning("History batch of %d rows failed, retrying row by row: %s", len(rows), e)
+        if getattr(self._conn, "closed", False):
+            # Lost the server; reconnect on the next batch
+            self._conn = None
+            self.failed += len(rows)
+            return
+        # One bad row (e.g. an unknown user_id) must not lose the whole batch
+        for row in rows:
+            try:
+                self._write(self._conn, [row])
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("History row dropped: %s", e)
+
+
+class SQLiteHistoryStore(BatchingHistoryStore):
+    """
+    Embedded SQLite history for deployments without PostgreSQL
+
+    The database runs in WAL mode so readers (e.g. sqlite3 on the command
+    line) do not block the writer, with synchronous=NORMAL: a power loss may
+    lose the last transactions but never corrupts the file.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = 1000, max_queue: int = 100000):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(batch_size, max_queue)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=16)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.executescript(SQLITE_SCHEMA)
+        return conn
+
+    def _write(self, conn, rows: List[HistoryRow]) -> None:
+        # executemany prepares SQLITE_INSERT once and binds each row
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                SQLITE_INSERT,
+                [(op, a, b, result, ts.isoformat(sep=" "), user_id)
+                 for op, a, b, result, ts, user_id in rows],
+            )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+class PostgresHistoryStore(BatchingHistoryStore):
+    """
+    History written to the calculations table in PostgreSQL
+
+    calculations.user_id is NOT NULL there, so only calculations made on
+    behalf of a user are recorded.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, url: str, batch_size: int = 1000, max_queue: int = 100000):
+        self.url = url
+        self.operation_codes: Optional[Dict[str, int]] = None
+        super().__init__(batch_size, max_queue)
+
+    def record(self, operation: str, operand_a: float, operand_b: float, result: float,
+               user_id: Optional[int] = None) -> bool:
+        if user_id is None:
+            return False
+        return super().record(operation, operand_a, operand_b, result, user_id)
+
+    def _open(self):
+        import psycopg
+        conn = psycopg.connect(self.url)
+        if uses_operation_codes(conn):
+            self.operation_codes = dict(conn.execute("SELECT name, code FROM operation_codes").fetchall())
+        conn.commit()
+        return conn
+
+    def _write(self, conn, rows: List[HistoryRow]) -> None:
+        if self.operation_codes is not None:
+            rows = [(self.operation_codes[row[0]],) + row[1:] for row in rows]
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO calculations (operation, operand_a, operand_b, result, timestamp, user_id) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    rows,
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def create_history_store(url: Optional[str] = None) -> HistoryStore:
+    """
+    Create the history store selected by a database URL
+
+    Args:
+        url: Database URL (defaults to DATABASE_URL)
+
+    Returns:
+        History store; a NullHistoryStore if no URL is configured
+
+    Raises:
+        HistoryStoreError: If the URL scheme is not supported
+    """
+    url = url or get_database_url()
+    if not url:
+        return NullHistoryStore()
+    if url.startswith(SQLITE_PREFIX):
+        path = url[len(SQLITE_PREFIX):]
+        if not path:
+            raise HistoryStoreError("sqlite URL needs a path, e.g. sqlite:///history.db")
+        logger.info("Recording calculation history in SQLite database %s", path)
+        return SQLiteHistoryStore(path)
+    if is_postgres_url(url):
+        try:
+            import psycopg  # noqa: F401
+        except ImportError:
+            raise HistoryStoreError("psycopg is not installed")
+        logger.info("Recording calculation history in PostgreSQL")
+        return PostgresHistoryStore(url)
+    raise HistoryStoreError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
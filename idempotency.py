@@ -0,0 +1,417 @@
+"""
+Idempotency keys for POST /calculate
+A client that retries with the same Idempotency-Key header gets the stored
+first response instead of a second computation (and a second history row).
+The store follows IDEMPOTENCY_STORE:
+    unset or memory        -> MemoryIdempotencyStore (per process)
+    sqlite:///keys.db      -> SQLiteIdempotencyStore (shared by workers on one host)
+
+A key is claimed before the first request computes, so a concurrent
+duplicate waits for that result: on an in-process future when both reach
+the same worker, by polling the store when they reach different workers.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from logger_config import get_logger
+from metrics import metrics
+from tracing import span
+
+# Initialize logger
+logger = get_logger(__name__)
+
+SQLITE_PREFIX = "sqlite:///"
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_WAIT_TIMEOUT = 30.0
+MAX_KEY_LENGTH = 255
+PRUNE_EVERY = 1000
+
+idempotency_requests = metrics.counter(
+    "calculator_idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by whether they were computed or replayed",
+    ("outcome",)
+)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status_code INTEGER,
+    body BLOB,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at);
+"""
+
+
+class IdempotencyError(Exception):
+    """Raised for a malformed key or an unsupported store URL"""
+    pass
+
+
+class IdempotencyKeyMismatchError(IdempotencyError):
+    """Raised when a key is reused with a different request"""
+    pass
+
+
+class IdempotencyInProgressError(IdempotencyError):
+    """Raised when the first request for a key did not finish in time"""
+    pass
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """A response kept for replay; status_code is None while the key is claimed"""
+    fingerprint: str
+    status_code: Optional[int]
+    body: bytes
+    created_at: float
+
+    @property
+    def pending(self) -> bool:
+        return self.status_code is None
+
+
+def validate_key(key: str) -> str:
+    """
+    Raises:
+        IdempotencyError: If the key is empty, too long or not printable ASCII
+    """
+    if not 1 <= len(key) <= MAX_KEY_LENGTH or not all(" " < c <= "~" for c in key):
+        raise IdempotencyError(
+            f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} printable ASCII characters"
+        )
+    return key
+
+
+def fingerprint(payload: Dict) -> str:
+    """Stable digest of a request body, to detect a key reused for another request"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """Bounded store of claimed keys and their responses, evicted after ttl"""
+
+    # Whether calls may block on I/O and should run off the event loop
+    blocking = False
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 claim_timeout: float = DEFAULT_WAIT_TIMEOUT):
+        if ttl <= 0 or max_entries < 1:
+            raise ValueError("ttl and max_entries must be positive")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.claim_timeout = claim_timeout
+
+    def _live(self, record: Optional[StoredResponse], now: float) -> bool:
+        if record is None:
+            return False
+        lifetime = self.claim_timeout if record.pending else self.ttl
+        return record.created_at + lifetime > now
+
+    @abstractmethod
+    def claim(self, key: str, fingerprint: str) -> Tuple[bool, Optional[StoredResponse]]:
+        """
+        Claim a key for computing its response
+
+        Returns:
+            (True, None) if the caller now owns the key, otherwise (False,
+            record) with the stored response or another caller's pending claim
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[StoredResponse]:
+        """Live record for a key, if any"""
+
+    @abstractmethod
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        """Store the response for a claimed key"""
+
+    @abstractmethod
+    def release(self, key: str) -> None:
+        """Drop a claim whose request failed, so a retry computes again"""
+
+    def close(self) -> None:
+        """Release resources"""
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Per-process store; insertion order doubles as expiry order"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 claim_timeout: float = DEFAULT_WAIT_TIMEOUT):
+        super().__init__(ttl, max_entries, claim_timeout)
+        self._entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, record = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and self._live(record, now):
+                break
+            del self._entries[key]
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[bool, Optional[StoredResponse]]:
+        now = time.time()
+        with self._lock:
+            record = self._entries.get(key)
+            if self._live(record, now):
+                return False, record
+            self._entries.pop(key, None)
+            self._entries[key] = StoredResponse(fingerprint, None, b"", now)
+            self._evict(now)
+            return True, None
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            record = self._entries.get(key)
+            return record if self._live(record, time.time()) else None
+
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        now = time.time()
+        with self._lock:
+            record = self._entries.pop(key, None)
+            if record is None:
+                return
+            self._entries[key] = StoredResponse(record.fingerprint, status_code, body, now)
+            self._evict(now)
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            record = self._entries.get(key)
+            if record is not None and record.pending:
+                del self._entries[key]
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Store in an SQLite file, shared by every worker process on the host"""
+
+    blocking = True
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 claim_timeout: float = DEFAULT_WAIT_TIMEOUT):
+        super().__init__(ttl, max_entries, claim_timeout)
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._lock = threading.Lock()
+        self._claims = 0
+
+    def _row(self, key: str) -> Optional[StoredResponse]:
+        row = self._conn.execute(
+            "SELECT fingerprint, status_code, body, created_at FROM idempotency_keys WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return StoredResponse(row[0], row[1], bytes(row[2] or b""), row[3])
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[bool, Optional[StoredResponse]]:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot
+            # both see the key as free
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                record = self._row(key)
+                if self._live(record, now):
+                    self._conn.execute("COMMIT")
+                    return False, record
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, status_code, body, "
+                    "created_at) VALUES (?, ?, NULL, NULL, ?)",
+                    (key, fingerprint, now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._claims += 1
+            if self._claims % PRUNE_EVERY == 0:
+                self._prune(now)
+            return True, None
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute(
+            "DELETE FROM idempotency_keys WHERE created_at < ? "
+            "OR (status_code IS NULL AND created_at < ?)",
+            (now - self.ttl, now - self.claim_timeout)
+        )
+        self._conn.execute(
+            "DELETE FROM idempotency_keys WHERE key IN (SELECT key FROM idempotency_keys "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            record = self._row(key)
+        return record if self._live(record, time.time()) else None
+
+    def complete(self, key: str, status_code: int, body: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency_keys SET status_code = ?, body = ?, created_at = ? WHERE key = ?",
+                (status_code, body, time.time(), key)
+            )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL", (key,)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class IdempotencyManager:
+    """Run a request at most once per key and replay its response"""
+
+    def __init__(self, store: IdempotencyStore, wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+                 poll_interval: float = 0.01):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        # Keys being handled by this process, so local duplicates skip the store
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _call(self, method, *args):
+        if self.store.blocking:
+            with span(f"idempotency.{method.__name__}", store=type(self.store).__name__):
+                return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def run(self, key: str, request_fingerprint: str,
+                  compute: Callable[[], Awaitable[Tuple[int, bytes]]]) -> Tuple[int, bytes, bool]:
+        """
+        Compute the response for a key once, or replay it
+
+        Args:
+            key: Validated Idempotency-Key
+            request_fingerprint: Digest of the request body
+            compute: Produces (status_code, body); exceptions are not stored,
+                so a retry after a server error computes again
+
+        Returns:
+            (status_code, body, replayed)
+
+        Raises:
+            IdempotencyKeyMismatchError: If the key was used for another request
+            IdempotencyInProgressError: If waiting for the first request timed out
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            local = self._inflight.get(key)
+            if local is not None:
+                record = await self._wait(local, deadline)
+                if record is None:
+                    # The first request failed; try again ourselves
+                    continue
+                idempotency_requests.inc(outcome="waited")
+                return self._replay(key, record, request_fingerprint)
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            record = None
+            try:
+                claimed, record = await self._call(self.store.claim, key, request_fingerprint)
+                if claimed:
+                    status_code, body = await compute()
+                    await self._call(self.store.complete, key, status_code, body)
+                    record = StoredResponse(request_fingerprint, status_code, body, time.time())
+                    idempotency_requests.inc(outcome="computed")
+                    return status_code, body, False
+                if record.pending:
+                    record = await self._poll(key, deadline)
+                    idempotency_requests.inc(outcome="waited")
+                else:
+                    idempotency_requests.inc(outcome="replayed")
+                return self._replay(key, record, request_fingerprint)
+            except BaseException:
+                if record is None:
+                    await self._call(self.store.release, key)
+                raise
+            finally:
+                del self._inflight[key]
+                # Local waiters get the response, or None to try themselves
+                future.set_result(record if record is not None and not record.pending else None)
+
+    async def _wait(self, future: asyncio.Future, deadline: float) -> Optional[StoredResponse]:
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), max(deadline - time.monotonic(), 0)
+            )
+        except asyncio.TimeoutError:
+            raise IdempotencyInProgressError("A request with this Idempotency-Key is still in progress")
+
+    async def _poll(self, key: str, deadline: float) -> StoredResponse:
+        """Wait for another worker to complete or release its claim"""
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            record = await self._call(self.store.get, key)
+            if record is None:
+                raise IdempotencyInProgressError(
+                    "The first request with this Idempotency-Key failed; retry"
+                )
+            if not record.pending:
+                return record
+        raise IdempotencyInProgressError("A request with this Idempotency-Key is still in progress")
+
+    def _replay(self, key: str, record: StoredResponse,
+                request_fingerprint: str) -> Tuple[int, bytes, bool]:
+        if record.fingerprint != request_fingerprint:
+            raise IdempotencyKeyMismatchError(
+                "Idempotency-Key was already used with a different request"
+            )
+        logger.info("Replaying stored response for Idempotency-Key %s", key)
+        return record.status_code, record.body, True
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def create_idempotency_store(url: Optional[str] = None) -> IdempotencyStore:
+    """
+    Create the store selected by IDEMPOTENCY_STORE
+
+    Sizes come from IDEMPOTENCY_TTL_SECONDS (default one day) and
+    IDEMPOTENCY_MAX_KEYS (default 100,000).
+
+    Raises:
+        IdempotencyError: If the URL is not supported
+    """
+    url = url or os.getenv("IDEMPOTENCY_STORE", "memory")
+    ttl = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(DEFAULT_TTL)))
+    max_entries = int(os.getenv("IDEMPOTENCY_MAX_KEYS", str(DEFAULT_MAX_ENTRIES)))
+    if url == "memory":
+        return MemoryIdempotencyStore(ttl, max_entries)
+    if url.startswith(SQLITE_PREFIX):
+        path = url[len(SQLITE_PREFIX):]
+        if not path:
+            raise IdempotencyError("sqlite URL needs a path, e.g. sqlite:///idempotency.db")
+        logger.info("Storing idempotency keys in SQLite database %s", path)
+        return SQLiteIdempotencyStore(path, ttl, max_entries)
+    raise IdempotencyError(f"Unsupported IDEMPOTENCY_STORE: {url.split(':', 1)[0]}")
@@ -0,0 +1,432 @@
+"""
+Bulk import of historical calculations
+Streams CSV or NDJSON files, validates rows in parallel chunks (recomputing
+each result with operations.calculate) and loads valid rows into PostgreSQL
+with COPY, one transaction per batch. Invalid rows, and batches the database
+refuses, go to a reject file.
+
+Expected fields (CSV header or NDJSON keys):
+    operation, operand_a, operand_b, result, user_id or username, timestamp (optional)
+
+Usage:
+    python import_calculations.py history.csv --rejects rejects.csv
+    python import_calculations.py history.ndjson --workers 8 --batch-rows 500000
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import connect, uses_operation_codes, DatabaseUnavailableError
+from operations import calculate, DivisionByZeroError, InvalidOperationError
+
+# (line number, raw record)
+RawRow = Tuple[int, Dict]
+# (line number, operation, operand_a, operand_b, result, timestamp, user_id, username)
+ValidRow = Tuple[int, str, float, float, float, Optional[datetime], Optional[int], Optional[str]]
+# (line number, reason, raw record)
+Reject = Tuple[int, str, Dict]
+
+COPY_COLUMNS = ("operation", "operand_a", "operand_b", "result", "timestamp", "user_id")
+
+RESULT_REL_TOLERANCE = 1e-9
+RESULT_ABS_TOLERANCE = 1e-9
+
+
+class ImportFormatError(Exception):
+    """Custom exception for unreadable input files"""
+    pass
+
+
+def read_rows(path: Path, file_format: Optional[str] = None) -> Iterator[RawRow]:
+    """
+    Stream records from a CSV or NDJSON file
+
+    Args:
+        path: Input file
+        file_format: "csv" or "ndjson" (guessed from the extension if omitted)
+
+    Yields:
+        (line number, record) pairs; unparsable NDJSON lines yield the raw
+        text under "_raw" so they end up in the reject file
+    """
+    file_format = file_format or ("csv" if path.suffix.lower() == ".csv" else "ndjson")
+    with open(path, newline="", encoding="utf-8") as handle:
+        if file_format == "csv":
+            reader = csv.DictReader(handle)
+            if reader.fieldnames is None:
+                return
+            for record in reader:
+                yield reader.line_num, record
+        elif file_format == "ndjson":
+            for line_no, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {"_raw": line.rstrip("\n")}
+                yield line_no, record if isinstance(record, dict) else {"_raw": line.rstrip("\n")}
+        else:
+            raise ImportFormatError(f"Unsupported format: {file_format}")
+
+
+def chunked(rows: Iterable[RawRow], size: int) -> Iterator[List[RawRow]]:
+    """Group a row stream into lists of at most size rows"""
+    chunk: List[RawRow] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def validate_record(record: Dict) -> Tuple[str, float, float, float, Optional[datetime],
+                                           Optional[int], Optional[str]]:
+    """
+    Validate one record and recompute its result
+
+    Returns:
+        Normalized (operation, operand_a, operand_b, result, timestamp, user_id, username)
+
+    Raises:
+        ValueError: With the rejection reason
+    """
+    if "_raw" in record:
+        raise ValueError("unparsable line")
+    try:
+        operation = str(record["operation"]).strip().lower()
+        operand_a = float(record["operand_a"])
+        operand_b = float(record["operand_b"])
+        result = float(record["result"])
+    except KeyError as e:
+        raise ValueError(f"missing field {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError("non-numeric operand or result")
+    if not all(math.isfinite(v) for v in (operand_a, operand_b, result)):
+        raise ValueError("non-finite operand or result")
+
+    user_id = record.get("user_id")
+    username = record.get("username") or None
+    if user_id not in (None, ""):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise ValueError("invalid user_id")
+    elif username is None:
+        raise ValueError("missing user_id or username")
+    else:
+        user_id = None
+
+    try:
+        timestamp = _parse_timestamp(record.get("timestamp"))
+    except ValueError:
+        raise ValueError("invalid timestamp")
+
+    try:
+        expected = calculate(operand_a, operand_b, operation)
+    except DivisionByZeroError:
+        raise ValueError("division by zero")
+    except InvalidOperationError:
+        raise ValueError(f"invalid operation {operation!r}")
+    if not math.isclose(result, expected, rel_tol=RESULT_REL_TOLERANCE,
+                        abs_tol=RESULT_ABS_TOLERANCE):
+        raise ValueError(f"result mismatch: expected {expected!r}")
+    return operation, operand_a, operand_b, result, timestamp, user_id, username
+
+
+def validate_chunk(chunk: List[RawRow]) -> Tuple[List[ValidRow], List[Reject]]:
+    """
+    Validate a chunk of rows
+
+    Returns:
+        Valid rows and rejected rows, both in input order
+    """
+    valid: List[ValidRow] = []
+    rejects: List[Reject] = []
+    for line_no, record in chunk:
+        try:
+            valid.append((line_no, *validate_record(record)))
+        except ValueError as e:
+            rejects.append((line_no, str(e), record))
+    return valid, rejects
+
+
+def _quiet_worker() -> None:
+    """Silence per-row calculation logging in validation workers"""
+    logging.getLogger("fastapi_calculator").setLevel(logging.CRITICAL)
+
+
+def validated_chunks(chunks: Iterable[List[RawRow]], workers: int
+                     ) -> Iterator[Tuple[List[ValidRow], List[Reject]]]:
+    """
+    Validate chunks in a process pool, yielding results in input order
+
+    At most 2 * workers chunks are in flight, so memory stays bounded no
+    matter how large the input is.
+    """
+    if workers <= 1:
+        previous = logging.getLogger("fastapi_calculator").level
+        _quiet_worker()
+        try:
+            for chunk in chunks:
+                yield validate_chunk(chunk)
+        finally:
+            logging.getLogger("fastapi_calculator").setLevel(previous)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(validate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+class CalculationLoader:
+    """COPY valid rows into calculations, adapting to the table layout"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.operation_codes: Optional[Dict[str, int]] = None
+        if uses_operation_codes(conn):
+            self.operation_codes = dict(conn.execute("SELECT name, code FROM operation_codes").fetchall())
+        # The partitioned layout needs partitions for the imported months
+        self.partitioned = self.operation_codes is not None and conn.execute(
+            "SELECT to_regproc('create_calculation_partitions') IS NOT NULL"
+        ).fetchone()[0]
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, username FROM users")
+            users = cur.fetchall()
+        conn.commit()
+        self.user_ids = {user_id for user_id, _ in users}
+        self.usernames = {username: user_id for user_id, username in users}
+        operation_type = "int2" if self.operation_codes is not None else "text"
+        self.types = [operation_type, "float8", "float8", "float8", "timestamp", "int4"]
+
+    def resolve(self, rows: List[ValidRow], default_timestamp: datetime,
+                sources: Dict[int, Dict]) -> Tuple[List[Tuple[int, tuple]], List[Reject]]:
+        """
+        Map rows to COPY tuples, rejecting unknown users or operations
+
+        Args:
+            rows: Validated rows
+            default_timestamp: Timestamp for rows without one
+            sources: Input records by line number, written for rejected rows
+
+        Returns:
+            (line number, COPY tuple) pairs and rejected rows
+        """
+        records: List[Tuple[int, tuple]] = []
+        rejects: List[Reject] = []
+        for line_no, operation, a, b, result, timestamp, user_id, username in rows:
+            if user_id is None:
+                user_id = self.usernames.get(username)
+            if user_id is None or user_id not in self.user_ids:
+                rejects.append((line_no, "unknown user", sources[line_no]))
+                continue
+            if self.operation_codes is not None:
+                code = self.operation_codes.get(operation)
+                if code is None:
+                    rejects.append((line_no, f"no operation code for {operation!r}",
+                                    sources[line_no]))
+                    continue
+                operation = code
+            records.append(
+                (line_no, (operation, a, b, result, timestamp or default_timestamp, user_id))
+            )
+        return records, rejects
+
+    def copy(self, records: List[tuple]) -> None:
+        """
+        Load records with binary COPY and commit the batch
+
+        Raises:
+            psycopg.Error: If the database refuses the batch; the
+                transaction is rolled back
+        """
+        try:
+            self._copy(records)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def _copy(self, records: List[tuple]) -> None:
+        with self.conn.cursor() as cur:
+            if self.partitioned:
+                oldest = min(record[4] for record in records)
+                cur.execute("SELECT create_calculation_partitions(%s)", (oldest.date(),))
+            with cur.copy(
+                "COPY calculations (operation, operand_a, operand_b, result, timestamp, user_id) "
+                "FROM STDIN (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(self.types)
+                for record in records:
+                    copy.write_row(record)
+
+
+class RejectWriter:
+    """Write rejected rows to a CSV file (line, reason, raw record)"""
+
+    def __init__(self, path: Optional[Path], append: bool = False):
+        """
+        Args:
+            path: Reject file, or None to only count rejects
+            append: Add to an existing file (when resuming) instead of replacing it
+        """
+        self.count = 0
+        new_file = not (append and path and path.exists() and path.stat().st_size > 0)
+        mode = "w" if new_file else "a"
+        self._handle = open(path, mode, newline="", encoding="utf-8") if path else None
+        self._writer = csv.writer(self._handle) if self._handle else None
+        if self._writer and new_file:
+            self._writer.writerow(["line", "reason", "record"])
+
+    def write(self, rejects: List[Reject]) -> None:
+        self.count += len(rejects)
+        if self._writer:
+            for line_no, reason, record in rejects:
+                self._writer.writerow([line_no, reason, json.dumps(record, default=str)])
+
+    def close(self) -> None:
+        if self._handle:
+            self._handle.close()
+
+
+def import_file(path: Path, conn, rejects_path: Optional[Path] = None,
+                file_format: Optional[str] = None, workers: int = 1,
+                chunk_rows: int = 20000, batch_rows: int = 200000,
+                start_line: int = 0, progress=None) -> Dict:
+    """
+    Import one file into calculations
+
+    Args:
+        path: CSV or NDJSON input
+        conn: psycopg connection
+        rejects_path: CSV file receiving rejected rows
+        file_format: "csv" or "ndjson" (guessed from the extension if omitted)
+        workers: Validation processes (1 validates inline)
+        chunk_rows: Rows per validation chunk
+        batch_rows: Rows per COPY transaction
+        start_line: Skip input lines up to and including this one (resume);
+            rejects are then appended to the existing reject file
+        progress: Optional callback receiving the summary after each batch
+
+    Returns:
+        Summary with counts, last committed line and throughput
+    """
+    import psycopg
+
+    loader = CalculationLoader(conn)
+    rejects = RejectWriter(rejects_path, append=start_line > 0)
+    default_timestamp = datetime.now()
+    summary = {"rows_read": 0, "rows_loaded": 0, "rows_rejected": 0,
+               "batches_failed": 0, "last_committed_line": start_line}
+    started = time.perf_counter()
+    batch: List[Tuple[int, tuple]] = []
+    batch_last_line = start_line
+    # Input chunks awaiting validation, so rejects can show the source records
+    in_flight: Deque[List[RawRow]] = deque()
+
+    def queued(chunks: Iterable[List[RawRow]]) -> Iterator[List[RawRow]]:
+        for chunk in chunks:
+            in_flight.append(chunk)
+            yield chunk
+
+    def flush() -> None:
+        if batch:
+            try:
+                loader.copy([record for _, record in batch])
+                summary["rows_loaded"] += len(batch)
+            except psycopg.Error as e:
+                # One refused batch should not end a long import
+                summary["batches_failed"] += 1
+                reason = f"batch failed: {str(e).strip().splitlines()[0]}"
+                print(f"error: COPY of {len(batch)} rows ending at line {batch_last_line} "
+                      f"failed: {e}", file=sys.stderr)
+                rejects.write([(line_no, reason, dict(zip(COPY_COLUMNS, record)))
+                               for line_no, record in batch])
+            batch.clear()
+        summary["last_committed_line"] = batch_last_line
+        summary["rows_rejected"] = rejects.count
+        if progress:
+            progress(dict(summary))
+
+    try:
+        rows = (row for row in read_rows(path, file_format) if row[0] > start_line)
+        for valid, invalid in validated_chunks(queued(chunked(rows, chunk_rows)), workers):
+            sources = dict(in_flight.popleft())
+            summary["rows_read"] += len(valid) + len(invalid)
+            records, unresolved = loader.resolve(valid, default_timestamp, sources)
+            rejects.write(sorted(invalid + unresolved, key=lambda reject: reject[0]))
+            batch.extend(records)
+            batch_last_line = max(
+                [batch_last_line] + [r[0] for r in valid[-1:]] + [r[0] for r in invalid[-1:]]
+            )
+            if len(batch) >= batch_rows:
+                flush()
+        flush()
+    finally:
+        rejects.close()
+    elapsed = time.perf_counter() - started
+    summary["elapsed_seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows_read"] / elapsed) if elapsed else 0
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import calculations with COPY")
+    parser.add_argument("input", type=Path, help="CSV or NDJSON file")
+    parser.add_argument("--format", choices=("csv", "ndjson"), default=None)
+    parser.add_argument("--rejects", type=Path, default=None,
+                        help="Reject file (default: <input>.rejects.csv)")
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    parser.add_argument("--workers", type=int, default=4, help="Validation processes")
+    parser.add_argument("--chunk-rows", type=int, default=20000)
+    parser.add_argument("--batch-rows", type=int, default=200000,
+                        help="Rows per COPY transaction")
+    parser.add_argument("--start-line", type=int, default=0,
+                        help="Resume after this input line (see last_committed_line)")
+    args = parser.parse_args(argv)
+
+    rejects_path = args.rejects or args.input.with_name(args.input.name + ".rejects.csv")
+
+    def report(summary: Dict) -> None:
+        print(json.dumps(summary), file=sys.stderr)
+
+    try:
+        with connect(args.database_url) as conn:
+            summary = import_file(
+                args.input, conn, rejects_path, args.format, args.workers,
+                args.chunk_rows, args.batch_rows, args.start_line, progress=report,
+            )
+    except (DatabaseUnavailableError, ImportFormatError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["rows_rejected"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
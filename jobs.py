@@ -0,0 +1,551 @@
+"""
+Asynchronous calculation jobs
+Inputs too large for a single request are uploaded (or referenced on local
+disk), split into fixed-size chunks and evaluated by a bounded pool of worker
+threads with the operation's vectorized kernel. Every job lives in its own
+directory under JOBS_DIR:
+
+    job.json            manifest (operation, format, status, row counts)
+    input.f8            operands as (num1, num2) little-endian float64 pairs
+    results/N.f8|.csv   output of chunk N
+    results/N.mask      invalid-row bitmask of chunk N (f8 jobs)
+    results/N.done      marker written last, so a chunk is done iff it exists
+
+Completed chunks survive a restart, so start() re-queues only the chunks
+without a marker.
+"""
+import csv
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from array import array
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from logger_config import get_logger
+from metrics import metrics
+from operations import calculate_arrays, registry, InvalidOperationError
+
+# Initialize logger
+logger = get_logger(__name__)
+
+FORMAT_F8 = "f8"
+FORMAT_CSV = "csv"
+JOB_FORMATS = (FORMAT_F8, FORMAT_CSV)
+
+STATUS_UPLOADING = "uploading"
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+JOB_STATUSES = (STATUS_UPLOADING, STATUS_QUEUED, STATUS_RUNNING, STATUS_COMPLETED, STATUS_FAILED)
+
+# One input row is a (num1, num2) pair of float64
+ROW_BYTES = 16
+# Multiple of 8 so chunk bitmasks concatenate into one contiguous mask
+DEFAULT_CHUNK_ROWS = 1 << 20
+DEFAULT_WORKERS = 2
+READ_BLOCK_BYTES = 1 << 20
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+jobs_submitted = metrics.counter(
+    "calculator_jobs_submitted_total", "Jobs accepted by POST /jobs"
+)
+jobs_finished = metrics.counter(
+    "calculator_jobs_finished_total", "Jobs that reached a final status", ("status",)
+)
+job_rows_processed = metrics.counter(
+    "calculator_job_rows_processed_total", "Operand pairs evaluated by job workers"
+)
+job_chunks_processed = metrics.counter(
+    "calculator_job_chunks_processed_total", "Job chunks evaluated"
+)
+job_chunk_seconds = metrics.counter(
+    "calculator_job_chunk_seconds_total", "Time spent evaluating job chunks"
+)
+
+
+class JobError(Exception):
+    """Raised when a job cannot be created or its input is invalid"""
+    pass
+
+
+class JobNotFoundError(JobError):
+    """Raised when a job ID is unknown"""
+    pass
+
+
+class JobNotReadyError(JobError):
+    """Raised when the result of an unfinished job is requested"""
+    pass
+
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class Job:
+    """Manifest of one job, persisted as job.json"""
+    id: str
+    operation: str
+    format: str
+    status: str = STATUS_UPLOADING
+    source: Optional[str] = None
+    rows: Optional[int] = None
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+    chunks: Optional[int] = None
+    created_at: str = field(default_factory=_utcnow)
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+    # Progress is rebuilt from the chunk markers, never persisted
+    chunks_done: int = 0
+    rows_done: int = 0
+    invalid_rows: int = 0
+
+    @property
+    def progress(self) -> float:
+        """Fraction of rows evaluated (0 until the input is ingested)"""
+        if self.status == STATUS_COMPLETED:
+            return 1.0
+        if not self.rows:
+            return 0.0
+        return self.rows_done / self.rows
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["progress"] = self.progress
+        return data
+
+
+class JobManager:
+    """Create, run and resume jobs stored under one directory"""
+
+    def __init__(self, directory, workers: int = DEFAULT_WORKERS,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, input_dir=None):
+        """
+        Args:
+            directory: Directory holding one subdirectory per job
+            workers: Number of worker threads
+            chunk_rows: Rows per chunk (rounded up to a multiple of 8)
+            input_dir: Directory that local input paths must be inside;
+                None disables submitting local paths
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        self.directory = Path(directory)
+        self.workers = workers
+        self.chunk_rows = -(-chunk_rows // 8) * 8
+        self.input_dir = Path(input_dir).resolve() if input_dir else None
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._tasks: "queue.Queue" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        metrics.gauge(
+            "calculator_jobs", "Known jobs by status", ("status",), function=self._count_by_status
+        )
+        metrics.gauge(
+            "calculator_job_queue_depth", "Ingest and chunk tasks waiting for a worker",
+            function=self._tasks.qsize
+        )
+        metrics.gauge(
+            "calculator_job_progress_ratio", "Fraction of rows evaluated per unfinished job",
+            ("job_id",), function=self._active_progress
+        )
+
+    # Lifecycle
+
+    def start(self) -> None:
+        """Resume unfinished jobs and start the workers (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        self._resume()
+        for thread in self._threads:
+            thread.start()
+        logger.info("Job workers started: %d threads, directory %s", self.workers, self.directory)
+
+    def close(self) -> None:
+        """Stop the workers after their current task; queued work resumes on next start"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _resume(self) -> None:
+        for manifest in sorted(self.directory.glob("*/job.json")):
+            try:
+                job = Job(**json.loads(manifest.read_text()))
+            except (OSError, ValueError, TypeError) as e:
+                logger.error("Skipping unreadable job manifest %s: %s", manifest, e)
+                continue
+            with self._lock:
+                self._jobs[job.id] = job
+            if job.status == STATUS_UPLOADING:
+                self._fail(job, "Upload interrupted by restart")
+            elif job.status == STATUS_QUEUED:
+                self._tasks.put(("ingest", job.id))
+            elif job.status == STATUS_RUNNING:
+                self._queue_chunks(job)
+            elif job.status == STATUS_COMPLETED:
+                self._load_progress(job)
+            if job.status in (STATUS_QUEUED, STATUS_RUNNING):
+                logger.info("Resuming job %s (%s)", job.id, job.status)
+
+    # Submission
+
+    def create(self, operation: str, fmt: str) -> Job:
+        """
+        Create a job awaiting its input
+
+        Args:
+            operation: Name of an operation with a vectorized kernel
+            fmt: Input format, f8 (packed float64 pairs) or csv (num1,num2 columns)
+
+        Returns:
+            The new job, in uploading status
+
+        Raises:
+            JobError: If the operation or format is not supported
+        """
+        try:
+            op = registry.get(operation.lower())
+        except InvalidOperationError as e:
+            raise JobError(str(e))
+        if op.vectorized is None:
+            raise JobError(f"Operation {op.name} has no array kernel")
+        if fmt not in JOB_FORMATS:
+            raise JobError(f"Unsupported format {fmt!r}; expected one of {', '.join(JOB_FORMATS)}")
+        self.start()
+        job = Job(id=uuid.uuid4().hex, operation=op.name, format=fmt, chunk_rows=self.chunk_rows)
+        (self._job_dir(job.id) / "results").mkdir(parents=True)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._save(job)
+        return job
+
+    def upload_path(self, job: Job) -> Path:
+        """Where an uploaded input is written before submit()"""
+        return self._job_dir(job.id) / f"upload.{job.format}"
+
+    def submit(self, job: Job, source=None) -> Job:
+        """
+        Queue a job whose input is in place
+
+        Args:
+            job: Job from create()
+            source: Input file (defaults to the upload path)
+        """
+        job.source = str(source or self.upload_path(job))
+        job.status = STATUS_QUEUED
+        self._save(job)
+        jobs_submitted.inc()
+        self._tasks.put(("ingest", job.id))
+        logger.info("Job %s queued: %s over %s input %s", job.id, job.operation, job.format, job.source)
+        return job
+
+    def submit_path(self, operation: str, fmt: str, path: str) -> Job:
+        """
+        Create and queue a job reading a file on the server's disk
+
+        Raises:
+            JobError: If local inputs are disabled, or the path is outside
+                input_dir or not a file
+        """
+        if self.input_dir is None:
+            raise JobError("Local input paths are disabled; set JOB_INPUT_DIR")
+        resolved = Path(path).resolve()
+        if self.input_dir not in resolved.parents:
+            raise JobError(f"Input path must be inside {self.input_dir}")
+        if not resolved.is_file():
+            raise JobError(f"Input file {path} does not exist")
+        return self.submit(self.create(operation, fmt), resolved)
+
+    def discard(self, job: Job, reason: str) -> None:
+        """Fail a job whose upload could not be completed"""
+        self._fail(job, reason)
+
+    # Queries
+
+    def get(self, job_id: str) -> Job:
+        """
+        Raises:
+            JobNotFoundError: If the job does not exist
+        """
+        with self._lock:
+            job = self._jobs.get(job_id) if _JOB_ID_PATTERN.match(job_id) else None
+        if job is None:
+            raise JobNotFoundError(f"Job {job_id} not found")
+        return job
+
+    def iter_result(self, job_id: str, part: str = "results") -> Iterator[bytes]:
+        """
+        Output of a completed job, chunk by chunk
+
+        For f8 jobs part is "results" (float64 per row, NaN where invalid)
+        or "mask" (invalid-row bitmask, least significant bit first). csv
+        jobs have a single part: result,error lines.
+
+        Raises:
+            JobNotFoundError: If the job does not exist
+            JobNotReadyError: If the job has not completed
+            JobError: If part does not apply to the job's format
+        """
+        job = self.get(job_id)
+        if job.status != STATUS_COMPLETED:
+            raise JobNotReadyError(f"Job {job_id} is {job.status}")
+        if job.format == FORMAT_CSV:
+            if part != "results":
+                raise JobError("csv jobs only have a results part")
+            suffix = ".csv"
+        elif part in ("results", "mask"):
+            suffix = ".f8" if part == "results" else ".mask"
+        else:
+            raise JobError(f"Unknown result part {part!r}")
+        return self._iter_files(job, suffix)
+
+    def _iter_files(self, job: Job, suffix: str) -> Iterator[bytes]:
+        if job.format == FORMAT_CSV:
+            yield b"result,error\n"
+        results = self._job_dir(job.id) / "results"
+        for index in range(job.chunks or 0):
+            with open(results / f"{index:08d}{suffix}", "rb") as handle:
+                while True:
+                    block = handle.read(READ_BLOCK_BYTES)
+                    if not block:
+                        break
+                    yield block
+
+    # Workers
+
+    def _run(self) -> None:
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            job = self._jobs.get(task[1])
+            if job is None or job.status == STATUS_FAILED:
+                continue
+            try:
+                if task[0] == "ingest":
+                    self._ingest(job)
+                else:
+                    self._evaluate(job, task[2])
+            except (JobError, OSError, ValueError) as e:
+                self._fail(job, str(e))
+            except Exception as e:
+                logger.error("Job %s crashed: %s", job.id, e, exc_info=True)
+                self._fail(job, f"Internal error: {e}")
+
+    def _ingest(self, job: Job) -> None:
+        """Normalize the input to packed float64 pairs and queue the chunks"""
+        source = Path(job.source)
+        if job.format == FORMAT_CSV:
+            target = self._job_dir(job.id) / "input.f8"
+            _csv_to_f8(source, target)
+            if source.parent == self._job_dir(job.id):
+                source.unlink()
+            job.source = str(target)
+            source = target
+        size = source.stat().st_size
+        if size % ROW_BYTES:
+            raise JobError(f"Input size {size} is not a multiple of {ROW_BYTES} bytes")
+        job.rows = size // ROW_BYTES
+        job.chunks = -(-job.rows // job.chunk_rows)
+        job.status = STATUS_RUNNING
+        job.started_at = _utcnow()
+        self._save(job)
+        logger.info("Job %s ingested: %d rows in %d chunks", job.id, job.rows, job.chunks)
+        self._queue_chunks(job)
+
+    def _queue_chunks(self, job: Job) -> None:
+        pending = self._load_progress(job)
+        if not pending:
+            self._complete(job)
+        for index in pending:
+            self._tasks.put(("chunk", job.id, index))
+
+    def _load_progress(self, job: Job) -> List[int]:
+        """Rebuild progress from chunk markers; returns the chunks still to do"""
+        results = self._job_dir(job.id) / "results"
+        pending = []
+        chunks_done = rows_done = invalid_rows = 0
+        for index in range(job.chunks or 0):
+            marker = results / f"{index:08d}.done"
+            if not marker.exists():
+                pending.append(index)
+                continue
+            done = json.loads(marker.read_text())
+            chunks_done += 1
+            rows_done += done["rows"]
+            invalid_rows += done["invalid"]
+        with self._lock:
+            job.chunks_done, job.rows_done, job.invalid_rows = chunks_done, rows_done, invalid_rows
+        return pending
+
+    def _evaluate(self, job: Job, index: int) -> None:
+        started = time.perf_counter()
+        start = index * job.chunk_rows
+        rows = min(job.chunk_rows, job.rows - start)
+        pairs = np.fromfile(job.source, dtype="<f8", count=rows * 2, offset=start * ROW_BYTES)
+        if len(pairs) != rows * 2:
+            raise JobError(f"Input {job.source} changed while the job was running")
+        pairs = pairs.reshape(rows, 2)
+        num1 = np.ascontiguousarray(pairs[:, 0])
+        num2 = np.ascontiguousarray(pairs[:, 1])
+        op = registry.get(job.operation)
+        results, invalid = calculate_arrays(num1, num2, op)
+
+        base = self._job_dir(job.id) / "results" / f"{index:08d}"
+        if job.format == FORMAT_CSV:
+            _write_atomic(base.with_suffix(".csv"), _csv_chunk(op, num1, num2, results, invalid))
+        else:
+            _write_atomic(base.with_suffix(".f8"), results.astype("<f8", copy=False).tobytes())
+            _write_atomic(base.with_suffix(".mask"), np.packbits(invalid, bitorder="little").tobytes())
+        invalid_count = int(invalid.sum())
+        _write_atomic(base.with_suffix(".done"),
+                      json.dumps({"rows": rows, "invalid": invalid_count}).encode())
+
+        job_rows_processed.inc(rows)
+        job_chunks_processed.inc()
+        job_chunk_seconds.inc(time.perf_counter() - started)
+        with self._lock:
+            job.chunks_done += 1
+            job.rows_done += rows
+            job.invalid_rows += invalid_count
+            finished = job.chunks_done == job.chunks
+        if finished:
+            self._complete(job)
+
+    def _complete(self, job: Job) -> None:
+        job.status = STATUS_COMPLETED
+        job.finished_at = _utcnow()
+        self._save(job)
+        jobs_finished.inc(status=STATUS_COMPLETED)
+        logger.info("Job %s completed: %d rows (%d invalid)", job.id, job.rows, job.invalid_rows)
+
+    def _fail(self, job: Job, reason: str) -> None:
+        with self._lock:
+            if job.status == STATUS_FAILED:
+                return
+            job.status = STATUS_FAILED
+        job.error = reason
+        job.finished_at = _utcnow()
+        self._save(job)
+        jobs_finished.inc(status=STATUS_FAILED)
+        logger.error("Job %s failed: %s", job.id, reason)
+
+    # Storage and metrics
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.directory / job_id
+
+    def _save(self, job: Job) -> None:
+        data = {key: value for key, value in asdict(job).items()
+                if key not in ("chunks_done", "rows_done", "invalid_rows")}
+        _write_atomic(self._job_dir(job.id) / "job.json", json.dumps(data, indent=2).encode())
+
+    def _count_by_status(self) -> Dict:
+        counts = {(status,): 0 for status in JOB_STATUSES}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[(job.status,)] += 1
+        return counts
+
+    def _active_progress(self) -> Dict:
+        with self._lock:
+            return {
+                (job.id,): job.progress for job in self._jobs.values()
+                if job.status in (STATUS_QUEUED, STATUS_RUNNING)
+            }
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Write via a temporary file so readers never see a partial file"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as handle:
+        handle.write(data)
+    os.replace(tmp, path)
+
+
+def _csv_to_f8(source: Path, target: Path, block_rows: int = 65536) -> int:
+    """
+    Convert a CSV with num1 and num2 columns to packed float64 pairs
+
+    Returns:
+        Number of rows written
+
+    Raises:
+        JobError: On a missing column or an unparsable row
+    """
+    tmp = target.with_name(target.name + ".tmp")
+    rows = 0
+    with open(source, newline="") as handle, open(tmp, "wb") as out:
+        reader = csv.reader(handle)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if "num1" not in header or "num2" not in header:
+            raise JobError("CSV input needs a header with num1 and num2 columns")
+        first, second = header.index("num1"), header.index("num2")
+        block = array("d")
+        for line, record in enumerate(reader, start=2):
+            if not record:
+                continue
+            try:
+                block.append(float(record[first]))
+                block.append(float(record[second]))
+            except (IndexError, ValueError):
+                raise JobError(f"Line {line}: num1 and num2 must be numbers")
+            rows += 1
+            if len(block) >= block_rows * 2:
+                block.tofile(out)
+                block = array("d")
+        block.tofile(out)
+    os.replace(tmp, target)
+    return rows
+
+
+def _csv_chunk(op, num1: np.ndarray, num2: np.ndarray, results: np.ndarray,
+               invalid: np.ndarray) -> bytes:
+    """result,error lines for one chunk; invalid rows carry the rule message"""
+    messages = [""] * len(results)
+    if invalid.any():
+        pending = invalid.copy()
+        for rule in op.validators:
+            hits = pending & np.asarray(rule.invalid(num1, num2), dtype=bool)
+            for position in np.flatnonzero(hits):
+                messages[position] = rule.message
+            pending &= ~hits
+    buffer = io.StringIO()
+    for value, is_invalid, message in zip(results.tolist(), invalid.tolist(), messages):
+        buffer.write(f",{message}\n" if is_invalid else f"{value!r},\n")
+    return buffer.getvalue().encode()
+
+
+def manager_from_env() -> JobManager:
+    """Manager configured by JOBS_DIR, JOB_WORKERS, JOB_CHUNK_ROWS and JOB_INPUT_DIR"""
+    return JobManager(
+        os.getenv("JOBS_DIR", "data/jobs"),
+        workers=int(os.getenv("JOB_WORKERS", str(DEFAULT_WORKERS))),
+        chunk_rows=int(os.getenv("JOB_CHUNK_ROWS", str(DEFAULT_CHUNK_ROWS))),
+        input_dir=os.getenv("JOB_INPUT_DIR") or None,
+    )
@@ -0,0 +1,355 @@
+"""
+Incremental log analytics for request latency
+Parses "Request completed" lines written by log_requests and reports latency
+percentiles per route, per status code and per time bucket.
+
+Log files are memory-mapped and scanned with a single compiled regex. A
+checkpoint file remembers how far each file (identified by device and inode,
+so renames during rotation are followed; compressed segments are matched by
+their first bytes) has been read, together with the latency histograms
+gathered so far. Repeated runs only parse new bytes.
+
+Usage:
+    python log_analytics.py --log-dir logs --bucket 300 --format json
+"""
+import argparse
+import calendar
+import gzip
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Matches text and JSON formatted completion lines, e.g.
+# 2025-01-01 12:00:00 - ... - Request completed: GET /health - Status: 200 - Duration: 0.001s
+# {"timestamp": "2025-01-01T12:00:00.123", ... "message": "Request completed: GET ...
+COMPLETED_LINE = re.compile(
+    rb'^(?:\{"timestamp": ")?(\d{4}-\d\d-\d\d)[ T](\d\d:\d\d):(\d\d)[^\n]*?'
+    rb'Request completed: (\S+) (\S+) - Status: (\d{3}) - Duration: ([0-9.]+)s',
+    re.MULTILINE,
+)
+
+# Log-scaled histogram buckets give ~1% relative error on percentiles
+HISTOGRAM_GROWTH = 1.02
+_LOG_GROWTH = math.log(HISTOGRAM_GROWTH)
+
+CHECKPOINT_VERSION = 1
+HEAD_BYTES = 64
+DEFAULT_PERCENTILES = (50.0, 90.0, 95.0, 99.0)
+
+
+class LatencyHistogram:
+    """Mergeable log-bucketed latency histogram with exact count/sum/max"""
+
+    __slots__ = ("count", "total", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, seconds: float) -> None:
+        """Record one latency sample in seconds"""
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log(micros) / _LOG_GROWTH)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, pct: float) -> float:
+        """Approximate percentile in seconds"""
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(self.count * pct / 100.0), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric midpoint of the bucket, capped by the exact max
+                return min(HISTOGRAM_GROWTH ** (index + 0.5) / 1e6, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "buckets": {str(k): v for k, v in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.count = data["count"]
+        histogram.total = data["sum"]
+        histogram.maximum = data["max"]
+        histogram.buckets = {int(k): v for k, v in data["buckets"].items()}
+        return histogram
+
+
+class LogAnalytics:
+    """Accumulates latency histograms from log files across runs"""
+
+    GROUPS = ("route", "status", "bucket")
+
+    def __init__(self, bucket_seconds: int = 60):
+        self.bucket_seconds = bucket_seconds
+        self.files: Dict[str, Dict] = {}
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {g: {} for g in self.GROUPS}
+        self.lines_parsed = 0
+        self.bytes_read = 0
+        self._minute_cache: Dict[bytes, int] = {}
+        # Entries of plain files whose inode now belongs to another file
+        self._replaced: List[Dict] = []
+
+    # ---- checkpoint -----------------------------------------------------
+
+    @classmethod
+    def load(cls, path: Path, bucket_seconds: int) -> "LogAnalytics":
+        """
+        Load state from a checkpoint file, or start fresh if none exists
+
+        Raises:
+            ValueError: If the checkpoint was written with a different bucket size
+        """
+        analytics = cls(bucket_seconds)
+        if not path.exists():
+            return analytics
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != CHECKPOINT_VERSION:
+            return analytics
+        if data["bucket_seconds"] != bucket_seconds:
+            raise ValueError(
+                f"Checkpoint uses {data['bucket_seconds']}s buckets; "
+                f"rerun with --bucket {data['bucket_seconds']} or --reset"
+            )
+        analytics.files = data["files"]
+        for group in cls.GROUPS:
+            analytics.histograms[group] = {
+                key: LatencyHistogram.from_dict(value)
+                for key, value in data["histograms"][group].items()
+            }
+        return analytics
+
+    def save(self, path: Path) -> None:
+        """Atomically write state to a checkpoint file"""
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "bucket_seconds": self.bucket_seconds,
+            "files": self.files,
+            "histograms": {
+                group: {key: h.to_dict() for key, h in histograms.items()}
+                for group, histograms in self.histograms.items()
+            },
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+
+    # ---- parsing --------------------------------------------------------
+
+    def _record(self, match: "re.Match") -> None:
+        day, minute, second, method, route, status, duration = match.groups()
+        minute_key = day + b" " + minute
+        epoch = self._minute_cache.get(minute_key)
+        if epoch is None:
+            epoch = calendar.timegm(time.strptime(minute_key.decode(), "%Y-%m-%d %H:%M"))
+            self._minute_cache[minute_key] = epoch
+        epoch += int(second)
+        bucket_start = epoch - epoch % self.bucket_seconds
+        seconds = float(duration)
+        keys = (
+            ("route", f"{method.decode()} {route.decode()}"),
+            ("status", status.decode()),
+            ("bucket", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(bucket_start))),
+        )
+        for group, key in keys:
+            histogram = self.histograms[group].get(key)
+            if histogram is None:
+                histogram = self.histograms[group][key] = LatencyHistogram()
+            histogram.add(seconds)
+        self.lines_parsed += 1
+
+    def _scan(self, buffer, start: int, end: int) -> None:
+        for match in COMPLETED_LINE.finditer(buffer, start, end):
+            self._record(match)
+
+    def process_file(self, path: Path) -> None:
+        """Parse the unread part of one plain or gzip-compressed log file"""
+        stat = path.stat()
+        file_id = f"{stat.st_dev}:{stat.st_ino}"
+        entry = self.files.get(file_id)
+        if path.suffix == ".gz":
+            self._process_gzip(path, file_id, entry)
+            return
+
+        with open(path, "rb") as handle:
+            head = handle.read(HEAD_BYTES).hex()
+            offset = entry["offset"] if entry else 0
+            # Truncated, or the inode was reused by a different file
+            if entry and (stat.st_size < offset or entry["head"] != head[:len(entry["head"])]):
+                if entry["head"] and entry["head"] != head[:len(entry["head"])]:
+                    # Keep it for the compressed segment the old file became
+                    self._replaced.append(entry)
+                offset = 0
+            if stat.st_size <= offset:
+                self.files[file_id] = {"path": str(path), "offset": offset, "head": head}
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                # Only consume complete lines; a partial last line is read next run
+                end = buffer.rfind(b"\n", offset) + 1
+                if end > offset:
+                    self._scan(buffer, offset, end)
+                    self.bytes_read += end - offset
+                    offset = end
+        self.files[file_id] = {"path": str(path), "offset": offset, "head": head}
+
+    def _process_gzip(self, path: Path, file_id: str, entry: Optional[Dict]) -> None:
+        if entry is not None:
+            return  # compressed segments never change
+        with gzip.open(path, "rb") as handle:
+            head = handle.read(HEAD_BYTES).hex()
+        skip = self._claim_plain_entry(head)
+        consumed = 0
+        with gzip.open(path, "rb") as handle:
+            for line in handle:
+                consumed += len(line)
+                if consumed <= skip:
+                    continue
+                match = COMPLETED_LINE.match(line)
+                if match:
+                    self._record(match)
+        self.bytes_read += max(consumed - skip, 0)
+        self.files[file_id] = {"path": str(path), "offset": consumed, "head": "", "gzip": True}
+
+    def _claim_plain_entry(self, head: str) -> int:
+        """
+        Find the checkpoint entry of the plain file a compressed segment was
+        made from and return how far it had been read
+
+        Compression writes a new file, so neither the inode nor (after the
+        rename on rotation) the path can identify it; the first bytes can.
+        """
+        candidates = [
+            (file_id, entry) for file_id, entry in self.files.items()
+            if not entry.get("gzip") and entry["head"] and head.startswith(entry["head"])
+        ] + [(None, entry) for entry in self._replaced if head.startswith(entry["head"])]
+        if not candidates:
+            return 0
+        # Prefer the longest matching head, then the furthest read
+        file_id, entry = max(candidates, key=lambda c: (len(c[1]["head"]), c[1]["offset"]))
+        if file_id is None:
+            self._replaced.remove(entry)
+        else:
+            del self.files[file_id]
+        return entry["offset"]
+
+    def process(self, paths: Iterable[Path]) -> None:
+        """Parse new bytes from the given files and forget vanished ones"""
+        paths = list(paths)
+        # Plain files first so renamed segments are matched before compression
+        for path in sorted(paths, key=lambda p: p.suffix == ".gz"):
+            self.process_file(path)
+        live = set()
+        for path in paths:
+            stat = path.stat()
+            live.add(f"{stat.st_dev}:{stat.st_ino}")
+        self.files = {k: v for k, v in self.files.items() if k in live}
+
+    # ---- reporting ------------------------------------------------------
+
+    def report(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict:
+        """Build a JSON-serializable percentile report"""
+        percentiles = list(percentiles)
+        result = {
+            "lines_parsed": self.lines_parsed,
+            "bytes_read": self.bytes_read,
+            "bucket_seconds": self.bucket_seconds,
+        }
+        for group, histograms in self.histograms.items():
+            result[group] = {
+                key: {
+                    "count": h.count,
+                    "mean_ms": round(h.total / h.count * 1000, 3) if h.count else 0.0,
+                    "max_ms": round(h.maximum * 1000, 3),
+                    **{f"p{pct:g}_ms": round(h.percentile(pct) * 1000, 3) for pct in percentiles},
+                }
+                for key, h in sorted(histograms.items())
+            }
+        return result
+
+
+def find_log_files(log_dir: Path, base_name: str = "app.log") -> List[Path]:
+    """Return the live log file and its rotated backups"""
+    return sorted(
+        path for path in log_dir.glob(base_name + "*")
+        if path.is_file() and not path.name.endswith(".tmp")
+    )
+
+
+def format_report(report: Dict) -> str:
+    """Render a report as plain-text tables"""
+    lines = [
+        f"Parsed {report['lines_parsed']} new request lines "
+        f"({report['bytes_read']} new bytes)"
+    ]
+    for group in LogAnalytics.GROUPS:
+        rows = report[group]
+        lines.append("")
+        lines.append(f"== by {group} ==")
+        if not rows:
+            lines.append("(no data)")
+            continue
+        columns = list(next(iter(rows.values())).keys())
+        width = max(len(key) for key in rows)
+        lines.append(f"{group:<{width}}  " + "  ".join(f"{c:>10}" for c in columns))
+        for key, values in rows.items():
+            lines.append(f"{key:<{width}}  " + "  ".join(f"{values[c]:>10}" for c in columns))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Latency percentiles from request logs")
+    parser.add_argument("--log-dir", type=Path, default=Path("logs"))
+    parser.add_argument("--log-name", default="app.log",
+                        help="Base name of the log file and its rotated backups")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="Checkpoint file (default: <log-dir>/.analytics_checkpoint.json)")
+    parser.add_argument("--bucket", type=int, default=60, help="Time bucket size in seconds")
+    parser.add_argument("--percentiles", default=",".join(f"{p:g}" for p in DEFAULT_PERCENTILES))
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    parser.add_argument("--reset", action="store_true", help="Ignore and overwrite the checkpoint")
+    args = parser.parse_args(argv)
+
+    checkpoint = args.checkpoint or args.log_dir / ".analytics_checkpoint.json"
+    percentiles: Tuple[float, ...] = tuple(float(p) for p in args.percentiles.split(","))
+    try:
+        if args.reset:
+            analytics = LogAnalytics(args.bucket)
+        else:
+            analytics = LogAnalytics.load(checkpoint, args.bucket)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    analytics.process(find_log_files(args.log_dir, args.log_name))
+    analytics.save(checkpoint)
+
+    report = analytics.report(percentiles)
+    if args.format == "json":
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Runtime logging control
+Changes logger levels and log sampling rates without a restart. The
+desired settings live in a small JSON file that every worker polls, so a
+change made through the admin endpoint in one worker (or by editing the
+file) reaches all workers on the host within a poll interval:
+
+    {
+      "levels": {"fastapi_calculator": "WARNING", "uvicorn.access": "ERROR"},
+      "sample_rates": {"http.request": 0.1, "calculate": 0.01}
+    }
+
+Loggers and sample keys missing from the file keep (or return to) the
+settings they had at startup.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from logger_config import get_logger, get_sampling_filter
+
+# Initialize logger
+logger = get_logger(__name__)
+
+DEFAULT_CONTROL_FILE = "logs/log_control.json"
+DEFAULT_POLL_INTERVAL = 2.0
+
+LEVEL_NAMES = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+
+class LogControlError(Exception):
+    """Custom exception for invalid logging settings"""
+    pass
+
+
+def validate_settings(settings) -> Dict:
+    """
+    Check and normalise logging settings
+
+    Args:
+        settings: Mapping with optional "levels" (logger name -> level name)
+            and "sample_rates" (sample key -> rate between 0 and 1)
+
+    Returns:
+        Settings with upper-case level names and float rates
+
+    Raises:
+        LogControlError: If the settings are malformed
+    """
+    if not isinstance(settings, dict):
+        raise LogControlError("Logging settings must be a JSON object")
+    unknown = set(settings) - {"levels", "sample_rates"}
+    if unknown:
+        raise LogControlError(f"Unknown logging settings: {', '.join(sorted(unknown))}")
+    levels = settings.get("levels") or {}
+    rates = settings.get("sample_rates") or {}
+    if not isinstance(levels, dict) or not isinstance(rates, dict):
+        raise LogControlError("levels and sample_rates must be JSON objects")
+
+    clean: Dict = {"levels": {}, "sample_rates": {}}
+    for name, level in levels.items():
+        if not isinstance(level, str) or level.upper() not in LEVEL_NAMES:
+            raise LogControlError(
+                f"Invalid level for logger '{name}': {level!r}. Use one of {', '.join(LEVEL_NAMES)}"
+            )
+        clean["levels"][name] = level.upper()
+    for key, rate in rates.items():
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+            raise LogControlError(f"Invalid sample rate for '{key}': {rate!r}. Use 0.0 - 1.0")
+        clean["sample_rates"][key] = float(rate)
+    return clean
+
+
+class LogControl:
+    """Apply logging settings from a shared file and watch it for changes"""
+
+    def __init__(self, path: str, app_logger: logging.Logger,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Args:
+            path: JSON settings file shared by the workers
+            app_logger: Logger configured by setup_logging, whose sampling
+                filter receives the sample rates
+            poll_interval: Seconds between checks of the file
+        """
+        self.path = Path(path)
+        self.app_logger = app_logger
+        self.poll_interval = poll_interval
+        self.settings: Dict = {"levels": {}, "sample_rates": {}}
+        # Levels and rates from before the first change, restored when a
+        # logger or key is dropped from the settings
+        self._default_levels: Dict[str, int] = {}
+        sampling = get_sampling_filter(app_logger)
+        self._default_rates: Dict[str, float] = dict(sampling.rates) if sampling else {}
+        self._file_state: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def status(self) -> Dict:
+        """Effective levels of the configured loggers and the sample rates"""
+        names = {self.app_logger.name} | set(self._default_levels) | set(self.settings["levels"])
+        sampling = get_sampling_filter(self.app_logger)
+        return {
+            "file": str(self.path),
+            "levels": {
+                name: logging.getLevelName(logging.getLogger(name).getEffectiveLevel())
+                for name in sorted(names)
+            },
+            "sample_rates": dict(sampling.rates) if sampling else {},
+            "overrides": self.settings,
+        }
+
+    def apply(self, settings: Dict) -> None:
+        """
+        Make settings effective in this process
+
+        Raises:
+            LogControlError: If the settings are malformed
+        """
+        settings = validate_settings(settings)
+        with self._lock:
+            for name in set(self.settings["levels"]) - set(settings["levels"]):
+                logging.getLogger(name).setLevel(self._default_levels.pop(name))
+            for name, level in settings["levels"].items():
+                target = logging.getLogger(name)
+                self._default_levels.setdefault(name, target.level)
+                target.setLevel(level)
+            sampling = get_sampling_filter(self.app_logger)
+            if sampling is not None:
+                # Swap the whole dict so the filter never sees a half-updated one
+                sampling.rates = {**self._default_rates, **settings["sample_rates"]}
+            changed = settings != self.settings
+            self.settings = settings
+        if changed:
+            logger.warning("Logging settings changed: levels=%s sample_rates=%s",
+                           settings["levels"], settings["sample_rates"])
+
+    def update(self, changes: Dict) -> Dict:
+        """
+        Merge changes into the shared file and apply them here
+
+        A null level or rate removes that override. Other workers pick the
+        change up on their next poll.
+
+        Returns:
+            The new status
+
+        Raises:
+            LogControlError: If the result is malformed or the file cannot be written
+        """
+        if not isinstance(changes, dict):
+            raise LogControlError("Logging settings must be a JSON object")
+        unknown = set(changes) - {"levels", "sample_rates"}
+        if unknown:
+            raise LogControlError(f"Unknown logging settings: {', '.join(sorted(unknown))}")
+        # Start from the file, which another worker may have changed since our last poll
+        self.reload()
+        merged = {section: dict(values) for section, values in self.settings.items()}
+        for section in ("levels", "sample_rates"):
+            values = changes.get(section) or {}
+            if not isinstance(values, dict):
+                raise LogControlError("levels and sample_rates must be JSON objects")
+            for name, value in values.items():
+                if value is None:
+                    merged[section].pop(name, None)
+                else:
+                    merged[section][name] = value
+        merged = validate_settings(merged)
+        self._write(merged)
+        self.apply(merged)
+        return self.status()
+
+    def reload(self) -> bool:
+        """
+        Apply the file if it changed since the last check
+
+        A missing file means no overrides. An invalid file is logged and
+        ignored, keeping the current settings.
+
+        Returns:
+            True if the settings were reloaded
+        """
+        try:
+            stat = os.stat(self.path)
+            state = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            state = None
+        if state == self._file_state:
+            return False
+        self._file_state = state
+        try:
+            settings = json.loads(self.path.read_text()) if state is not None else {}
+            self.apply(settings)
+        except (OSError, ValueError, LogControlError) as e:
+            logger.error("Ignoring logging settings in %s: %s", self.path, e)
+            return False
+        return True
+
+    def start(self) -> None:
+        """Load the file and start watching it"""
+        self.reload()
+        if self._thread is None and self.poll_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-control", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """Stop watching the file"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.reload()
+
+    def _write(self, settings: Dict) -> None:
+        # Write to a temporary file and rename, so readers never see a partial file
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+            with os.fdopen(fd, "w") as handle:
+                json.dump(settings, handle, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            raise LogControlError(f"Cannot write {self.path}: {e}")
+
+
+def control_from_env(app_logger: logging.Logger) -> LogControl:
+    """
+    Create the log control configured by LOG_CONTROL_FILE (default
+    logs/log_control.json) and LOG_CONTROL_POLL_SECONDS (default 2; 0 only
+    reads the file at startup)
+    """
+    return LogControl(
+        os.getenv("LOG_CONTROL_FILE", DEFAULT_CONTROL_FILE),
+        app_logger,
+        poll_interval=float(os.getenv("LOG_CONTROL_POLL_SECONDS", str(DEFAULT_POLL_INTERVAL))),
+    )
@@ -2,19 +2,391 @@
 Logging configuration for FastAPI Calculator
 Provides centralized logging setup with file and console handlers
 """
+import gzip
+import json
 import logging
+import os
+import queue
+import random
+import shutil
 import sys
+import threading
+import time
+import zlib
+from contextvars import ContextVar
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import BaseRotatingHandler, RotatingFileHandler
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
 
+# Request ID of the request currently being handled ("-" outside requests)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
 
-def setup_logging(log_level: str = "INFO") -> logging.Logger:
+# Attributes present on every LogRecord; anything else came in via `extra`
+_STANDARD_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime", "request_id", "sample_key"}
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request ID to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records
+
+    Records opt in with ``extra={"sample_key": "..."}``; the rate configured
+    for that key (0.0 - 1.0) decides how many are kept. WARNING and above are
+    never sampled, so errors are always logged in full.
+
+    Inside a request the decision comes from a hash of its request ID, so
+    all of a request's sampled lines are kept or dropped together (and a
+    request kept at a low rate is also kept at any higher one). Records
+    logged outside requests are sampled independently.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates: Dict[str, float] = dict(rates or {})
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        rate = self.rates.get(key, 1.0)
+        if rate >= 1.0:
+            return True
+        request_id = request_id_var.get()
+        if request_id == "-":
+            return random.random() < rate
+        return zlib.crc32(request_id.encode()) / 0x100000000 < rate
+
+
+class DuplicateSuppressionFilter(logging.Filter):
+    """
+    Collapse identical records during error storms
+
+    Records from the same logging call (logger, level, source line and
+    message template, whatever the arguments) are let through at most
+    ``burst`` times per time window. Further copies are dropped and counted.
+    When the window closes, the count is reported as ``repeat_count`` and a
+    note in the message: on the next copy if the call fires again, otherwise
+    in a summary record emitted as soon as any record reaches the filter.
+
+    Limits can be set per logger name as ``(window_seconds, burst)``; loggers
+    without an entry use the defaults. A window of 0 disables suppression.
+    """
+
+    def __init__(self, window: float = 10.0, burst: int = 1,
+                 limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 min_level: int = logging.WARNING, max_keys: int = 10000):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.limits: Dict[str, Tuple[float, int]] = dict(limits or {})
+        self.min_level = min_level
+        self.max_keys = max_keys
+        # key -> [window start, records let through, records suppressed,
+        #         last suppressed record]
+        self._state: Dict[Tuple, list] = {}
+        # Earliest end of a window with suppressed records (inf if none)
+        self._next_sweep = float("inf")
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "repeat_count", None) is not None:
+            # A summary emitted by this filter
+            return True
+        if record.created >= self._next_sweep:
+            self._emit_summaries(record)
+        if record.levelno < self.min_level:
+            return True
+        window, burst = self._limit(record.name)
+        if window <= 0:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.msg)
+        now = record.created
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None and now - state[0] < window:
+                if state[1] < burst:
+                    state[1] += 1
+                    return True
+                state[2] += 1
+                state[3] = record
+                self._next_sweep = min(self._next_sweep, state[0] + window)
+                return False
+            suppressed = state[2] if state is not None else 0
+            if state is None and len(self._state) >= self.max_keys:
+                self._prune(now)
+            self._state[key] = [now, 1, 0, None]
+        if suppressed:
+            record.repeat_count = suppressed
+            record.msg = f"{record.getMessage()} [repeated {suppressed} more times in {window:g}s]"
+            record.args = None
+        return True
+
+    def _limit(self, name: str) -> Tuple[float, int]:
+        return self.limits.get(name, (self.window, self.burst))
+
+    def _emit_summaries(self, current: logging.LogRecord) -> None:
+        """Report the counts of windows that closed without a further copy"""
+        now = current.created
+        current_key = (current.name, current.levelno, current.pathname, current.lineno,
+                       current.msg)
+        summaries = []
+        with self._lock:
+            next_sweep = float("inf")
+            for key, state in self._state.items():
+                if not state[2]:
+                    continue
+                end = state[0] + self._limit(key[0])[0]
+                if key == current_key and now >= end:
+                    # The current record reports this count itself
+                    continue
+                if now >= end:
+                    summaries.append((state[3], state[2], self._limit(key[0])[0]))
+                    state[2] = 0
+                    state[3] = None
+                else:
+                    next_sweep = min(next_sweep, end)
+            self._next_sweep = next_sweep
+        # Emit outside the lock; the summaries pass back through this filter
+        for last, count, window in summaries:
+            summary = logging.makeLogRecord(last.__dict__)
+            summary.msg = f"{last.getMessage()} [repeated {count} more times in {window:g}s]"
+            summary.args = None
+            summary.repeat_count = count
+            summary.created = now
+            logging.getLogger(last.name).handle(summary)
+
+    def _prune(self, now: float) -> None:
+        """Drop expired keys, or the oldest half if none have expired"""
+        expired = [
+            key for key, state in self._state.items()
+            if now - state[0] >= self._limit(key[0])[0]
+        ]
+        if not expired:
+            expired = sorted(self._state, key=lambda key: self._state[key][0])
+            expired = expired[:len(expired) // 2]
+        for key in expired:
+            del self._state[key]
+
+
+def parse_dedup_limits(value: Optional[str]) -> Dict[str, Tuple[float, int]]:
+    """
+    Parse per-logger limits from a "logger=window:burst,..." string
+
+    Args:
+        value: Limit specification, e.g. "fastapi_calculator=10:1,uvicorn.error=60:5"
+
+    Returns:
+        Mapping of logger name to (window seconds, burst)
+    """
+    limits: Dict[str, Tuple[float, int]] = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, spec = item.partition("=")
+        window, _, burst = spec.partition(":")
+        try:
+            limits[name.strip()] = (float(window), int(burst or 1))
+        except ValueError:
+            raise ValueError(f"Invalid dedup limit for '{name.strip()}': {spec!r}")
+    return limits
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "request_id": getattr(record, "request_id", request_id_var.get()),
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """
+    Rotate by size and/or time, gzip segments in the background
+
+    A rollover is a single rename of the live file to a timestamped segment
+    (``app.log.20250101-120000``); compression and retention run on a daemon
+    thread so the logging thread never waits on them. Retention removes
+    segments older than ``max_age_seconds`` and then the oldest segments
+    until all segments fit in ``max_total_bytes``.
+    """
+
+    def __init__(self, filename: Union[str, Path], max_bytes: int = 0,
+                 interval_seconds: float = 0, max_age_seconds: float = 0,
+                 max_total_bytes: int = 0, compress: bool = True,
+                 encoding: Optional[str] = "utf-8", delay: bool = False):
+        super().__init__(filename, "a", encoding=encoding, delay=delay)
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self.rollover_at = time.time() + interval_seconds if interval_seconds else 0
+        self._segments: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._maintenance_loop, name="log-compressor", daemon=True
+        )
+        self._worker.start()
+        # Pick up segments left uncompressed by a previous process
+        for segment in self.segments():
+            if not segment.endswith(".gz"):
+                self._segments.put(segment)
+        self._segments.put("")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at and record.created >= self.rollover_at:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            # Compare the size already written instead of formatting twice
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            segment = self._segment_name()
+            os.rename(self.baseFilename, segment)
+            self._segments.put(segment)
+        if self.interval_seconds:
+            self.rollover_at = time.time() + self.interval_seconds
+        if not self.delay:
+            self.stream = self._open()
+
+    def _segment_name(self) -> str:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        segment = f"{self.baseFilename}.{stamp}"
+        counter = 1
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            segment = f"{self.baseFilename}.{stamp}.{counter}"
+            counter += 1
+        return segment
+
+    def segments(self) -> List[str]:
+        """Return rotated segments of this file, oldest first"""
+        directory, base = os.path.split(self.baseFilename)
+        found = [
+            os.path.join(directory, name) for name in os.listdir(directory or ".")
+            if name.startswith(base + ".") and not name.endswith(".tmp")
+        ]
+        return sorted(found, key=lambda path: (os.path.getmtime(path), path))
+
+    def wait_for_maintenance(self) -> None:
+        """Block until all queued compression and retention work is done"""
+        self._segments.join()
+
+    def _maintenance_loop(self) -> None:
+        while True:
+            segment = self._segments.get()
+            try:
+                if segment is None:
+                    return
+                if segment and self.compress:
+                    self._compress(segment)
+                self._enforce_retention()
+            except Exception:
+                self.handleError(logging.makeLogRecord({"msg": f"Log maintenance failed for {segment}"}))
+            finally:
+                self._segments.task_done()
+
+    @staticmethod
+    def _compress(segment: str) -> None:
+        if not os.path.exists(segment):
+            return
+        tmp = segment + ".gz.tmp"
+        with open(segment, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        # Keep the segment's mtime so age-based retention stays accurate
+        stat = os.stat(segment)
+        os.utime(tmp, (stat.st_atime, stat.st_mtime))
+        os.replace(tmp, segment + ".gz")
+        os.remove(segment)
+
+    def _enforce_retention(self) -> None:
+        segments = self.segments()
+        if self.max_age_seconds:
+            cutoff = time.time() - self.max_age_seconds
+            expired = [path for path in segments if os.path.getmtime(path) < cutoff]
+            for path in expired:
+                os.remove(path)
+            segments = [path for path in segments if path not in expired]
+        if self.max_total_bytes:
+            sizes = [os.path.getsize(path) for path in segments]
+            total = sum(sizes)
+            for path, size in zip(segments, sizes):
+                if total <= self.max_total_bytes:
+                    break
+                os.remove(path)
+                total -= size
+
+    def close(self) -> None:
+        if self._worker.is_alive():
+            self._segments.put(None)
+            self._worker.join(timeout=10)
+        super().close()
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """
+    Parse sampling rates from a "key=rate,key=rate" string
+
+    Args:
+        value: Rate specification, e.g. "http.request=0.1,calculate=0.01"
+
+    Returns:
+        Mapping of sample key to rate clamped to 0.0 - 1.0
+    """
+    rates: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        key, _, rate = item.partition("=")
+        try:
+            rates[key.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            raise ValueError(f"Invalid sample rate for '{key.strip()}': {rate!r}")
+    return rates
+
+
+def setup_logging(log_level: str = "INFO", log_format: Optional[str] = None,
+                  sample_rates: Optional[Dict[str, float]] = None) -> logging.Logger:
     """
     Setup logging configuration with both file and console handlers
     
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        log_format: "text" or "json" (defaults to the LOG_FORMAT env variable)
+        sample_rates: Sampling rates per sample key (defaults to LOG_SAMPLE_RATES)
         
     Returns:
         Configured logger instance
@@ -31,41 +403,56 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
     if logger.handlers:
         return logger
     
+    log_format = (log_format or os.getenv("LOG_FORMAT", "text")).lower()
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))
+    
     # Create formatters
-    detailed_formatter = logging.Formatter(
-        fmt='%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s() - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    if log_format == "json":
+        detailed_formatter = simple_formatter = JsonFormatter()
+    else:
+        detailed_formatter = logging.Formatter(
+            fmt='%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s() - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        
+        simple_formatter = logging.Formatter(
+            fmt='%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     
-    simple_formatter = logging.Formatter(
-        fmt='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    # Sample high-volume records before any handler sees them
+    logger.addFilter(SamplingFilter(sample_rates))
+    
+    # Collapse duplicate WARNING+ records (off unless LOG_DEDUP_WINDOW is set)
+    dedup_filter = DuplicateSuppressionFilter(
+        window=float(os.getenv("LOG_DEDUP_WINDOW", "0")),
+        burst=int(os.getenv("LOG_DEDUP_BURST", "1")),
+        limits=parse_dedup_limits(os.getenv("LOG_DEDUP_LIMITS")),
     )
+    logger.addFilter(dedup_filter)
+    for name in dedup_filter.limits:
+        if name != logger.name:
+            logging.getLogger(name).addFilter(dedup_filter)
+    context_filter = RequestContextFilter()
     
     # Console Handler (INFO and above)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(simple_formatter)
+    console_handler.addFilter(context_filter)
     
     # File Handler - All logs (rotating)
-    file_handler = RotatingFileHandler(
-        filename=log_dir / "app.log",
-        maxBytes=10 * 1024 * 1024,  # 10 MB
-        backupCount=5,
-        encoding='utf-8'
-    )
+    file_handler = _create_file_handler(log_dir / "app.log")
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(detailed_formatter)
+    file_handler.addFilter(context_filter)
     
     # File Handler - Error logs only (rotating)
-    error_handler = RotatingFileHandler(
-        filename=log_dir / "error.log",
-        maxBytes=10 * 1024 * 1024,  # 10 MB
-        backupCount=5,
-        encoding='utf-8'
-    )
+    error_handler = _create_file_handler(log_dir / "error.log")
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(detailed_formatter)
+    error_handler.addFilter(context_filter)
     
     # Add handlers to logger
     logger.addHandler(console_handler)
@@ -75,13 +462,61 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
     # Log initialization
     logger.info("="*60)
     logger.info("FastAPI Calculator Logger Initialized")
-    logger.info(f"Log Level: {log_level.upper()}")
-    logger.info(f"Log Directory: {log_dir.absolute()}")
+    logger.info("Log Level: %s", log_level.upper())
+    logger.info("Log Format: %s", log_format)
+    logger.info("Log Directory: %s", log_dir.absolute())
     logger.info("="*60)
     
     return logger
 
 
+def _create_file_handler(path: Path) -> logging.Handler:
+    """
+    Create the rotating handler selected by LOG_ROTATION
+    
+    "size" (default) keeps five uncompressed 10 MB backups. "managed" rotates
+    by LOG_ROTATE_BYTES and/or LOG_ROTATE_INTERVAL seconds, gzips segments in
+    the background and keeps them for LOG_RETENTION_DAYS or until they exceed
+    LOG_RETENTION_BYTES in total.
+    
+    Args:
+        path: Log file path
+        
+    Returns:
+        Configured file handler
+    """
+    if os.getenv("LOG_ROTATION", "size").lower() == "managed":
+        return CompressingRotatingFileHandler(
+            filename=path,
+            max_bytes=int(os.getenv("LOG_ROTATE_BYTES", str(10 * 1024 * 1024))),
+            interval_seconds=float(os.getenv("LOG_ROTATE_INTERVAL", "0")),
+            max_age_seconds=float(os.getenv("LOG_RETENTION_DAYS", "30")) * 86400,
+            max_total_bytes=int(os.getenv("LOG_RETENTION_BYTES", str(50 * 1024 * 1024))),
+        )
+    return RotatingFileHandler(
+        filename=path,
+        maxBytes=10 * 1024 * 1024,  # 10 MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+
+
+def get_sampling_filter(logger: logging.Logger) -> Optional[SamplingFilter]:
+    """
+    Return the sampling filter installed by setup_logging, if any
+
+    Args:
+        logger: Logger configured by setup_logging
+
+    Returns:
+        SamplingFilter instance or None
+    """
+    for log_filter in logger.filters:
+        if isinstance(log_filter, SamplingFilter):
+            return log_filter
+    return None
+
+
 def get_logger(name: str = "fastapi_calculator") -> logging.Logger:
     """
     Get or create a logger instance
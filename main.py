@@ -1,85 +1,300 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, StrictInt
+from typing import Dict, List, Literal, Optional, Union
+from decimal import Decimal
+from fractions import Fraction
+from contextlib import ExitStack
+from datetime import date, datetime
+import asyncio
+import hmac
+import json
+import logging
+import math
+import os
+import re
 import time
-from operations import calculate, DivisionByZeroError, InvalidOperationError
-from logger_config import setup_logging, get_logger
+import uuid
+import numpy as np
+from operations import (
+    calculate, calculate_batch, to_mode, registry, BATCH_LIMITS, MODE_FLOAT,
+    DivisionByZeroError, InvalidOperationError, InvalidOperandError
+)
+from logger_config import setup_logging, get_logger, request_id_var
+from diagnostics import memory_diagnostics, DiagnosticsError
+from database import connect, fetch_daily_stats, DatabaseUnavailableError
+from history_store import create_history_store, NullHistoryStore, HistoryStoreError
+from recent_history import RecentHistory
+from parallel_engine import engine_from_env
+from export_calculations import iter_calculation_batches, iter_csv, DEFAULT_BATCH_SIZE
+from expressions import evaluate_expressions, MAX_EXPRESSIONS
+from uds_server import UnixSocketServer
+from usage import tracker_from_env, UsageError
+from rate_limit import api_keys_from_env, limiter_from_env, RateLimitMiddleware
+import tracing
+from log_control import control_from_env, LogControlError
+from tracing import span, record_since, current_span, tracer, TracingError
+from jobs import (
+    manager_from_env, FORMAT_F8, FORMAT_CSV, JobError, JobNotFoundError, JobNotReadyError
+)
+from metrics import metrics
+from idempotency import (
+    IdempotencyManager, MemoryIdempotencyStore, create_idempotency_store, fingerprint,
+    validate_key, IdempotencyError, IdempotencyKeyMismatchError, IdempotencyInProgressError
+)
 
 # Initialize logging
 logger = setup_logging()
 
+# Runtime log levels and sampling rates from LOG_CONTROL_FILE, shared by all
+# workers; applied now so startup logging already follows it
+log_control = control_from_env(logger)
+log_control.reload()
+
+# Request tracing (off unless TRACE_SAMPLE_RATE is set)
+try:
+    tracing.configure_from_env()
+except TracingError as e:
+    logger.error("Tracing disabled: %s", e)
+tracing.instrument_logging(logger)
+
+
+class TracedRoute(APIRoute):
+    """
+    Route adding validation and endpoint spans to sampled traces
+
+    The framework reads and validates the request between the route's
+    handler being called and the endpoint being called, so validation is
+    recorded as the time from one to the other.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        # FastAPI runs sync endpoints in a thread pool; the wrapper must stay sync
+        if asyncio.iscoroutinefunction(call):
+            async def traced_call(**values):
+                route_span = current_span()
+                if route_span is None:
+                    return await call(**values)
+                record_since("validation", route_span.perf_start)
+                with span("endpoint"):
+                    return await call(**values)
+        else:
+            def traced_call(**values):
+                route_span = current_span()
+                if route_span is None:
+                    return call(**values)
+                record_since("validation", route_span.perf_start)
+                with span("endpoint"):
+                    return call(**values)
+        self.dependant.call = traced_call
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request):
+            with span("route", path=self.path):
+                return await handler(request)
+
+        return traced_handler
+
 app = FastAPI(
     title="FastAPI Calculator",
     description="A simple calculator API built with FastAPI",
     version="1.0.0"
 )
 
+app.router.route_class = TracedRoute
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Log application startup
 logger.info("FastAPI Calculator application starting...")
 
+# Calculation history backend selected by DATABASE_URL
+try:
+    history_store = create_history_store()
+except HistoryStoreError as e:
+    logger.error("Calculation history disabled: %s", e)
+    history_store = NullHistoryStore()
+
+# Last calculations kept in memory for GET /history/recent
+recent_history = RecentHistory(int(os.getenv("RECENT_HISTORY_SIZE", "1000")))
+
+# Per-user usage counts, flushed to user_usage every few seconds
+usage_tracker = tracker_from_env()
+
+# Multi-core evaluation for large /calculate/array requests
+array_engine = engine_from_env()
+ARRAY_MAX_BYTES = int(os.getenv("ARRAY_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Stored first responses for retried POST /calculate requests
+try:
+    idempotency = IdempotencyManager(create_idempotency_store())
+except IdempotencyError as e:
+    logger.error("Falling back to in-memory idempotency keys: %s", e)
+    idempotency = IdempotencyManager(MemoryIdempotencyStore())
+
+# Optional binary listener for same-host clients, started with the app
+UDS_PATH = os.getenv("UDS_PATH")
+uds_server = None
+
+# Background jobs for inputs too large for one request (workers start lazily)
+job_manager = manager_from_env()
+
 
 @app.on_event("startup")
 async def startup_event():
     """Log application startup"""
+    global uds_server
     logger.info("FastAPI Calculator application started successfully")
     logger.info("API Documentation available at: /docs")
     logger.info("API Health check available at: /health")
+    job_manager.start()
+    log_control.start()
+    if UDS_PATH:
+        server = UnixSocketServer(UDS_PATH, on_result=lambda op, a, b, r: _record(op, a, b, r, None))
+        try:
+            await server.start()
+            uds_server = server
+        except OSError as e:
+            logger.error("Unix socket listener disabled: %s", e)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Log application shutdown"""
     logger.info("FastAPI Calculator application shutting down...")
+    history_store.close()
+    usage_tracker.close()
+    array_engine.close()
+    job_manager.close()
+    idempotency.close()
+    if uds_server is not None:
+        await uds_server.close()
+    tracer.close()
+    log_control.close()
+
+
+# Client-supplied request IDs are reused only if they look like IDs
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _request_id_from(request: Request) -> str:
+    """Reuse a sane X-Request-ID header or generate a new request ID"""
+    request_id = request.headers.get("x-request-id")
+    if request_id and _REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+    return uuid.uuid4().hex
 
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Middleware to log all HTTP requests"""
+    """Middleware to log all HTTP requests and trace sampled ones"""
     start_time = time.time()
+    request_id = _request_id_from(request)
+    token = request_id_var.set(request_id)
     
-    # Log request
-    logger.info(f"Incoming request: {request.method} {request.url.path}")
-    logger.debug(f"Request headers: {dict(request.headers)}")
-    
-    # Process request
-    try:
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        
-        # Log response
+    # Root span of the request's trace, if sampled
+    with tracer.trace("log_requests", traceparent=request.headers.get("traceparent"),
+                      method=request.method, path=request.url.path,
+                      request_id=request_id) as trace:
+        # Log request
         logger.info(
-            f"Request completed: {request.method} {request.url.path} - "
-            f"Status: {response.status_code} - Duration: {process_time:.3f}s"
+            "Incoming request: %s %s", request.method, request.url.path,
+            extra={"sample_key": "http.request"}
         )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request headers: %s", dict(request.headers))
+    
+        # Process request
+        try:
+            response = await call_next(request)
+            process_time = time.time() - start_time
         
-        # Add custom header with process time
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+            # Log response
+            logger.info(
+                "Request completed: %s %s - Status: %s - Duration: %.3fs",
+                request.method, request.url.path, response.status_code, process_time,
+                extra={"sample_key": "http.request"}
+            )
         
-    except Exception as e:
-        process_time = time.time() - start_time
-        logger.error(
-            f"Request failed: {request.method} {request.url.path} - "
-            f"Error: {str(e)} - Duration: {process_time:.3f}s",
-            exc_info=True
-        )
-        raise
+            # Add custom headers with process time and request ID
+            response.headers["X-Process-Time"] = str(process_time)
+            response.headers["X-Request-ID"] = request_id
+            if trace is not None:
+                trace.root.set(status_code=response.status_code)
+                response.headers["Server-Timing"] = trace.server_timing()
+            return response
+        
+        except Exception as e:
+            process_time = time.time() - start_time
+            logger.error(
+                "Request failed: %s %s - Error: %s - Duration: %.3fs",
+                request.method, request.url.path, e, process_time,
+                exc_info=True
+            )
+            raise
+        finally:
+            request_id_var.reset(token)
+
+# Per-client token buckets (off unless RATE_LIMIT_PER_SECOND is set). Added
+# after log_requests so it runs first and throttled requests stay cheap.
+rate_limiter = limiter_from_env()
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, api_keys=api_keys_from_env())
+
+# StrictInt first so JSON integers keep full precision for the exact modes
+Number = Union[StrictInt, float]
+NumericMode = Literal["float", "int", "decimal", "fraction"]
 
 class CalculationRequest(BaseModel):
-    num1: float
-    num2: float
+    num1: Number
+    num2: Number
     operation: str
+    user_id: Optional[int] = None
+    mode: NumericMode = "float"
 
 class CalculationResponse(BaseModel):
-    result: float
+    # Decimal and non-integral Fraction results are returned as strings
+    result: Union[StrictInt, float, str]
     operation: str
-    num1: float
-    num2: float
+    num1: Number
+    num2: Number
+
+
+def _operands(num1, num2, mode: str):
+    """Operands for calculate(): floats in float mode, as sent otherwise"""
+    if mode == MODE_FLOAT:
+        return to_mode(num1, mode), to_mode(num2, mode)
+    return num1, num2
+
+
+def _json_number(value):
+    """JSON-safe form of a result without losing precision"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Fraction):
+        return value.numerator if value.denominator == 1 else str(value)
+    return value
+
+
+def _record(operation: str, num1, num2, result, user_id: Optional[int]) -> None:
+    """Add a calculation to the history store, the recent-history buffer and usage counts"""
+    if user_id is not None:
+        usage_tracker.record(user_id, operation)
+    try:
+        num1, num2, result = float(num1), float(num2), float(result)
+    except OverflowError:
+        # Integers beyond float range cannot be kept in the float columns
+        return
+    history_store.record(operation, num1, num2, result, user_id)
+    recent_history.append(operation, num1, num2, result)
 
 @app.get("/")
 async def root():
@@ -87,6 +302,12 @@ async def root():
     logger.info("Root endpoint accessed - serving calculator interface")
     return FileResponse("static/index.html")
 
+@app.get("/sw.js")
+async def service_worker():
+    """Serve the web interface's service worker from the root so it controls /"""
+    return FileResponse("static/sw.js", media_type="application/javascript",
+                        headers={"Cache-Control": "no-cache", "Service-Worker-Allowed": "/"})
+
 @app.get("/api")
 async def api_info():
     """API information endpoint"""
@@ -96,51 +317,699 @@ async def api_info():
         "endpoints": {
             "/": "Calculator web interface",
             "/docs": "API documentation",
-            "/calculate": "Perform calculations"
+            "/calculate": "Perform calculations",
+            "/calculate/batch": "Perform many calculations in one request",
+            "/calculate/array/{operation}": "Apply an operation to raw float64 arrays",
+            "/calculate/expressions": "Evaluate expressions, sharing common subexpressions",
+            "/operations": "Supported operations",
+            "/history/recent": "Most recent calculations (in memory)",
+            "/history/batch": "Record calculations evaluated by the web interface",
+            "/stats": "Per-user calculation statistics",
+            "/users/{user_id}/usage": "Per-user calculation counts for quotas",
+            "/calculations/export": "Stream calculation history as CSV",
+            "/jobs": "Background jobs for very large inputs",
+            "/metrics": "Service metrics (Prometheus format)"
         }
     }
 
 @app.post("/calculate", response_model=CalculationResponse)
-async def calculate_endpoint(request: CalculationRequest):
+async def calculate_endpoint(request: CalculationRequest,
+                             idempotency_key: Optional[str] = Header(default=None)):
     """
     Perform basic arithmetic calculations
     
-    Operations supported:
-    - add: Addition
-    - subtract: Subtraction
-    - multiply: Multiplication
-    - divide: Division
+    Built-in operations are add, subtract, multiply and divide; GET /operations
+    lists everything registered, including plugin operations.
+
+    mode selects the arithmetic: float (default), int (exact integers),
+    decimal or fraction (arbitrary precision).
+
+    With an Idempotency-Key header the first response for the key is stored
+    and replayed (with Idempotent-Replayed: true) for retries, which are not
+    computed or recorded again. A retry arriving while the first request is
+    still running waits for its result.
+    """
+    if idempotency_key is None:
+        return _calculate_response(request)
+    return await _idempotent_response(idempotency_key, request, _calculate_response)
+
+
+async def _idempotent_response(idempotency_key: str, request: BaseModel, respond) -> Response:
+    """
+    Run respond(request) once per Idempotency-Key and replay its response
+
+    respond is synchronous and runs in the threadpool, so a large batch
+    does not hold up the event loop.
     """
+    try:
+        key = validate_key(idempotency_key)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def compute():
+        try:
+            response = await run_in_threadpool(respond, request)
+        except HTTPException as e:
+            # Server errors are not stored, so a retry can succeed
+            if e.status_code >= 500:
+                raise
+            return e.status_code, json.dumps({"detail": e.detail}).encode()
+        return 200, response.model_dump_json().encode()
+
+    try:
+        status_code, body, replayed = await idempotency.run(
+            key, fingerprint(request.model_dump()), compute
+        )
+    except IdempotencyKeyMismatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else {}
+    return Response(content=body, status_code=status_code, media_type="application/json",
+                    headers=headers)
+
+
+def _calculate_response(request: CalculationRequest) -> CalculationResponse:
+    """Compute, record and log one calculation; errors become HTTPException"""
     logger.info(
-        f"Calculate endpoint called with: num1={request.num1}, "
-        f"num2={request.num2}, operation={request.operation}"
+        "Calculate endpoint called with: num1=%s, num2=%s, operation=%s",
+        request.num1, request.num2, request.operation,
+        extra={"sample_key": "calculate"}
     )
     
     try:
-        result = calculate(request.num1, request.num2, request.operation)
-        logger.info(f"Calculation successful, returning result: {result}")
+        num1, num2 = _operands(request.num1, request.num2, request.mode)
+        result = calculate(num1, num2, request.operation, request.mode)
+        operation = request.operation.lower()
+        _record(operation, num1, num2, result, request.user_id)
+        logger.info(
+            "Calculation successful, returning result: %s", result,
+            extra={"sample_key": "calculate"}
+        )
         return CalculationResponse(
-            result=result,
-            operation=request.operation.lower(),
-            num1=request.num1,
-            num2=request.num2
+            result=_json_number(result),
+            operation=operation,
+            num1=num1,
+            num2=num2
         )
     except DivisionByZeroError as e:
-        logger.warning(f"Division by zero error: {str(e)}")
+        logger.warning("Division by zero error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except InvalidOperationError as e:
-        logger.warning(f"Invalid operation error: {str(e)}")
+        logger.warning("Invalid operation error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except InvalidOperandError as e:
+        logger.warning("Invalid operand error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Unexpected error in calculate endpoint: {str(e)}", exc_info=True)
+        logger.error("Unexpected error in calculate endpoint: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+class OperationInfo(BaseModel):
+    name: str
+    code: int
+    cost_class: str
+    vectorized: bool
+    description: str
+
+
+@app.get("/operations", response_model=List[OperationInfo])
+async def operations_endpoint():
+    """List the registered operations"""
+    return [
+        OperationInfo(
+            name=op.name, code=op.code, cost_class=op.cost_class,
+            vectorized=op.vectorized is not None, description=op.description
+        )
+        for op in registry
+    ]
+
+
+class BatchItem(BaseModel):
+    num1: Number
+    num2: Number
+    operation: str
+    user_id: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    mode: NumericMode = "float"
+
+class BatchItemResult(BaseModel):
+    result: Union[StrictInt, float, str, None] = None
+    error: Optional[str] = None
+    operation: str
+    num1: Number
+    num2: Number
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+@app.post("/calculate/batch", response_model=BatchResponse)
+def calculate_batch_endpoint(request: BatchRequest):
+    """
+    Perform many calculations in one request
+
+    Items are grouped by operation and evaluated with vectorized kernels
+    where available. A failing item (unknown operation, division by zero,
+    a result too large for a float) carries an error instead of a result;
+    the others still succeed. The batch size limit depends on the cost
+    class of the operations used.
+    """
+    try:
+        items = [(*_operands(item.num1, item.num2, request.mode), item.operation.lower())
+                 for item in request.items]
+    except InvalidOperandError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cost_classes = {registry.get(name).cost_class for name in {i[2] for i in items} if name in registry}
+    limit = min((BATCH_LIMITS[cost] for cost in cost_classes), default=max(BATCH_LIMITS.values()))
+    if not 1 <= len(items) <= limit:
+        raise HTTPException(status_code=400, detail=f"Batch must contain between 1 and {limit} items")
+
+    results = []
+    outcomes = calculate_batch(items, request.mode)
+    for item, (num1, num2, operation), outcome in zip(request.items, items, outcomes):
+        if isinstance(outcome, float) and not math.isfinite(outcome):
+            outcome = InvalidOperandError("Result out of range")
+        if isinstance(outcome, Exception):
+            results.append(BatchItemResult(error=str(outcome), operation=operation, num1=num1, num2=num2))
+            continue
+        _record(operation, num1, num2, outcome, item.user_id)
+        results.append(BatchItemResult(
+            result=_json_number(outcome), operation=operation, num1=num1, num2=num2
+        ))
+    return BatchResponse(results=results)
+
+
+class ExpressionBatchRequest(BaseModel):
+    expressions: List[str]
+
+class ExpressionResult(BaseModel):
+    expression: str
+    result: Optional[float] = None
+    error: Optional[str] = None
+
+class ExpressionReport(BaseModel):
+    expressions: int
+    operations_submitted: int
+    operations_evaluated: int
+    operations_saved: int
+    savings_ratio: float
+    kernel_calls: int
+    depth: int
+
+class ExpressionBatchResponse(BaseModel):
+    results: List[ExpressionResult]
+    report: ExpressionReport
+
+@app.post("/calculate/expressions", response_model=ExpressionBatchResponse)
+def calculate_expressions_endpoint(request: ExpressionBatchRequest):
+    """
+    Evaluate a batch of arithmetic expressions, sharing common subexpressions
+
+    Expressions use numbers, parentheses, + - * / and registered operations
+    called as functions, e.g. "(1.5 + 2) / 4" or "divide(add(1, 2), 4)".
+    All expressions are merged into one DAG in which identical
+    subexpressions are evaluated once, vectorized across the batch; the
+    report says how many operations that saved. A failing expression
+    carries an error instead of a result. Results are not recorded in the
+    calculation history.
+    """
+    if not 1 <= len(request.expressions) <= MAX_EXPRESSIONS:
+        raise HTTPException(
+            status_code=400, detail=f"Batch must contain between 1 and {MAX_EXPRESSIONS} expressions"
+        )
+    outcomes, report = evaluate_expressions(request.expressions)
+    results = [
+        ExpressionResult(expression=expression, error=str(outcome))
+        if isinstance(outcome, Exception) else ExpressionResult(expression=expression, result=outcome)
+        for expression, outcome in zip(request.expressions, outcomes)
+    ]
+    return ExpressionBatchResponse(results=results, report=ExpressionReport(**report.to_dict()))
+
+
+def _header_length(request: Request, name: str) -> int:
+    """Byte length from a request header; must be a multiple of 8"""
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{name} header with a byte length is required")
+    if value < 0 or value % 8:
+        raise HTTPException(status_code=400, detail=f"{name} must be a multiple of 8 bytes")
+    return value
+
+
+async def _read_array_body(request: Request, expected: int) -> bytearray:
+    """
+    Stream the request body into a buffer of the declared size
+
+    Stops reading with 413 as soon as the body passes ARRAY_MAX_BYTES, so an
+    oversized or mislabelled upload is never held in memory.
+
+    Raises:
+        HTTPException: 413 past ARRAY_MAX_BYTES, 400 if the body length
+            does not match the length headers
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > ARRAY_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Arrays larger than {ARRAY_MAX_BYTES} bytes")
+    body = bytearray(expected)
+    received = 0
+    async for chunk in request.stream():
+        end = received + len(chunk)
+        if end > ARRAY_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Arrays larger than {ARRAY_MAX_BYTES} bytes")
+        if end > expected:
+            raise HTTPException(status_code=400, detail="Body length does not match the length headers")
+        body[received:end] = chunk
+        received = end
+    if received != expected:
+        raise HTTPException(status_code=400, detail="Body length does not match the length headers")
+    return body
+
+
+@app.post("/calculate/array/{operation}")
+async def calculate_array_endpoint(operation: str, request: Request):
+    """
+    Apply an operation to two packed float64 arrays
+
+    The body is num1 followed by num2, both little-endian float64, with
+    their byte lengths in X-Num1-Length and X-Num2-Length. The body is
+    streamed into one buffer of that size, which the arrays wrap with
+    numpy.frombuffer without copying. The response body is the
+    float64 results followed by a bitmask of invalid rows (e.g. division by
+    zero; bit i of the mask is row i, least significant bit first, and the
+    result is NaN), with lengths in X-Result-Length and X-Mask-Length.
+    """
+    num1_bytes = _header_length(request, "x-num1-length")
+    num2_bytes = _header_length(request, "x-num2-length")
+    if num1_bytes != num2_bytes:
+        raise HTTPException(status_code=400, detail="num1 and num2 must have the same length")
+    if num1_bytes + num2_bytes > ARRAY_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Arrays larger than {ARRAY_MAX_BYTES} bytes")
+    try:
+        op = registry.get(operation.lower())
+    except InvalidOperationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if op.vectorized is None:
+        raise HTTPException(status_code=400, detail=f"Operation {op.name} has no array kernel")
+
+    body = await _read_array_body(request, num1_bytes + num2_bytes)
+    count = num1_bytes // 8
+    num1 = np.frombuffer(body, dtype="<f8", count=count)
+    num2 = np.frombuffer(body, dtype="<f8", count=count, offset=num1_bytes)
+
+    results, invalid = await run_in_threadpool(array_engine.calculate, num1, num2, op)
+    results = results.astype("<f8", copy=False)
+    mask = np.packbits(invalid, bitorder="little")
+    invalid_count = int(invalid.sum())
+    logger.info(
+        "Array calculation: %s over %d rows (%d invalid)", op.name, count, invalid_count,
+        extra={"sample_key": "calculate"}
+    )
+    return Response(
+        content=b"".join((memoryview(results), memoryview(mask))),
+        media_type="application/octet-stream",
+        headers={
+            "X-Result-Length": str(results.nbytes),
+            "X-Mask-Length": str(mask.nbytes),
+            "X-Invalid-Count": str(invalid_count),
+        },
+    )
+
+
+class RecentCalculation(BaseModel):
+    operation: str
+    num1: float
+    num2: float
+    result: float
+    timestamp: datetime
+
+
+@app.get("/history/recent", response_model=List[RecentCalculation])
+async def recent_history_endpoint(limit: int = 50):
+    """
+    Most recent successful calculations, newest first
+
+    Served from an in-memory ring buffer of RECENT_HISTORY_SIZE entries
+    (default 1000), so it works without a database and resets on restart.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return recent_history.recent(limit)
+
+
+# Largest batch of locally evaluated calculations the web interface may sync at once
+HISTORY_BATCH_MAX = 1000
+
+
+class HistoryItem(BaseModel):
+    operation: str
+    num1: float
+    num2: float
+    result: float
+    user_id: Optional[int] = None
+
+class HistoryBatchRequest(BaseModel):
+    items: List[HistoryItem]
+
+class HistoryBatchResponse(BaseModel):
+    recorded: int
+    rejected: List[int]
+
+@app.post("/history/batch", response_model=HistoryBatchResponse)
+async def history_batch_endpoint(request: HistoryBatchRequest,
+                                 idempotency_key: Optional[str] = Header(default=None)):
+    """
+    Record calculations the web interface evaluated locally
+
+    Each item is evaluated again in float mode and recorded only if the
+    server's result matches; the indexes of the others (unknown operation,
+    division by zero, different result) are returned as rejected. Send an
+    Idempotency-Key so a retried sync is not recorded twice.
+    """
+    if idempotency_key is None:
+        return await run_in_threadpool(_record_history_batch, request)
+    return await _idempotent_response(idempotency_key, request, _record_history_batch)
+
+
+def _record_history_batch(request: HistoryBatchRequest) -> HistoryBatchResponse:
+    """Check and record a batch from POST /history/batch"""
+    if not 1 <= len(request.items) <= HISTORY_BATCH_MAX:
+        raise HTTPException(status_code=400,
+                            detail=f"Batch must contain between 1 and {HISTORY_BATCH_MAX} items")
+    items = [(item.num1, item.num2, item.operation.lower()) for item in request.items]
+    rejected = []
+    for index, (item, (num1, num2, operation), outcome) in enumerate(
+            zip(request.items, items, calculate_batch(items))):
+        if isinstance(outcome, Exception) or float(outcome) != item.result:
+            rejected.append(index)
+            continue
+        _record(operation, num1, num2, outcome, item.user_id)
+    logger.info("Recorded %d synced calculations, rejected %d",
+                len(items) - len(rejected), len(rejected))
+    return HistoryBatchResponse(recorded=len(items) - len(rejected), rejected=rejected)
+
+
+class StatsRow(BaseModel):
+    user_id: int
+    operation: str
+    day: Optional[date] = None
+    count: int
+    sum: float
+    min: float
+    max: float
+    avg: Optional[float] = None
+    last_activity: datetime
+
+
+@app.get("/stats", response_model=List[StatsRow])
+def stats_endpoint(user_id: Optional[int] = None, operation: Optional[str] = None,
+                   start: Optional[date] = None, end: Optional[date] = None,
+                   granularity: Literal["day", "total"] = "day", limit: int = 1000):
+    """
+    Per-user, per-operation calculation statistics
+
+    Served from the calculation_daily_stats rollup (sql/08_calculation_rollups.sql),
+    so the cost depends on the number of (user, operation, day) groups rather
+    than the size of the calculations table.
+    """
+    if not 1 <= limit <= 10000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10000")
+    try:
+        with connect() as conn:
+            return fetch_daily_stats(conn, user_id, operation, start, end, granularity, limit)
+    except DatabaseUnavailableError as e:
+        logger.warning("Stats unavailable: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+class UsageResponse(BaseModel):
+    user_id: int
+    total: int
+    unflushed: int
+    operations: Dict[str, int]
+
+
+@app.get("/users/{user_id}/usage", response_model=UsageResponse)
+def usage_endpoint(user_id: int):
+    """
+    Calculation counts per operation for a user
+
+    Totals already flushed to the user_usage table (sql/09_user_usage.sql)
+    plus the counts still held in memory; unflushed is the part not yet
+    written. Without a database only the in-memory counts since startup
+    are available.
+    """
+    try:
+        operations, unflushed = usage_tracker.usage(user_id)
+    except UsageError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return UsageResponse(user_id=user_id, total=sum(operations.values()), unflushed=unflushed,
+                         operations=operations)
+
+
+@app.get("/calculations/export")
+def export_endpoint(user_id: Optional[int] = None, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Stream calculation history as CSV
+
+    Rows are read through a server-side cursor and sent one batch per chunk,
+    so memory stays bounded by batch_size. start is inclusive, end exclusive.
+    """
+    if not 1 <= batch_size <= 100000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 100000")
+    # Connect before the response starts so failures still map to 503
+    stack = ExitStack()
+    try:
+        conn = stack.enter_context(connect())
+        batches = iter_calculation_batches(conn, user_id, start, end, batch_size)
+    except DatabaseUnavailableError as e:
+        stack.close()
+        logger.warning("Export unavailable: %s", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception:
+        stack.close()
+        raise
+
+    def body():
+        try:
+            yield from iter_csv(batches)
+        finally:
+            stack.close()
+
+    logger.info("Export started: user_id=%s start=%s end=%s", user_id, start, end)
+    return StreamingResponse(
+        body(), media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="calculations.csv"'},
+    )
+
+
+class JobStatus(BaseModel):
+    id: str
+    operation: str
+    format: str
+    status: str
+    rows: Optional[int] = None
+    chunks: Optional[int] = None
+    chunks_done: int
+    rows_done: int
+    invalid_rows: int
+    progress: float
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def create_job_endpoint(request: Request, operation: str,
+                              format: Literal["f8", "csv"] = FORMAT_F8,
+                              path: Optional[str] = None):
+    """
+    Submit a background calculation job
+
+    The input is either the request body or, with path, a file under
+    JOB_INPUT_DIR on the server. Format f8 is packed little-endian float64
+    (num1, num2) pairs; csv needs num1 and num2 columns. Poll GET /jobs/{id}
+    for progress and fetch GET /jobs/{id}/result once completed.
+    """
+    try:
+        if path is not None:
+            job = await run_in_threadpool(job_manager.submit_path, operation, format, path)
+        else:
+            job = await run_in_threadpool(job_manager.create, operation, format)
+            try:
+                with open(job_manager.upload_path(job), "wb") as handle:
+                    async for block in request.stream():
+                        await run_in_threadpool(handle.write, block)
+            except Exception as e:
+                job_manager.discard(job, f"Upload failed: {e}")
+                raise
+            job_manager.submit(job)
+    except JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status_endpoint(job_id: str):
+    """Status and progress of a job"""
+    try:
+        return job_manager.get(job_id).to_dict()
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result_endpoint(job_id: str, part: Literal["results", "mask"] = "results"):
+    """
+    Stream the output of a completed job
+
+    f8 jobs return float64 results per row (NaN where invalid), or with
+    part=mask the invalid-row bitmask (least significant bit first). csv
+    jobs return result,error lines.
+    """
+    try:
+        body = job_manager.iter_result(job_id, part)
+        job = job_manager.get(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except JobNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job.format == FORMAT_CSV:
+        return StreamingResponse(
+            body, media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{job_id}.csv"'},
+        )
+    return StreamingResponse(
+        body, media_type="application/octet-stream",
+        headers={"X-Row-Count": str(job.rows), "X-Invalid-Count": str(job.invalid_rows)},
+    )
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Service metrics in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     logger.debug("Health check endpoint accessed")
     return {"status": "healthy"}
 
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Guard for admin endpoints
+
+    Admin endpoints are disabled unless the ADMIN_TOKEN environment variable
+    is set, and every call must send the same value in X-Admin-Token.
+    """
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, expected):
+        logger.warning("Rejected admin request with missing or invalid token")
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class LoggingSettingsRequest(BaseModel):
+    levels: Dict[str, Optional[str]] = {}
+    sample_rates: Dict[str, Optional[float]] = {}
+
+
+@app.get("/admin/logging", dependencies=[Depends(require_admin)])
+def logging_status():
+    """Return effective logger levels, sample rates and runtime overrides"""
+    return log_control.status()
+
+
+@app.patch("/admin/logging", dependencies=[Depends(require_admin)])
+def logging_update(request: LoggingSettingsRequest):
+    """
+    Change logger levels and sampling rates at runtime
+
+    Levels (DEBUG ... CRITICAL) are set per logger name and sample rates
+    (0.0 - 1.0) per sample key; null removes an override. The settings are
+    written to LOG_CONTROL_FILE, which every worker polls, so the change
+    reaches all workers within LOG_CONTROL_POLL_SECONDS.
+    """
+    try:
+        return log_control.update(request.model_dump())
+    except LogControlError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+class MemoryTraceStartRequest(BaseModel):
+    nframes: int = 1
+
+
+@app.get("/admin/diagnostics/memory", dependencies=[Depends(require_admin)])
+async def memory_status():
+    """Return tracemalloc state and stored snapshots"""
+    return memory_diagnostics.status()
+
+
+@app.post("/admin/diagnostics/memory/start", dependencies=[Depends(require_admin)])
+async def memory_start(request: Optional[MemoryTraceStartRequest] = None):
+    """Start tracing memory allocations"""
+    nframes = request.nframes if request else 1
+    try:
+        return memory_diagnostics.start(nframes)
+    except DiagnosticsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/admin/diagnostics/memory/stop", dependencies=[Depends(require_admin)])
+async def memory_stop():
+    """Stop tracing memory allocations and drop snapshots"""
+    return memory_diagnostics.stop()
+
+
+# Snapshots, statistics and dumps walk the whole traced heap; these are plain
+# def so FastAPI runs them in the threadpool instead of on the event loop
+@app.post("/admin/diagnostics/memory/snapshots", dependencies=[Depends(require_admin)])
+def memory_take_snapshot():
+    """Take a tracemalloc snapshot"""
+    try:
+        snapshot_id = memory_diagnostics.take_snapshot()
+    except DiagnosticsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": snapshot_id}
+
+
+@app.get("/admin/diagnostics/memory/snapshots/{snapshot_id}",
+         dependencies=[Depends(require_admin)])
+def memory_top(snapshot_id: str, limit: int = Query(20, ge=1), key_type: str = "lineno",
+               dump: bool = False):
+    """Return the top allocation sites of a snapshot"""
+    try:
+        report = memory_diagnostics.top(snapshot_id, limit, key_type)
+    except DiagnosticsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dump:
+        report["dump_path"] = str(memory_diagnostics.dump(report, snapshot_id))
+    return report
+
+
+@app.get("/admin/diagnostics/memory/diff", dependencies=[Depends(require_admin)])
+def memory_diff(base: str, target: str, limit: int = Query(20, ge=1),
+                key_type: str = "lineno", dump: bool = False):
+    """Return allocation growth between two snapshots"""
+    try:
+        report = memory_diagnostics.diff(base, target, limit, key_type)
+    except DiagnosticsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if dump:
+        report["dump_path"] = str(memory_diagnostics.dump(report, f"{base}-{target}"))
+    return report
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting uvicorn server on http://0.0.0.0:8000")
@@ -1,12 +1,34 @@
 """
 Calculator operations module
-Contains all arithmetic calculation functions
+Contains all arithmetic calculation functions and the operation registry
 """
+import decimal
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from fractions import Fraction
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type, Union
+
 from logger_config import get_logger
+from tracing import span
+
+try:
+    import numpy as np
+except ImportError:  # batches fall back to the scalar functions
+    np = None
 
 # Initialize logger
 logger = get_logger(__name__)
 
+# Compact operation codes, shared with the operation_codes table in
+# sql/06_partitioned_calculations.sql and the recent-history buffer
+OPERATION_CODES = {
+    "add": 1,
+    "subtract": 2,
+    "multiply": 3,
+    "divide": 4,
+}
+
 
 class DivisionByZeroError(Exception):
     """Custom exception for division by zero"""
@@ -18,6 +40,11 @@ class InvalidOperationError(Exception):
     pass
 
 
+class InvalidOperandError(Exception):
+    """Custom exception for operands or results not representable in a numeric mode"""
+    pass
+
+
 def add(num1: float, num2: float) -> float:
     """
     Add two numbers
@@ -29,9 +56,9 @@ def add(num1: float, num2: float) -> float:
     Returns:
         Sum of num1 and num2
     """
-    logger.debug(f"Addition: {num1} + {num2}")
+    logger.debug("Addition: %s + %s", num1, num2)
     result = num1 + num2
-    logger.debug(f"Addition result: {result}")
+    logger.debug("Addition result: %s", result)
     return result
 
 
@@ -46,9 +73,9 @@ def subtract(num1: float, num2: float) -> float:
     Returns:
         Difference of num1 and num2
     """
-    logger.debug(f"Subtraction: {num1} - {num2}")
+    logger.debug("Subtraction: %s - %s", num1, num2)
     result = num1 - num2
-    logger.debug(f"Subtraction result: {result}")
+    logger.debug("Subtraction result: %s", result)
     return result
 
 
@@ -63,9 +90,9 @@ def multiply(num1: float, num2: float) -> float:
     Returns:
         Product of num1 and num2
     """
-    logger.debug(f"Multiplication: {num1} * {num2}")
+    logger.debug("Multiplication: %s * %s", num1, num2)
     result = num1 * num2
-    logger.debug(f"Multiplication result: {result}")
+    logger.debug("Multiplication result: %s", result)
     return result
 
 
@@ -83,55 +110,421 @@ def divide(num1: float, num2: float) -> float:
     Raises:
         DivisionByZeroError: If num2 is zero
     """
-    logger.debug(f"Division: {num1} / {num2}")
+    logger.debug("Division: %s / %s", num1, num2)
     if num2 == 0:
-        logger.error(f"Division by zero attempted: {num1} / {num2}")
+        logger.error("Division by zero attempted: %s / %s", num1, num2)
         raise DivisionByZeroError("Cannot divide by zero")
     result = num1 / num2
-    logger.debug(f"Division result: {result}")
+    logger.debug("Division result: %s", result)
     return result
 
 
-def calculate(num1: float, num2: float, operation: str) -> float:
+# Cost classes: how expensive one evaluation is, used to size batches
+COST_CHEAP = "cheap"
+COST_MODERATE = "moderate"
+COST_EXPENSIVE = "expensive"
+COST_CLASSES = (COST_CHEAP, COST_MODERATE, COST_EXPENSIVE)
+
+# Largest batch accepted per request, by the costliest operation in it
+BATCH_LIMITS = {COST_CHEAP: 10000, COST_MODERATE: 1000, COST_EXPENSIVE: 100}
+
+# Entry point group third-party packages use to add operations, e.g. in
+# pyproject.toml:
+#   [project.entry-points."fastapi_calculator.operations"]
+#   power = "my_package.ops:power_operation"
+ENTRY_POINT_GROUP = "fastapi_calculator.operations"
+
+# Numeric modes. "float" is the default and skips all conversion; "int" is
+# exact integer arithmetic on Python ints; "decimal" and "fraction" are
+# arbitrary precision. Float operands are read as their shortest decimal
+# form, so 0.1 becomes Decimal("0.1") / Fraction(1, 10).
+MODE_FLOAT = "float"
+MODE_INT = "int"
+MODE_DECIMAL = "decimal"
+MODE_FRACTION = "fraction"
+NUMERIC_MODES = (MODE_FLOAT, MODE_INT, MODE_DECIMAL, MODE_FRACTION)
+
+# Built once and reused for every decimal-mode calculation
+DECIMAL_CONTEXT = decimal.Context(
+    prec=int(os.getenv("DECIMAL_PRECISION", "50")),
+    traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow],
+)
+
+
+def to_mode(value, mode: str):
+    """
+    Convert an operand to the number type of a numeric mode
+
+    Args:
+        value: int or float operand
+        mode: One of NUMERIC_MODES
+
+    Returns:
+        The operand as float, int, Decimal or Fraction
+
+    Raises:
+        InvalidOperandError: If the value cannot be represented exactly
+        InvalidOperationError: If the mode is unknown
+    """
+    try:
+        if mode == MODE_FLOAT:
+            return float(value)
+        if mode == MODE_INT:
+            if isinstance(value, int):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            raise InvalidOperandError(f"Integer mode requires whole numbers, got {value}")
+        if mode == MODE_DECIMAL:
+            return DECIMAL_CONTEXT.create_decimal(value if isinstance(value, int) else repr(value))
+        if mode == MODE_FRACTION:
+            return Fraction(value if isinstance(value, int) else repr(value))
+    except (OverflowError, ValueError, decimal.InvalidOperation) as e:
+        raise InvalidOperandError(f"Cannot use {value} in {mode} mode: {e}")
+    raise InvalidOperationError(
+        f"Invalid numeric mode: {mode}. Supported modes: {', '.join(NUMERIC_MODES)}"
+    )
+
+
+@dataclass(frozen=True)
+class ValidationRule:
+    """
+    A precondition on the operands
+
+    invalid(num1, num2) must work on scalars and on numpy arrays alike
+    (returning a bool or a boolean mask), so one rule serves both paths.
+    """
+    invalid: Callable[[Any, Any], Any]
+    message: str
+    error: Type[Exception] = InvalidOperationError
+
+    def check(self, num1, num2) -> None:
+        """Raise the rule's error if the operands violate it"""
+        if self.invalid(num1, num2):
+            raise self.error(self.message)
+
+
+@dataclass(frozen=True)
+class Operation:
+    """
+    A registered operation
+
+    Args:
+        name: Name used in requests (lower case)
+        code: Compact code for storage; must fit in a uint8
+        scalar: Function of two numbers
+        vectorized: Optional kernel taking two numpy arrays
+        cost_class: One of COST_CLASSES
+        validators: Rules checked before evaluating
+        description: Short description for the API
+        mode_functions: Scalar functions replacing scalar in specific
+            numeric modes (e.g. exact integer division)
+        commutative: Whether operand order never changes the result, so
+            op(a, b) and op(b, a) can share one evaluation
+    """
+    name: str
+    code: int
+    scalar: Callable[[Any, Any], Any]
+    vectorized: Optional[Callable[[Any, Any], Any]] = None
+    cost_class: str = COST_CHEAP
+    validators: Tuple[ValidationRule, ...] = ()
+    description: str = ""
+    mode_functions: Dict[str, Callable[[Any, Any], Any]] = field(default_factory=dict)
+    commutative: bool = False
+
+
+class OperationRegistry:
+    """Operations by name and code, built once at import"""
+
+    def __init__(self):
+        self._by_name: Dict[str, Operation] = {}
+        self._by_code: Dict[int, Operation] = {}
+
+    def register(self, operation: Operation, replace: bool = False) -> Operation:
+        """
+        Add an operation
+
+        Raises:
+            ValueError: If the name or code is taken (unless replace) or the
+                operation is malformed
+        """
+        if operation.name != operation.name.lower() or not operation.name:
+            raise ValueError(f"Operation names must be lower case: {operation.name!r}")
+        if not 0 < operation.code < 256:
+            raise ValueError(f"Operation code must be between 1 and 255: {operation.code}")
+        if operation.cost_class not in COST_CLASSES:
+            raise ValueError(f"Unknown cost class: {operation.cost_class}")
+        unknown_modes = set(operation.mode_functions) - set(NUMERIC_MODES)
+        if unknown_modes:
+            raise ValueError(f"Unknown numeric modes: {', '.join(sorted(unknown_modes))}")
+        existing = self._by_code.get(operation.code)
+        if not replace:
+            if operation.name in self._by_name:
+                raise ValueError(f"Operation already registered: {operation.name}")
+            if existing is not None:
+                raise ValueError(f"Operation code {operation.code} already used by {existing.name}")
+        elif existing is not None and existing.name != operation.name:
+            raise ValueError(f"Operation code {operation.code} already used by {existing.name}")
+        previous = self._by_name.pop(operation.name, None)
+        if previous is not None:
+            del self._by_code[previous.code]
+        self._by_name[operation.name] = operation
+        self._by_code[operation.code] = operation
+        return operation
+
+    def get(self, name: str) -> Operation:
+        """
+        Look up an operation by (lower-case) name
+
+        Raises:
+            InvalidOperationError: If there is no such operation
+        """
+        operation = self._by_name.get(name)
+        if operation is None:
+            logger.error("Invalid operation requested: %s", name)
+            raise InvalidOperationError(
+                f"Invalid operation: {name}. "
+                f"Supported operations: {', '.join(self._by_name)}"
+            )
+        return operation
+
+    def by_code(self, code: int) -> Operation:
+        """Look up an operation by code (KeyError if unknown)"""
+        return self._by_code[code]
+
+    def names(self) -> List[str]:
+        """Registered operation names in registration order"""
+        return list(self._by_name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP) -> List[str]:
+        """
+        Register operations published by installed packages
+
+        Each entry point must resolve to an Operation, an iterable of
+        Operations, or a callable returning either. A broken plugin is
+        logged and skipped so it cannot keep the service from starting.
+
+        Returns:
+            Names of the operations added
+        """
+        from importlib.metadata import entry_points
+
+        found = entry_points()
+        # Python 3.9 returns a dict of groups, later versions a selectable collection
+        found = found.select(group=group) if hasattr(found, "select") else found.get(group, ())
+        added = []
+        for entry_point in found:
+            try:
+                loaded = entry_point.load()
+                if callable(loaded) and not isinstance(loaded, Operation):
+                    loaded = loaded()
+                operations = [loaded] if isinstance(loaded, Operation) else list(loaded)
+                for operation in operations:
+                    if not isinstance(operation, Operation):
+                        raise TypeError(f"expected Operation, got {type(operation).__name__}")
+                    self.register(operation)
+                    added.append(operation.name)
+            except Exception as e:
+                logger.error("Skipping operation plugin %s: %s", entry_point.name, e)
+        if added:
+            logger.info("Loaded plugin operations: %s", ", ".join(added))
+        return added
+
+
+def _exact_int_divide(num1: int, num2: int) -> int:
+    """Integer-mode division: exact quotients only"""
+    quotient, remainder = divmod(num1, num2)
+    if remainder:
+        raise InvalidOperandError(
+            f"{num1} / {num2} is not a whole number; use fraction or decimal mode"
+        )
+    return quotient
+
+
+def _vectorized_divide(num1, num2):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.divide(num1, num2)
+
+
+NONZERO_DIVISOR = ValidationRule(
+    invalid=lambda num1, num2: num2 == 0,
+    message="Cannot divide by zero",
+    error=DivisionByZeroError,
+)
+
+registry = OperationRegistry()
+registry.register(Operation(
+    "add", OPERATION_CODES["add"], add, np.add if np else None, description="Addition",
+    commutative=True
+))
+registry.register(Operation(
+    "subtract", OPERATION_CODES["subtract"], subtract, np.subtract if np else None,
+    description="Subtraction"
+))
+registry.register(Operation(
+    "multiply", OPERATION_CODES["multiply"], multiply, np.multiply if np else None,
+    description="Multiplication", commutative=True
+))
+registry.register(Operation(
+    "divide", OPERATION_CODES["divide"], divide, _vectorized_divide if np else None,
+    validators=(NONZERO_DIVISOR,), description="Division",
+    mode_functions={MODE_INT: _exact_int_divide}
+))
+registry.load_entry_points()
+
+
+def calculate(num1: float, num2: float, operation: str, mode: str = MODE_FLOAT) -> float:
     """
     Perform a calculation based on the operation
     
     Args:
         num1: First number
         num2: Second number
-        operation: Operation to perform (add, subtract, multiply, divide)
+        operation: Name of a registered operation (add, subtract, multiply, divide, ...)
+        mode: Numeric mode (float, int, decimal, fraction); in float mode the
+            operands are used as given
         
     Returns:
-        Result of the calculation
+        Result of the calculation (int, Decimal or Fraction outside float mode)
         
     Raises:
-        InvalidOperationError: If operation is not supported
+        InvalidOperationError: If operation or mode is not supported
+        InvalidOperandError: If an operand or the result does not fit the mode
         DivisionByZeroError: If dividing by zero
     """
     operation = operation.lower()
-    logger.info(f"Calculate called: num1={num1}, num2={num2}, operation={operation}")
-    
-    operations_map = {
-        "add": add,
-        "subtract": subtract,
-        "multiply": multiply,
-        "divide": divide
-    }
-    
-    if operation not in operations_map:
-        logger.error(f"Invalid operation requested: {operation}")
-        raise InvalidOperationError(
-            f"Invalid operation: {operation}. "
-            f"Supported operations: {', '.join(operations_map.keys())}"
-        )
+    logger.info(
+        "Calculate called: num1=%s, num2=%s, operation=%s", num1, num2, operation,
+        extra={"sample_key": "calculate"}
+    )
+    op = registry.get(operation)
     
     try:
-        result = operations_map[operation](num1, num2)
-        logger.info(f"Calculation successful: {num1} {operation} {num2} = {result}")
+        with span("calculate", operation=operation, mode=mode):
+            result = _apply(op, num1, num2, mode)
+        logger.info(
+            "Calculation successful: %s %s %s = %s", num1, operation, num2, result,
+            extra={"sample_key": "calculate"}
+        )
         return result
     except DivisionByZeroError as e:
-        logger.error(f"Division by zero error: {num1} / {num2}")
+        logger.error("Division by zero error: %s / %s", num1, num2)
+        raise
+    except (InvalidOperandError, InvalidOperationError) as e:
+        logger.warning("Calculation rejected in %s mode: %s", mode, e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error during calculation: {e}", exc_info=True)
+        logger.error("Unexpected error during calculation: %s", e, exc_info=True)
         raise
+
+
+def _apply(op: Operation, num1, num2, mode: str):
+    """Evaluate one operation in a numeric mode, checking its validators"""
+    function = op.scalar
+    if mode != MODE_FLOAT:
+        num1, num2 = to_mode(num1, mode), to_mode(num2, mode)
+        function = op.mode_functions.get(mode, function)
+    for rule in op.validators:
+        rule.check(num1, num2)
+    if mode != MODE_DECIMAL:
+        return function(num1, num2)
+    try:
+        with decimal.localcontext(DECIMAL_CONTEXT):
+            return function(num1, num2)
+    except decimal.DecimalException as e:
+        raise InvalidOperandError(f"Result not representable in decimal mode: {e!r}")
+
+
+def calculate_arrays(num1, num2, operation: Operation) -> Tuple[Any, Any]:
+    """
+    Apply an operation's vectorized kernel to numpy arrays
+
+    Args:
+        num1: float64 array
+        num2: float64 array of the same length
+        operation: Operation with a vectorized kernel
+
+    Returns:
+        (results, invalid) where invalid is a boolean mask of rows that
+        violate a validation rule; their results are NaN
+    """
+    invalid = np.zeros(len(num1), dtype=bool)
+    for rule in operation.validators:
+        invalid |= np.asarray(rule.invalid(num1, num2), dtype=bool)
+    results = np.asarray(operation.vectorized(num1, num2), dtype=np.float64)
+    if invalid.any():
+        results[invalid] = np.nan
+    return results, invalid
+
+
+def calculate_batch(items: Sequence[Tuple[float, float, str]],
+                    mode: str = MODE_FLOAT) -> List[Union[float, Exception]]:
+    """
+    Perform many calculations at once
+
+    Items are grouped by operation; in float mode each group runs through
+    the operation's vectorized kernel when it has one (and numpy is
+    installed), otherwise through its scalar function.
+
+    Args:
+        items: (num1, num2, operation) tuples
+        mode: Numeric mode for every item
+
+    Returns:
+        For each item, its result or the exception it raised
+        (InvalidOperationError, DivisionByZeroError, ...)
+    """
+    results: List[Union[float, Exception]] = [0.0] * len(items)
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for index, (_, _, operation) in enumerate(items):
+        groups[operation.lower()].append(index)
+
+    for name, indexes in groups.items():
+        try:
+            op = registry.get(name)
+        except InvalidOperationError as e:
+            for index in indexes:
+                results[index] = e
+            continue
+        with span("calculate", operation=name, mode=mode, items=len(indexes)):
+            if mode == MODE_FLOAT and op.vectorized is not None and np is not None:
+                num1 = np.fromiter((items[i][0] for i in indexes), dtype=np.float64,
+                                   count=len(indexes))
+                num2 = np.fromiter((items[i][1] for i in indexes), dtype=np.float64,
+                                   count=len(indexes))
+                values, invalid = calculate_arrays(num1, num2, op)
+                errors = _rule_errors(op, num1, num2, invalid)
+                for position, index in enumerate(indexes):
+                    error = errors.get(position)
+                    results[index] = error if error is not None else float(values[position])
+            else:
+                for index in indexes:
+                    num1, num2, _ = items[index]
+                    try:
+                        results[index] = _apply(op, num1, num2, mode)
+                    except Exception as e:
+                        results[index] = e
+    logger.info(
+        "Batch calculated: %d items, %d operations", len(items), len(groups),
+        extra={"sample_key": "calculate"}
+    )
+    return results
+
+
+def _rule_errors(operation: Operation, num1, num2, invalid) -> Dict[int, Exception]:
+    """Exceptions for the rows flagged in an invalid mask, by position"""
+    errors: Dict[int, Exception] = {}
+    if not invalid.any():
+        return errors
+    for position in np.flatnonzero(invalid):
+        for rule in operation.validators:
+            if rule.invalid(num1[position], num2[position]):
+                errors[int(position)] = rule.error(rule.message)
+                break
+    return errors
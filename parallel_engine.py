@@ -0,0 +1,193 @@
+"""
+Multi-core engine for very large array calculations
+Arrays above a size threshold are copied once into shared memory and split
+into fixed-size chunks that worker processes evaluate in place. Only shared
+memory names and slice bounds cross the process boundary, so operands and
+results are never pickled, and each worker holds at most one chunk of
+temporaries whatever the array size.
+"""
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context, shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from logger_config import get_logger
+from operations import (
+    calculate_arrays, registry, Operation, InvalidOperationError,
+    COST_CHEAP, COST_MODERATE, COST_EXPENSIVE
+)
+
+# Initialize logger
+logger = get_logger(__name__)
+
+DEFAULT_THRESHOLD = 1_000_000
+DEFAULT_CHUNK_SIZE = 262_144
+
+# Costlier operations go parallel at proportionally smaller sizes; cheap
+# ones are memory-bound and only gain on very large arrays
+THRESHOLD_DIVISORS = {COST_CHEAP: 1, COST_MODERATE: 16, COST_EXPENSIVE: 256}
+
+
+def _init_worker() -> None:
+    """
+    Give pool workers their own logging; the parent logs the batch
+
+    Importing this module ran the default setup_logging in the worker,
+    whose rotating handlers point at the parent's log files. They are
+    replaced by one stderr handler, so workers never write to or rotate
+    those files, and only CRITICAL records are kept.
+    """
+    worker_logger = logging.getLogger("fastapi_calculator")
+    for handler in list(worker_logger.handlers):
+        worker_logger.removeHandler(handler)
+        handler.close()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(
+        fmt="%(asctime)s - worker %(process)d - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    ))
+    worker_logger.addHandler(handler)
+    worker_logger.setLevel(logging.CRITICAL)
+
+
+def _evaluate_chunk(operation: str, names: Tuple[str, str, str, str], length: int,
+                    start: int, stop: int) -> int:
+    """
+    Evaluate rows [start, stop) of the shared arrays in a worker
+
+    Pool workers share the parent's resource tracker, so attaching here does
+    not make the segments outlive the parent's unlink.
+
+    Returns:
+        Number of invalid rows in the chunk
+    """
+    segments = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        num1 = np.ndarray((length,), np.float64, segments[0].buf)
+        num2 = np.ndarray((length,), np.float64, segments[1].buf)
+        results = np.ndarray((length,), np.float64, segments[2].buf)
+        invalid = np.ndarray((length,), np.bool_, segments[3].buf)
+        values, mask = calculate_arrays(num1[start:stop], num2[start:stop], registry.get(operation))
+        results[start:stop] = values
+        invalid[start:stop] = mask
+        count = int(mask.sum())
+        # Views must go before the segments can be closed
+        del num1, num2, results, invalid, values, mask
+        return count
+    finally:
+        for segment in segments:
+            segment.close()
+
+
+class ParallelEngine:
+    """
+    Evaluate large arrays across a pool of worker processes
+
+    Arrays shorter than threshold (divided by THRESHOLD_DIVISORS for the
+    operation's cost class) are evaluated in the calling process, where the
+    pool's coordination cost would dominate.
+    """
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = DEFAULT_THRESHOLD,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a server process with live threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    def calculate(self, num1, num2, operation) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Apply an operation to two float64 arrays
+
+        Args:
+            num1: First operands
+            num2: Second operands (same length)
+            operation: Operation or its name
+
+        Returns:
+            (results, invalid) as from operations.calculate_arrays
+
+        Raises:
+            InvalidOperationError: If the operation is unknown or has no
+                vectorized kernel
+            ValueError: If the arrays differ in length
+        """
+        op = operation if isinstance(operation, Operation) else registry.get(operation.lower())
+        if op.vectorized is None:
+            raise InvalidOperationError(f"Operation {op.name} has no vectorized kernel")
+        num1 = np.asarray(num1, dtype=np.float64)
+        num2 = np.asarray(num2, dtype=np.float64)
+        if num1.shape != num2.shape or num1.ndim != 1:
+            raise ValueError("Operands must be one-dimensional arrays of equal length")
+        threshold = self.threshold // THRESHOLD_DIVISORS[op.cost_class]
+        if len(num1) < threshold or self.workers < 2:
+            return calculate_arrays(num1, num2, op)
+        return self._calculate_parallel(num1, num2, op)
+
+    def _calculate_parallel(self, num1: np.ndarray, num2: np.ndarray,
+                            op: Operation) -> Tuple[np.ndarray, np.ndarray]:
+        length = len(num1)
+        segments = [
+            shared_memory.SharedMemory(create=True, size=max(length * 8, 1)),
+            shared_memory.SharedMemory(create=True, size=max(length * 8, 1)),
+            shared_memory.SharedMemory(create=True, size=max(length * 8, 1)),
+            shared_memory.SharedMemory(create=True, size=max(length, 1)),
+        ]
+        names = tuple(segment.name for segment in segments)
+        try:
+            np.ndarray((length,), np.float64, segments[0].buf)[:] = num1
+            np.ndarray((length,), np.float64, segments[1].buf)[:] = num2
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_evaluate_chunk, op.name, names, length, start,
+                            min(start + self.chunk_size, length))
+                for start in range(0, length, self.chunk_size)
+            ]
+            done, _ = wait(futures)
+            invalid_rows = sum(future.result() for future in done)
+            results = np.ndarray((length,), np.float64, segments[2].buf).copy()
+            invalid = np.ndarray((length,), np.bool_, segments[3].buf).copy()
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+        logger.info(
+            "Parallel %s over %d rows in %d chunks (%d invalid)",
+            op.name, length, len(futures), invalid_rows
+        )
+        return results, invalid
+
+    def close(self) -> None:
+        """Shut down the worker pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def engine_from_env() -> ParallelEngine:
+    """Engine configured by PARALLEL_WORKERS, PARALLEL_THRESHOLD and PARALLEL_CHUNK_SIZE"""
+    workers = int(os.getenv("PARALLEL_WORKERS", "0")) or None
+    return ParallelEngine(
+        workers=workers,
+        threshold=int(os.getenv("PARALLEL_THRESHOLD", str(DEFAULT_THRESHOLD))),
+        chunk_size=int(os.getenv("PARALLEL_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE))),
+    )
@@ -0,0 +1,212 @@
+"""
+Per-client rate limiting
+Token buckets keyed by client IP, or by API key (X-API-Key header) for keys
+in the RATE_LIMIT_API_KEYS allow-list, enforced by an ASGI middleware in
+front of the app. Bucket state lives in a fixed-size set-associative table,
+so memory stays bounded however many distinct clients there are: each
+client hashes to one small set of slots, and when the set is full the least
+recently seen client in it is evicted.
+"""
+import json
+import math
+import os
+import time
+from array import array
+from typing import Callable, FrozenSet, Optional, Tuple
+
+from logger_config import get_logger
+from metrics import metrics
+
+# Initialize logger
+logger = get_logger(__name__)
+
+DEFAULT_TABLE_SIZE = 1 << 16
+DEFAULT_WAYS = 4
+
+# Never throttled, so probes and scrapes work while a client is limited
+EXEMPT_PATHS = frozenset({"/health", "/metrics"})
+
+API_KEY_HEADER = b"x-api-key"
+
+throttled_requests = metrics.counter(
+    "calculator_rate_limited_requests_total", "Requests rejected with 429 by the rate limiter",
+    ("client_type",)
+)
+bucket_evictions = metrics.counter(
+    "calculator_rate_limit_evictions_total",
+    "Clients evicted from the rate limit table to make room for new ones"
+)
+
+
+class RateLimiter:
+    """
+    Token buckets in a fixed-size set-associative table
+
+    A client's bucket holds up to burst tokens and refills at rate tokens
+    per second; each request takes one. The table has table_size slots in
+    sets of `ways`. A client may only occupy a slot in the set its key
+    hashes to, so lookups scan at most `ways` slots. A new client replaces
+    the least recently seen client in its set, which then starts again
+    with a full bucket when it returns: with enough slots only long-idle
+    clients are evicted.
+
+    Not thread-safe: it is meant to be called from the event loop.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 table_size: int = DEFAULT_TABLE_SIZE, ways: int = DEFAULT_WAYS,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity (defaults to rate, at least 1)
+            table_size: Total slots, rounded up to a multiple of ways
+            ways: Slots per set
+
+        Raises:
+            ValueError: If rate, burst, table_size or ways is not positive
+        """
+        burst = max(rate, 1.0) if burst is None else burst
+        if rate <= 0 or burst < 1 or table_size < 1 or ways < 1:
+            raise ValueError("rate and table sizes must be positive and burst at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.ways = ways
+        self.sets = -(-table_size // ways)
+        slots = self.sets * ways
+        self._keys = [None] * slots
+        self._tokens = array("d", bytes(8 * slots))
+        self._seen = array("d", [-math.inf]) * slots
+        self._clock = clock
+
+    def acquire(self, key) -> float:
+        """
+        Take a token for a client
+
+        Args:
+            key: Hashable client identifier
+
+        Returns:
+            0.0 if the request may proceed, otherwise seconds until a token
+            will be available
+        """
+        now = self._clock()
+        keys = self._keys
+        seen = self._seen
+        start = (hash(key) % self.sets) * self.ways
+        slot = -1
+        oldest = start
+        for index in range(start, start + self.ways):
+            if keys[index] == key:
+                slot = index
+                break
+            if seen[index] < seen[oldest]:
+                oldest = index
+
+        if slot < 0:
+            slot = oldest
+            if keys[slot] is not None:
+                bucket_evictions.inc()
+            keys[slot] = key
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, self._tokens[slot] + (now - seen[slot]) * self.rate)
+        seen[slot] = now
+
+        if tokens >= 1.0:
+            self._tokens[slot] = tokens - 1.0
+            return 0.0
+        self._tokens[slot] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def tracked_clients(self) -> int:
+        """Number of occupied slots"""
+        return sum(1 for key in self._keys if key is not None)
+
+
+def client_key(scope, api_keys: FrozenSet[str] = frozenset()) -> Tuple[str, str]:
+    """
+    (client type, identifier) for a request: its API key, else its IP
+
+    Only keys in api_keys count; any other X-API-Key is ignored, so a client
+    cannot get a fresh bucket by sending a new made-up key per request.
+    """
+    for name, value in scope["headers"]:
+        if name == API_KEY_HEADER:
+            api_key = value.decode("latin-1")
+            if api_key in api_keys:
+                return "api_key", api_key
+            break
+    client = scope.get("client")
+    return "ip", client[0] if client else ""
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware answering 429 with Retry-After once a client's bucket is empty
+
+    A plain ASGI middleware rather than @app.middleware, so an allowed
+    request costs one table lookup and no extra request/response objects.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, api_keys: FrozenSet[str] = frozenset()):
+        self.app = app
+        self.limiter = limiter
+        self.api_keys = api_keys
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        key = client_key(scope, self.api_keys)
+        retry_after = self.limiter.acquire(key)
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        throttled_requests.inc(client_type=key[0])
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def limiter_from_env() -> Optional[RateLimiter]:
+    """
+    Create the rate limiter configured by the environment
+
+    RATE_LIMIT_PER_SECOND enables limiting (unset or 0 disables it);
+    RATE_LIMIT_BURST sets the bucket size and RATE_LIMIT_TABLE_SIZE the
+    number of client slots.
+    """
+    rate = float(os.getenv("RATE_LIMIT_PER_SECOND", "0") or 0)
+    if rate <= 0:
+        return None
+    burst = os.getenv("RATE_LIMIT_BURST")
+    limiter = RateLimiter(
+        rate,
+        burst=float(burst) if burst else None,
+        table_size=int(os.getenv("RATE_LIMIT_TABLE_SIZE", str(DEFAULT_TABLE_SIZE))),
+    )
+    metrics.gauge(
+        "calculator_rate_limit_clients", "Clients holding a slot in the rate limit table",
+        function=limiter.tracked_clients
+    )
+    logger.info(
+        "Rate limiting at %s requests/s (burst %s) per client, %d slots",
+        limiter.rate, limiter.burst, limiter.sets * limiter.ways
+    )
+    return limiter
+
+
+def api_keys_from_env() -> FrozenSet[str]:
+    """API keys that get their own bucket, from comma-separated RATE_LIMIT_API_KEYS"""
+    keys = os.getenv("RATE_LIMIT_API_KEYS", "")
+    return frozenset(key.strip() for key in keys.split(",") if key.strip())
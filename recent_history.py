@@ -0,0 +1,103 @@
+"""
+Recent calculations ring buffer
+Keeps the last N successful calculations in memory for a live view without
+touching a database. Entries are stored column-wise in preallocated typed
+arrays, so the buffer is a handful of flat allocations whatever its size:
+33 bytes per entry (three float64, one uint8 operation code, one int64
+timestamp), O(1) appends and no per-entry Python objects for the GC to track.
+"""
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from operations import registry
+
+# array typecodes: float64, uint8, int64
+BYTES_PER_ENTRY = (
+    array("d").itemsize * 3 + array("B").itemsize + array("q").itemsize
+)
+
+
+class RecentHistory:
+    """Fixed-capacity ring buffer of recent calculations"""
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._operand_a = array("d", bytes(8 * capacity))
+        self._operand_b = array("d", bytes(8 * capacity))
+        self._result = array("d", bytes(8 * capacity))
+        self._operation = array("B", bytes(capacity))
+        self._timestamp_ns = array("q", bytes(8 * capacity))
+        self._appended = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self._appended, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays"""
+        return BYTES_PER_ENTRY * self.capacity
+
+    def append(self, operation: str, operand_a: float, operand_b: float, result: float,
+               timestamp_ns: Optional[int] = None) -> None:
+        """
+        Record a calculation, overwriting the oldest entry when full
+
+        Args:
+            operation: Name of a registered operation
+            operand_a: First operand
+            operand_b: Second operand
+            result: Calculation result
+            timestamp_ns: Unix time in nanoseconds (defaults to now)
+        """
+        code = registry.get(operation).code
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        with self._lock:
+            slot = self._appended % self.capacity
+            self._operand_a[slot] = operand_a
+            self._operand_b[slot] = operand_b
+            self._result[slot] = result
+            self._operation[slot] = code
+            self._timestamp_ns[slot] = timestamp_ns
+            self._appended += 1
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Most recent entries, newest first
+
+        Args:
+            limit: Maximum number of entries (defaults to all)
+
+        Returns:
+            List of calculation dicts
+        """
+        with self._lock:
+            count = len(self) if limit is None else min(limit, len(self))
+            newest = self._appended - 1
+            slots = [(newest - i) % self.capacity for i in range(count)]
+            rows = [
+                (self._operation[s], self._operand_a[s], self._operand_b[s],
+                 self._result[s], self._timestamp_ns[s])
+                for s in slots
+            ]
+        return [
+            {
+                "operation": registry.by_code(code).name,
+                "num1": a,
+                "num2": b,
+                "result": result,
+                "timestamp": datetime.fromtimestamp(ts / 1e9, tz=timezone.utc),
+            }
+            for code, a, b, result, ts in rows
+        ]
+
+    def clear(self) -> None:
+        """Forget all entries (the arrays stay allocated)"""
+        with self._lock:
+            self._appended = 0
@@ -0,0 +1,14 @@
+"""
+Development server launcher: python serve.py
+Runs the app with uvicorn like `uvicorn main:app`. Launching through this
+small script rather than `python main.py` matters for the parallel engine:
+its spawned worker processes re-run the launching script, and this one does
+nothing outside its __main__ guard, so workers never repeat the app's
+startup.
+"""
+if __name__ == "__main__":
+    import uvicorn
+    from logger_config import get_logger
+
+    get_logger().info("Starting uvicorn server on http://0.0.0.0:8000")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, log_config=None)
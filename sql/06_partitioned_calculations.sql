@@ -0,0 +1,174 @@
+-- ============================================
+-- (F) ALTERNATIVE SCHEMA: COMPACT, PARTITIONED CALCULATIONS
+-- Replaces the calculations table from 01_create_tables.sql for
+-- deployments with hundreds of millions of rows.
+--   * operation stored as a SMALLINT code (lookup table below)
+--   * BIGINT identity key instead of SERIAL
+--   * monthly RANGE partitions on timestamp, created ahead of time, and a
+--     DEFAULT partition for rows outside them
+--   * BRIN index on timestamp
+--   * retention by dropping whole partitions
+-- Requires the users table from 01_create_tables.sql.
+-- To convert an existing database use 07_migrate_to_partitioned.sql.
+-- Safe to re-run: existing objects are kept.
+-- ============================================
+
+-- Refuse to run over the unpartitioned table from 01_create_tables.sql
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class
+               WHERE oid = to_regclass('calculations') AND relkind <> 'p') THEN
+        RAISE EXCEPTION 'calculations is not partitioned; use 07_migrate_to_partitioned.sql';
+    END IF;
+END;
+$$;
+
+-- Operation codes (must match OPERATION_CODES in operations.py)
+CREATE TABLE IF NOT EXISTS operation_codes (
+    code SMALLINT PRIMARY KEY,
+    name VARCHAR(20) NOT NULL UNIQUE
+);
+
+INSERT INTO operation_codes (code, name)
+VALUES
+(1, 'add'),
+(2, 'subtract'),
+(3, 'multiply'),
+(4, 'divide')
+ON CONFLICT (code) DO NOTHING;
+
+-- 8-byte columns first, then 4- and 2-byte ones, to avoid alignment padding
+CREATE TABLE IF NOT EXISTS calculations (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    operand_a DOUBLE PRECISION NOT NULL,
+    operand_b DOUBLE PRECISION NOT NULL,
+    result DOUBLE PRECISION NOT NULL,
+    user_id INTEGER NOT NULL,
+    operation SMALLINT NOT NULL,
+    PRIMARY KEY (id, timestamp),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (operation) REFERENCES operation_codes(code)
+) PARTITION BY RANGE (timestamp);
+
+-- Catches rows outside the monthly partitions (e.g. imported history or a
+-- missed maintenance run) instead of failing the insert; they are moved to
+-- their monthly partition when create_calculation_partitions() creates it
+CREATE TABLE IF NOT EXISTS calculations_default PARTITION OF calculations DEFAULT;
+
+-- BRIN stays a few pages per partition because rows arrive in time order
+CREATE INDEX IF NOT EXISTS calculations_timestamp_brin
+    ON calculations USING BRIN (timestamp) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS calculations_user_id_idx ON calculations (user_id);
+
+-- Readable view with operation names, for ad-hoc queries
+CREATE OR REPLACE VIEW calculations_named AS
+SELECT c.id, o.name AS operation, c.operand_a, c.operand_b, c.result,
+       c.timestamp, c.user_id
+FROM calculations c
+JOIN operation_codes o ON o.code = c.operation;
+
+-- ============================================
+-- PARTITION MAINTENANCE
+-- ============================================
+
+-- Create monthly partitions calculations_pYYYYMM from the month of p_start
+-- up to p_months_ahead months after the current month; existing ones are
+-- skipped, so the function is safe to call repeatedly. Rows of a new month
+-- that are already in calculations_default are moved into its partition.
+CREATE OR REPLACE FUNCTION create_calculation_partitions(
+    p_start DATE DEFAULT CURRENT_DATE,
+    p_months_ahead INTEGER DEFAULT 3
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_month DATE := date_trunc('month', p_start)::DATE;
+    v_last DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead))::DATE;
+    v_next DATE;
+    v_name TEXT;
+    v_moved BOOLEAN;
+    v_created INTEGER := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'calculations_p' || to_char(v_month, 'YYYYMM');
+        v_next := (v_month + INTERVAL '1 month')::DATE;
+        IF to_regclass(v_name) IS NULL THEN
+            -- The new range must be empty in the default partition before it
+            -- can be attached, so park those rows and re-insert them after
+            v_moved := to_regclass('calculations_default') IS NOT NULL AND EXISTS (
+                SELECT 1 FROM calculations_default
+                WHERE timestamp >= v_month AND timestamp < v_next
+            );
+            IF v_moved THEN
+                CREATE TEMP TABLE calculations_moved ON COMMIT DROP AS
+                    SELECT * FROM calculations_default
+                    WHERE timestamp >= v_month AND timestamp < v_next;
+                DELETE FROM calculations_default
+                WHERE timestamp >= v_month AND timestamp < v_next;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF calculations FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_month, v_next
+            );
+            IF v_moved THEN
+                -- Straight into the partition: the rows are not new, so the
+                -- statement triggers on calculations (08) must not see them
+                EXECUTE format(
+                    'INSERT INTO %I OVERRIDING SYSTEM VALUE SELECT * FROM calculations_moved',
+                    v_name
+                );
+                DROP TABLE calculations_moved;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := v_next;
+    END LOOP;
+    RETURN v_created;
+END;
+$$;
+
+-- Drop partitions whose whole range is older than p_retention.
+-- Dropping a partition is a metadata operation: no DELETE, no VACUUM.
+CREATE OR REPLACE FUNCTION drop_calculation_partitions(
+    p_retention INTERVAL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_partition RECORD;
+    v_dropped INTEGER := 0;
+BEGIN
+    FOR v_partition IN
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'calculations'::regclass
+          AND child.relname ~ '^calculations_p[0-9]{6}$'
+    LOOP
+        -- Upper bound of the partition is the first day of the next month
+        IF to_date(right(v_partition.name, 6), 'YYYYMM') + INTERVAL '1 month'
+                <= CURRENT_TIMESTAMP - p_retention THEN
+            EXECUTE format('DROP TABLE %I', v_partition.name);
+            v_dropped := v_dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN v_dropped;
+END;
+$$;
+
+-- One call for schedulers: keep partitions 3 months ahead, apply retention.
+-- Run it daily, e.g. with pg_cron:
+--   SELECT cron.schedule('calculations-maintenance', '5 0 * * *',
+--                        $$SELECT calculations_maintenance(INTERVAL '13 months')$$);
+-- or from cron: psql -c "SELECT calculations_maintenance(INTERVAL '13 months')"
+CREATE OR REPLACE FUNCTION calculations_maintenance(
+    p_retention INTERVAL DEFAULT INTERVAL '13 months',
+    p_months_ahead INTEGER DEFAULT 3
+) RETURNS TABLE (partitions_created INTEGER, partitions_dropped INTEGER)
+LANGUAGE sql AS $$
+    SELECT create_calculation_partitions(CURRENT_DATE, p_months_ahead),
+           drop_calculation_partitions(p_retention);
+$$;
+
+-- Create the current month and three months ahead
+SELECT create_calculation_partitions();
@@ -0,0 +1,90 @@
+-- ============================================
+-- (G) MIGRATE calculations TO THE PARTITIONED LAYOUT
+-- Run with psql from the sql/ directory:
+--   psql -d calculator_db -f 07_migrate_to_partitioned.sql
+-- The old table is kept as calculations_legacy until you drop it.
+-- Every step is skipped when already done and rows are copied one month
+-- per transaction, so the script can be re-run after an interruption.
+-- ============================================
+
+-- Step 1: move the current table (and its index/sequence names) aside,
+-- unless a previous run already did
+DO $$
+BEGIN
+    IF to_regclass('calculations_legacy') IS NOT NULL THEN
+        RAISE NOTICE 'calculations_legacy exists: step 1 already done';
+        RETURN;
+    END IF;
+    ALTER TABLE calculations RENAME TO calculations_legacy;
+    ALTER INDEX calculations_pkey RENAME TO calculations_legacy_pkey;
+    ALTER SEQUENCE calculations_id_seq RENAME TO calculations_legacy_id_seq;
+    ALTER TABLE calculations_legacy
+        RENAME CONSTRAINT calculations_user_id_fkey TO calculations_legacy_user_id_fkey;
+END;
+$$;
+
+-- Step 2: create the compact partitioned table (keeps what already exists)
+\ir 06_partitioned_calculations.sql
+
+-- Step 3: partitions for every month present in the legacy table
+SELECT create_calculation_partitions(
+    COALESCE((SELECT min(timestamp) FROM calculations_legacy)::DATE, CURRENT_DATE)
+);
+
+-- Rows with an operation name that has no code are not copied
+SELECT lower(operation) AS unknown_operation, count(*) AS rows_skipped
+FROM calculations_legacy
+WHERE lower(operation) NOT IN (SELECT name FROM operation_codes)
+GROUP BY 1;
+
+-- Step 4: copy month by month, committing after each month
+CREATE OR REPLACE PROCEDURE migrate_calculations_from_legacy()
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_now TIMESTAMP := clock_timestamp()::TIMESTAMP;
+    v_month DATE;
+    v_rows BIGINT;
+BEGIN
+    FOR v_month IN
+        SELECT DISTINCT date_trunc('month', COALESCE(timestamp, v_now))::DATE
+        FROM calculations_legacy
+        ORDER BY 1
+    LOOP
+        IF EXISTS (
+            SELECT 1 FROM calculations
+            WHERE timestamp >= v_month AND timestamp < v_month + INTERVAL '1 month'
+        ) THEN
+            RAISE NOTICE 'skipping %: already migrated', to_char(v_month, 'YYYY-MM');
+            CONTINUE;
+        END IF;
+
+        -- Keep the original ids so references to them stay valid
+        INSERT INTO calculations (id, timestamp, operand_a, operand_b, result, user_id, operation)
+        OVERRIDING SYSTEM VALUE
+        SELECT l.id, COALESCE(l.timestamp, v_now), l.operand_a, l.operand_b, l.result,
+               l.user_id, o.code
+        FROM calculations_legacy l
+        JOIN operation_codes o ON o.name = lower(l.operation)
+        WHERE COALESCE(l.timestamp, v_now) >= v_month
+          AND COALESCE(l.timestamp, v_now) < v_month + INTERVAL '1 month';
+
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        RAISE NOTICE 'migrated % rows for %', v_rows, to_char(v_month, 'YYYY-MM');
+        COMMIT;
+    END LOOP;
+END;
+$$;
+
+CALL migrate_calculations_from_legacy();
+
+-- Step 5: continue ids after the highest migrated id
+SELECT setval(pg_get_serial_sequence('calculations', 'id'), max(id))
+FROM calculations
+HAVING max(id) IS NOT NULL;
+
+-- Step 6: verify, then drop the legacy table when satisfied
+SELECT (SELECT count(*) FROM calculations_legacy) AS legacy_rows,
+       (SELECT count(*) FROM calculations) AS migrated_rows;
+
+-- DROP TABLE calculations_legacy;
+-- DROP PROCEDURE migrate_calculations_from_legacy();
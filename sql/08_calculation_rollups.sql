@@ -0,0 +1,167 @@
+-- ============================================
+-- (H) INCREMENTAL DAILY ROLLUPS
+-- Per (user_id, operation, day) counts, sums, min/max and last activity,
+-- kept up to date by statement-level triggers on calculations so dashboard
+-- queries (GET /stats) read the small rollup table instead of scanning
+-- calculations. Works with both the layout from 01_create_tables.sql and
+-- the partitioned layout from 06_partitioned_calculations.sql.
+-- Run after the calculations table exists; existing rows are backfilled.
+-- ============================================
+
+CREATE TABLE calculation_daily_stats (
+    user_id INTEGER NOT NULL,
+    operation VARCHAR(20) NOT NULL,
+    day DATE NOT NULL,
+    calculation_count BIGINT NOT NULL,
+    result_sum DOUBLE PRECISION NOT NULL,
+    result_min DOUBLE PRECISION NOT NULL,
+    result_max DOUBLE PRECISION NOT NULL,
+    last_activity TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, operation, day),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX calculation_daily_stats_day_idx ON calculation_daily_stats (day);
+
+-- Operation name for either layout: VARCHAR names or SMALLINT codes
+CREATE OR REPLACE FUNCTION calculation_operation_name(p_operation VARCHAR)
+RETURNS VARCHAR LANGUAGE sql IMMUTABLE AS $$
+    SELECT lower(p_operation)::VARCHAR
+$$;
+
+CREATE OR REPLACE FUNCTION calculation_operation_name(p_operation SMALLINT)
+RETURNS VARCHAR LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    RETURN (SELECT name FROM operation_codes WHERE code = p_operation);
+END;
+$$;
+
+-- Recompute the given (user, operation, day) groups from calculations.
+-- Used when rows are updated or deleted, where min/max cannot be adjusted
+-- incrementally.
+CREATE OR REPLACE FUNCTION refresh_calculation_daily_stats(
+    p_user_ids INTEGER[], p_operations VARCHAR[], p_days DATE[]
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM calculation_daily_stats s
+    USING unnest(p_user_ids, p_operations, p_days) AS k(user_id, operation, day)
+    WHERE s.user_id = k.user_id AND s.operation = k.operation AND s.day = k.day;
+
+    INSERT INTO calculation_daily_stats
+        (user_id, operation, day, calculation_count, result_sum, result_min,
+         result_max, last_activity)
+    SELECT c.user_id, k.operation, k.day, count(*), sum(c.result), min(c.result),
+           max(c.result), max(COALESCE(c.timestamp, CURRENT_TIMESTAMP))
+    FROM (SELECT DISTINCT * FROM unnest(p_user_ids, p_operations, p_days)) AS k(user_id, operation, day)
+    JOIN calculations c
+      ON c.user_id = k.user_id
+     AND COALESCE(c.timestamp, CURRENT_TIMESTAMP) >= k.day
+     AND COALESCE(c.timestamp, CURRENT_TIMESTAMP) < k.day + 1
+     AND calculation_operation_name(c.operation) = k.operation
+    GROUP BY c.user_id, k.operation, k.day;
+END;
+$$;
+
+-- INSERT: fold the whole inserted batch into the rollup with one upsert.
+-- Rows are grouped on the raw operation column first, so the name lookup
+-- runs once per group rather than once per row.
+CREATE OR REPLACE FUNCTION rollup_inserted_calculations()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO calculation_daily_stats AS s
+        (user_id, operation, day, calculation_count, result_sum, result_min,
+         result_max, last_activity)
+    SELECT user_id, calculation_operation_name(operation), day,
+           sum(n), sum(total), min(low), max(high), max(last_at)
+    FROM (
+        SELECT user_id, operation,
+               COALESCE(timestamp, CURRENT_TIMESTAMP)::DATE AS day,
+               count(*) AS n, sum(result) AS total, min(result) AS low,
+               max(result) AS high, max(COALESCE(timestamp, CURRENT_TIMESTAMP)) AS last_at
+        FROM inserted_rows
+        GROUP BY 1, 2, 3
+    ) AS per_code
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, operation, day) DO UPDATE SET
+        calculation_count = s.calculation_count + EXCLUDED.calculation_count,
+        result_sum = s.result_sum + EXCLUDED.result_sum,
+        result_min = LEAST(s.result_min, EXCLUDED.result_min),
+        result_max = GREATEST(s.result_max, EXCLUDED.result_max),
+        last_activity = GREATEST(s.last_activity, EXCLUDED.last_activity);
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_deleted_calculations()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM refresh_calculation_daily_stats(
+        array_agg(user_id), array_agg(operation), array_agg(day))
+    FROM (
+        SELECT DISTINCT user_id, calculation_operation_name(operation) AS operation,
+               COALESCE(timestamp, CURRENT_TIMESTAMP)::DATE AS day
+        FROM deleted_rows
+    ) AS k;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_updated_calculations()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM refresh_calculation_daily_stats(
+        array_agg(user_id), array_agg(operation), array_agg(day))
+    FROM (
+        SELECT user_id, calculation_operation_name(operation) AS operation,
+               COALESCE(timestamp, CURRENT_TIMESTAMP)::DATE AS day
+        FROM deleted_rows
+        UNION
+        SELECT user_id, calculation_operation_name(operation),
+               COALESCE(timestamp, CURRENT_TIMESTAMP)::DATE
+        FROM inserted_rows
+    ) AS k;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER calculations_rollup_insert
+    AFTER INSERT ON calculations
+    REFERENCING NEW TABLE AS inserted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_inserted_calculations();
+
+CREATE TRIGGER calculations_rollup_delete
+    AFTER DELETE ON calculations
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_deleted_calculations();
+
+CREATE TRIGGER calculations_rollup_update
+    AFTER UPDATE ON calculations
+    REFERENCING OLD TABLE AS deleted_rows NEW TABLE AS inserted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_updated_calculations();
+
+-- Backfill from existing rows
+INSERT INTO calculation_daily_stats
+    (user_id, operation, day, calculation_count, result_sum, result_min,
+     result_max, last_activity)
+SELECT user_id, calculation_operation_name(operation), day,
+       sum(n), sum(total), min(low), max(high), max(last_at)
+FROM (
+    SELECT user_id, operation,
+           COALESCE(timestamp, CURRENT_TIMESTAMP)::DATE AS day,
+           count(*) AS n, sum(result) AS total, min(result) AS low,
+           max(result) AS high, max(COALESCE(timestamp, CURRENT_TIMESTAMP)) AS last_at
+    FROM calculations
+    GROUP BY 1, 2, 3
+) AS per_code
+GROUP BY 1, 2, 3;
+
+-- Example dashboard query: per-user totals for the last 30 days
+SELECT u.username, s.operation, sum(s.calculation_count) AS calculations,
+       sum(s.result_sum) / sum(s.calculation_count) AS avg_result,
+       max(s.last_activity) AS last_activity
+FROM calculation_daily_stats s
+JOIN users u ON u.id = s.user_id
+WHERE s.day >= CURRENT_DATE - 30
+GROUP BY u.username, s.operation
+ORDER BY u.username, s.operation;
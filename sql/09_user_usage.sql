@@ -0,0 +1,19 @@
+-- ============================================
+-- (I) PER-USER USAGE COUNTERS
+-- Running calculation counts per (user_id, operation) for quotas. The app
+-- (usage.py) accumulates counts in memory and adds them here with one
+-- batched upsert every few seconds, instead of updating a row per request.
+-- GET /users/{id}/usage adds the counts not yet flushed.
+-- ============================================
+
+CREATE TABLE user_usage (
+    user_id INTEGER NOT NULL,
+    operation VARCHAR(20) NOT NULL,
+    calculation_count BIGINT NOT NULL,
+    last_activity TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, operation),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Total usage per user
+-- SELECT user_id, sum(calculation_count) FROM user_usage GROUP BY user_id;
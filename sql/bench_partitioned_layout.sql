@@ -0,0 +1,112 @@
+-- ============================================
+-- STORAGE / LATENCY BENCHMARK: LEGACY vs PARTITIONED calculations
+-- Builds both layouts in a scratch schema "bench" and compares size and
+-- query latency. Run with psql against a local Postgres from sql/:
+--   psql -d calculator_db -f bench_partitioned_layout.sql
+--   psql -d calculator_db -v rows=50000000 -f bench_partitioned_layout.sql
+-- rows defaults to 10,000,000 spread evenly over the last 12 months.
+-- The schema is dropped at the end.
+-- ============================================
+\set ON_ERROR_STOP on
+\if :{?rows}
+\else
+\set rows 10000000
+\endif
+
+DROP SCHEMA IF EXISTS bench CASCADE;
+CREATE SCHEMA bench;
+SET search_path TO bench;
+
+CREATE TABLE users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO users (username, email)
+SELECT 'user' || i, 'user' || i || '@example.com' FROM generate_series(1, 1000) AS i;
+
+-- Legacy layout from 01_create_tables.sql, plus the btree on timestamp that
+-- time-range queries would otherwise need
+CREATE TABLE calculations_legacy (
+    id SERIAL PRIMARY KEY,
+    operation VARCHAR(20) NOT NULL,
+    operand_a FLOAT NOT NULL,
+    operand_b FLOAT NOT NULL,
+    result FLOAT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Partitioned layout (creates bench.calculations and its functions)
+\ir 06_partitioned_calculations.sql
+SELECT create_calculation_partitions((CURRENT_DATE - INTERVAL '12 months')::DATE);
+
+\echo '== load' :rows 'rows'
+\timing on
+INSERT INTO calculations_legacy (operation, operand_a, operand_b, result, timestamp, user_id)
+SELECT (ARRAY['add', 'subtract', 'multiply', 'divide'])[1 + i % 4],
+       i, 3, i + 3,
+       CURRENT_TIMESTAMP - INTERVAL '365 days' * (1.0 - i::FLOAT / :rows),
+       1 + i % 1000
+FROM generate_series(1, :rows) AS i;
+
+INSERT INTO calculations (operation, operand_a, operand_b, result, timestamp, user_id)
+SELECT 1 + i % 4, i, 3, i + 3,
+       CURRENT_TIMESTAMP - INTERVAL '365 days' * (1.0 - i::FLOAT / :rows),
+       1 + i % 1000
+FROM generate_series(1, :rows) AS i;
+
+CREATE INDEX calculations_legacy_timestamp_idx ON calculations_legacy (timestamp);
+CREATE INDEX calculations_legacy_user_id_idx ON calculations_legacy (user_id);
+\timing off
+VACUUM ANALYZE calculations_legacy;
+VACUUM ANALYZE calculations;
+
+\echo '== storage'
+SELECT 'legacy' AS layout,
+       pg_size_pretty(pg_table_size('calculations_legacy')) AS heap,
+       pg_size_pretty(pg_indexes_size('calculations_legacy')) AS indexes,
+       pg_size_pretty(pg_total_relation_size('calculations_legacy')) AS total
+UNION ALL
+SELECT 'partitioned',
+       pg_size_pretty(sum(pg_table_size(relid))),
+       pg_size_pretty(sum(pg_indexes_size(relid))),
+       pg_size_pretty(sum(pg_total_relation_size(relid)))
+FROM pg_partition_tree('calculations');
+
+SELECT 'legacy timestamp btree' AS index_name,
+       pg_size_pretty(pg_relation_size('calculations_legacy_timestamp_idx')) AS size
+UNION ALL
+SELECT 'partitioned timestamp brin (all partitions)',
+       pg_size_pretty(sum(pg_relation_size(relid)))
+FROM pg_partition_tree('calculations_timestamp_brin');
+
+\echo '== last 7 days: count and average result'
+\timing on
+SELECT count(*), avg(result) FROM calculations_legacy
+WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days';
+SELECT count(*), avg(result) FROM calculations
+WHERE timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days';
+
+\echo '== one user, one month, per operation'
+SELECT operation, count(*) FROM calculations_legacy
+WHERE user_id = 42
+  AND timestamp >= date_trunc('month', CURRENT_TIMESTAMP - INTERVAL '2 months')
+  AND timestamp < date_trunc('month', CURRENT_TIMESTAMP - INTERVAL '1 month')
+GROUP BY operation;
+SELECT o.name, count(*) FROM calculations c JOIN operation_codes o ON o.code = c.operation
+WHERE c.user_id = 42
+  AND c.timestamp >= date_trunc('month', CURRENT_TIMESTAMP - INTERVAL '2 months')
+  AND c.timestamp < date_trunc('month', CURRENT_TIMESTAMP - INTERVAL '1 month')
+GROUP BY o.name;
+
+\echo '== retention: purge everything older than 9 months'
+DELETE FROM calculations_legacy
+WHERE timestamp < date_trunc('month', CURRENT_TIMESTAMP - INTERVAL '9 months');
+SELECT drop_calculation_partitions(INTERVAL '9 months');
+\timing off
+
+RESET search_path;
+DROP SCHEMA bench CASCADE;
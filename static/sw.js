@@ -0,0 +1,53 @@
+// Service worker for the calculator web interface.
+// Caches the static shell so the page opens instantly and works offline;
+// API requests always go to the network.
+
+const CACHE_NAME = 'calculator-shell-v1';
+const SHELL = ['/', '/static/index.html'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(SHELL))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    // Drop shells cached by older versions of this worker
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(
+                names.filter(name => name !== CACHE_NAME).map(name => caches.delete(name))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin
+            || !SHELL.includes(url.pathname)) {
+        return;
+    }
+
+    // Stale-while-revalidate: answer from the cache, refresh it in the background
+    event.respondWith(
+        caches.open(CACHE_NAME).then(cache =>
+            cache.match(event.request).then(cached => {
+                const refresh = fetch(event.request)
+                    .then(response => {
+                        if (response.ok) {
+                            cache.put(event.request, response.clone());
+                        }
+                        return response;
+                    });
+                if (cached) {
+                    event.waitUntil(refresh.catch(() => undefined));
+                    return cached;
+                }
+                return refresh;
+            })
+        )
+    );
+});
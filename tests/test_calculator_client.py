@@ -0,0 +1,198 @@
+"""
+Tests for the calculator client library
+"""
+import asyncio
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import main
+import calculator_client
+from calculator_client import (
+    CalculatorClient, AsyncCalculatorClient, CalculatorError, CalculationError
+)
+
+
+@pytest.fixture
+def client():
+    client = CalculatorClient(http_client=TestClient(main.app), max_in_flight=2)
+    yield client
+    client.close()
+
+
+def mock_http(handler, asynchronous=False):
+    transport = httpx.MockTransport(handler)
+    if asynchronous:
+        return httpx.AsyncClient(transport=transport, base_url="http://test")
+    return httpx.Client(transport=transport, base_url="http://test")
+
+
+class TestCalculatorClient:
+    """Test cases for the blocking client"""
+
+    def test_calculate(self, client):
+        """Test results and error mapping against the app"""
+        assert client.calculate(10, 4, "divide") == 2.5
+        assert client.calculate(2 ** 70, 1, "add", mode="int") == 2 ** 70 + 1
+        with pytest.raises(CalculationError) as excinfo:
+            client.calculate(1, 0, "divide")
+        assert excinfo.value.status_code == 400
+        assert "divide by zero" in str(excinfo.value)
+
+    def test_concurrent_calls_are_batched(self, client):
+        """Test that calls queued together share batch requests"""
+        futures = [client.submit(i, 2, "multiply") for i in range(200)]
+        futures.append(client.submit(1, 0, "divide"))
+        results = [future.result(timeout=10) for future in futures[:-1]]
+        assert results == [i * 2.0 for i in range(200)]
+        with pytest.raises(CalculationError):
+            futures[-1].result(timeout=10)
+        stats = client.metrics.snapshot()
+        assert stats["calls"] == 201
+        assert stats["http_requests"] < 201
+        assert stats["batched_calls"] > 0
+        assert stats["p50_ms"] is not None
+
+    def test_threads_share_client(self, client):
+        """Test calls from many threads"""
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda i: client.calculate(i, 1, "add"), range(50)))
+        assert results == [i + 1.0 for i in range(50)]
+
+    def test_retries_transient_failures(self):
+        """Test that 503s are retried and the idempotency key is reused"""
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers.get("idempotency-key"))
+            if len(seen) < 3:
+                return httpx.Response(503, json={"detail": "busy"})
+            return httpx.Response(200, json={"result": 3.0})
+
+        with CalculatorClient(http_client=mock_http(handler), backoff=0.001) as client:
+            assert client.calculate(1, 2, "add") == 3.0
+            assert client.metrics.snapshot()["retries"] == 2
+        assert len(set(seen)) == 1
+
+    def test_gives_up(self):
+        """Test that failures surface after the retry budget"""
+        def handler(request):
+            raise httpx.ConnectError("refused")
+
+        with CalculatorClient(http_client=mock_http(handler), retries=2, backoff=0.001) as client:
+            with pytest.raises(CalculatorError):
+                client.calculate(1, 2, "add")
+            assert client.metrics.snapshot()["failures"] == 1
+
+    def test_client_errors_not_retried(self):
+        """Test that 4xx responses are final"""
+        calls = []
+
+        def handler(request):
+            calls.append(1)
+            return httpx.Response(422, json={"detail": "bad"})
+
+        with CalculatorClient(http_client=mock_http(handler), backoff=0.001) as client:
+            with pytest.raises(CalculationError):
+                client.calculate("x", 2, "add")
+        assert len(calls) == 1
+
+    def test_rejected_batch_is_split(self):
+        """Test that a 422 on a batch resends its calls one at a time"""
+        requests = []
+
+        def handler(request):
+            body = json.loads(request.content)
+            requests.append(request.url.path)
+            if request.url.path == "/calculate/batch":
+                return httpx.Response(422, json={"detail": "bad item"})
+            if body["num1"] == "x":
+                return httpx.Response(422, json={"detail": "bad"})
+            return httpx.Response(200, json={"result": body["num1"] + body["num2"]})
+
+        client = CalculatorClient(http_client=mock_http(handler))
+        calls = [calculator_client._Call(n, 1, "add", "float", None, Future())
+                 for n in (1, "x", 2)]
+        client._send(*client._plan(calls)[0])
+        assert requests == ["/calculate/batch"] + ["/calculate"] * 3
+        assert calls[0].future.result() == 2 and calls[2].future.result() == 3
+        with pytest.raises(CalculationError):
+            calls[1].future.result()
+        client.close()
+
+    def test_batches_only_retried_when_not_run(self):
+        """Test that batches without a key are not retried after they may have run"""
+        client = CalculatorClient(http_client=mock_http(lambda r: httpx.Response(200)))
+        assert client._delay(0, httpx.Response(502), batch=True) is None
+        assert client._delay(0, None, httpx.ReadTimeout("slow"), batch=True) is None
+        assert client._delay(0, httpx.Response(503), batch=True) is not None
+        assert client._delay(0, None, httpx.ConnectError("refused"), batch=True) is not None
+        assert client._delay(0, httpx.Response(502)) is not None
+        client.close()
+
+    def test_retry_after_is_honoured(self):
+        """Test that Retry-After sets the delay"""
+        client = CalculatorClient(http_client=mock_http(lambda r: httpx.Response(200)))
+        response = httpx.Response(429, headers={"Retry-After": "0.25"})
+        assert client._delay(0, response) == 0.25
+        assert client._delay(client.retries, response) is None
+        client.close()
+
+
+class TestAsyncCalculatorClient:
+    """Test cases for the asyncio client"""
+
+    def test_gather_is_batched(self):
+        """Test that concurrent coroutines share batch requests"""
+        async def scenario():
+            http = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                     base_url="http://test")
+            async with AsyncCalculatorClient(http_client=http) as client:
+                results = await asyncio.gather(
+                    *[client.calculate(i, 3, "subtract") for i in range(300)],
+                    client.calculate(1, 0, "divide"), return_exceptions=True
+                )
+                return results, client.metrics.snapshot()
+
+        results, stats = asyncio.run(scenario())
+        assert results[:300] == [i - 3.0 for i in range(300)]
+        assert isinstance(results[300], CalculationError)
+        assert stats["http_requests"] <= 5
+
+    def test_single_call_uses_calculate(self):
+        """Test that a lone call goes to POST /calculate with a mode"""
+        requests = []
+
+        def handler(request):
+            requests.append((request.url.path, json.loads(request.content)))
+            return httpx.Response(200, json={"result": "1/3"})
+
+        async def scenario():
+            async with AsyncCalculatorClient(http_client=mock_http(handler, True)) as client:
+                return await client.calculate(1, 3, "divide", mode="fraction")
+
+        assert asyncio.run(scenario()) == "1/3"
+        assert requests == [("/calculate", {"num1": 1, "num2": 3, "operation": "divide",
+                                            "mode": "fraction"})]
+
+
+class TestPost:
+    """Test cases for the requests-style post()"""
+
+    def test_drop_in(self, monkeypatch):
+        """Test that post() answers like requests.post for /calculate"""
+        shared = CalculatorClient(http_client=TestClient(main.app))
+        monkeypatch.setitem(calculator_client._shared_clients, "http://localhost:8000", shared)
+        response = calculator_client.post("http://localhost:8000/calculate",
+                                          json={"num1": 6, "num2": 3, "operation": "divide"})
+        assert response.status_code == 200 and response.ok
+        assert response.json()["result"] == 2.0
+        response = calculator_client.post("http://localhost:8000/calculate",
+                                          json={"num1": 6, "num2": 0, "operation": "divide"})
+        assert response.status_code == 400
+        with pytest.raises(CalculatorError):
+            response.raise_for_status()
+        with pytest.raises(ValueError):
+            calculator_client.post("http://localhost:8000/health", json={})
+        shared.close()
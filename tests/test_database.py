@@ -0,0 +1,117 @@
+"""
+Tests for database access and the /stats endpoint
+"""
+from datetime import date
+from pathlib import Path
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+from database import connect, fetch_daily_stats, is_postgres_url, DatabaseUnavailableError
+from main import app
+
+client = TestClient(app)
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+
+
+class TestDatabaseConfiguration:
+    """Test cases for DATABASE_URL handling"""
+
+    def test_is_postgres_url(self):
+        """Test recognition of PostgreSQL URLs"""
+        assert is_postgres_url("postgresql://user@localhost/db")
+        assert is_postgres_url("postgres://user@localhost/db")
+        assert not is_postgres_url("sqlite:///history.db")
+        assert not is_postgres_url(None)
+
+    def test_connect_without_url(self, monkeypatch):
+        """Test that connecting without DATABASE_URL fails cleanly"""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        with pytest.raises(DatabaseUnavailableError):
+            with connect():
+                pass
+
+    def test_stats_unavailable_without_database(self, monkeypatch):
+        """Test that /stats returns 503 when no database is configured"""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        response = client.get("/stats")
+        assert response.status_code == 503
+
+    def test_stats_rejects_bad_limit(self):
+        """Test that /stats validates the limit parameter"""
+        response = client.get("/stats", params={"limit": 0})
+        assert response.status_code == 400
+
+
+class TestDailyRollups:
+    """Test cases for calculation_daily_stats maintained by triggers"""
+
+    SCRIPTS = ("01_create_tables.sql", "02_insert_records.sql", "08_calculation_rollups.sql")
+
+    def test_backfill_and_insert_trigger(self, postgres_url):
+        """Test that existing and newly inserted rows are rolled up"""
+        url = postgres_url(*self.SCRIPTS)
+        with psycopg.connect(url) as conn:
+            conn.execute(
+                "INSERT INTO calculations (operation, operand_a, operand_b, result, user_id) "
+                "VALUES ('ADD', 1, 1, 2, 1), ('add', 7, 7, 14, 1)"
+            )
+            rows = fetch_daily_stats(conn, user_id=1, operation="add", granularity="total")
+        assert len(rows) == 1
+        assert rows[0]["count"] == 3
+        assert rows[0]["sum"] == 21
+        assert rows[0]["min"] == 2
+        assert rows[0]["max"] == 14
+
+    def test_update_and_delete_refresh_groups(self, postgres_url):
+        """Test that updates and deletes recompute affected groups"""
+        url = postgres_url(*self.SCRIPTS, "04_update_record.sql", "05_delete_record.sql")
+        with psycopg.connect(url) as conn:
+            rows = fetch_daily_stats(conn, user_id=1, granularity="total")
+        assert [(r["operation"], r["count"], r["sum"]) for r in rows] == [("add", 1, 6.0)]
+
+    def test_partitioned_layout(self, postgres_url):
+        """Test rollups on the partitioned layout with operation codes"""
+        url = postgres_url("01_create_tables.sql")
+        with psycopg.connect(url) as conn:
+            conn.execute("DROP TABLE calculations")
+            for script in ("06_partitioned_calculations.sql", "08_calculation_rollups.sql"):
+                conn.execute((SQL_DIR / script).read_text())
+            conn.execute("INSERT INTO users (username, email) VALUES ('alice', 'a@example.com')")
+            conn.execute(
+                "INSERT INTO calculations (operation, operand_a, operand_b, result, user_id) "
+                "VALUES (1, 2, 3, 5, 1), (4, 10, 2, 5, 1)"
+            )
+            rows = fetch_daily_stats(conn, granularity="total")
+        assert {r["operation"]: r["count"] for r in rows} == {"add": 1, "divide": 1}
+
+    def test_partitioned_default_partition(self, postgres_url):
+        """Test that out-of-range rows are kept and later moved without recounting"""
+        url = postgres_url("01_create_tables.sql")
+        with psycopg.connect(url) as conn:
+            conn.execute("DROP TABLE calculations")
+            for script in ("06_partitioned_calculations.sql", "06_partitioned_calculations.sql",
+                           "08_calculation_rollups.sql"):
+                conn.execute((SQL_DIR / script).read_text())
+            conn.execute("INSERT INTO users (username, email) VALUES ('alice', 'a@example.com')")
+            conn.execute(
+                "INSERT INTO calculations (timestamp, operation, operand_a, operand_b, result, "
+                "user_id) VALUES ('2019-02-10', 1, 2, 3, 5, 1)"
+            )
+            assert conn.execute("SELECT count(*) FROM calculations_default").fetchone()[0] == 1
+            conn.execute("SELECT create_calculation_partitions('2019-02-01')")
+            assert conn.execute("SELECT count(*) FROM calculations_default").fetchone()[0] == 0
+            assert conn.execute("SELECT count(*) FROM calculations_p201902").fetchone()[0] == 1
+            rows = fetch_daily_stats(conn, granularity="total")
+        assert [r["count"] for r in rows] == [1]
+
+    def test_stats_endpoint(self, postgres_url, monkeypatch):
+        """Test /stats served from the rollup table"""
+        monkeypatch.setenv("DATABASE_URL", postgres_url(*self.SCRIPTS))
+        response = client.get("/stats", params={"user_id": 1, "start": str(date.today())})
+        assert response.status_code == 200
+        data = response.json()
+        assert {row["operation"] for row in data} == {"add", "divide"}
+        assert all(row["day"] == str(date.today()) for row in data)
+
+        response = client.get("/stats", params={"granularity": "total", "operation": "MULTIPLY"})
+        assert response.json()[0]["avg"] == 20.0
@@ -0,0 +1,152 @@
+"""
+Tests for the tracemalloc diagnostics module and admin endpoints
+"""
+import json
+import pytest
+from fastapi.testclient import TestClient
+from diagnostics import MemoryDiagnostics, DiagnosticsError
+from main import app
+
+client = TestClient(app)
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def diagnostics(tmp_path):
+    """Provide a diagnostics instance that always stops tracing afterwards"""
+    diag = MemoryDiagnostics(max_snapshots=2, dump_dir=tmp_path)
+    yield diag
+    diag.stop()
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    """Enable admin endpoints for the duration of a test"""
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    yield
+    client.post("/admin/diagnostics/memory/stop", headers=ADMIN_HEADERS)
+
+
+class TestMemoryDiagnostics:
+    """Test cases for MemoryDiagnostics"""
+
+    def test_idle_by_default(self, diagnostics):
+        """Test that nothing is traced until start() is called"""
+        assert diagnostics.status()["tracing"] is False
+
+    def test_snapshot_requires_tracing(self, diagnostics):
+        """Test that snapshots cannot be taken while tracing is off"""
+        with pytest.raises(DiagnosticsError):
+            diagnostics.take_snapshot()
+
+    def test_top_and_diff(self, diagnostics):
+        """Test top allocation sites and diff between snapshots"""
+        diagnostics.start()
+        base = diagnostics.take_snapshot()
+        retained = [bytearray(1024) for _ in range(200)]
+        target = diagnostics.take_snapshot()
+
+        top = diagnostics.top(target, limit=5)
+        assert top["snapshot"] == target
+        assert len(top["top"]) <= 5
+
+        diff = diagnostics.diff(base, target, limit=5)
+        assert diff["size_diff_bytes"] > 0
+        assert diff["top"][0]["size_diff_bytes"] > 0
+        assert len(retained) == 200
+
+    def test_snapshot_limit(self, diagnostics):
+        """Test that the oldest snapshots are evicted"""
+        diagnostics.start()
+        first = diagnostics.take_snapshot()
+        diagnostics.take_snapshot()
+        diagnostics.take_snapshot()
+        ids = [s["id"] for s in diagnostics.status()["snapshots"]]
+        assert first not in ids
+        assert len(ids) == 2
+
+    def test_invalid_key_type(self, diagnostics):
+        """Test that an unknown grouping key is rejected"""
+        diagnostics.start()
+        snapshot_id = diagnostics.take_snapshot()
+        with pytest.raises(DiagnosticsError):
+            diagnostics.top(snapshot_id, key_type="module")
+
+    def test_dump_writes_json(self, diagnostics, tmp_path):
+        """Test that reports can be dumped to disk"""
+        diagnostics.start()
+        snapshot_id = diagnostics.take_snapshot()
+        path = diagnostics.dump(diagnostics.top(snapshot_id), snapshot_id)
+        assert path.parent == tmp_path
+        assert json.loads(path.read_text())["snapshot"] == snapshot_id
+
+    def test_stop_clears_snapshots(self, diagnostics):
+        """Test that stopping drops stored snapshots"""
+        diagnostics.start()
+        diagnostics.take_snapshot()
+        status = diagnostics.stop()
+        assert status["tracing"] is False
+        assert status["snapshots"] == []
+
+
+class TestDiagnosticsEndpoints:
+    """Test cases for the admin diagnostics endpoints"""
+
+    def test_disabled_without_admin_token(self, monkeypatch):
+        """Test that admin endpoints are hidden when ADMIN_TOKEN is unset"""
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        response = client.get("/admin/diagnostics/memory")
+        assert response.status_code == 404
+
+    def test_rejects_invalid_token(self, admin_token):
+        """Test that a wrong token is rejected"""
+        response = client.get("/admin/diagnostics/memory",
+                              headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 403
+
+    def test_snapshot_flow(self, admin_token):
+        """Test start, snapshot, top and diff through the API"""
+        response = client.post("/admin/diagnostics/memory/start",
+                               headers=ADMIN_HEADERS, json={"nframes": 2})
+        assert response.status_code == 200
+        assert response.json()["tracing"] is True
+
+        base = client.post("/admin/diagnostics/memory/snapshots",
+                           headers=ADMIN_HEADERS).json()["id"]
+        target = client.post("/admin/diagnostics/memory/snapshots",
+                             headers=ADMIN_HEADERS).json()["id"]
+
+        response = client.get(f"/admin/diagnostics/memory/snapshots/{target}",
+                              headers=ADMIN_HEADERS, params={"limit": 3})
+        assert response.status_code == 200
+        assert len(response.json()["top"]) <= 3
+
+        response = client.get("/admin/diagnostics/memory/diff", headers=ADMIN_HEADERS,
+                               params={"base": base, "target": target})
+        assert response.status_code == 200
+        assert response.json()["base"] == base
+
+    def test_limit_must_be_positive(self, admin_token):
+        """Test that a limit below 1 is refused instead of returning every site"""
+        client.post("/admin/diagnostics/memory/start", headers=ADMIN_HEADERS)
+        target = client.post("/admin/diagnostics/memory/snapshots",
+                             headers=ADMIN_HEADERS).json()["id"]
+        response = client.get(f"/admin/diagnostics/memory/snapshots/{target}",
+                              headers=ADMIN_HEADERS, params={"limit": -1})
+        assert response.status_code == 422
+        response = client.get("/admin/diagnostics/memory/diff", headers=ADMIN_HEADERS,
+                              params={"base": target, "target": target, "limit": 0})
+        assert response.status_code == 422
+
+    def test_snapshot_without_tracing(self, admin_token):
+        """Test that snapshots fail with 409 while tracing is off"""
+        response = client.post("/admin/diagnostics/memory/snapshots",
+                               headers=ADMIN_HEADERS)
+        assert response.status_code == 409
+
+    def test_unknown_snapshot(self, admin_token):
+        """Test that unknown snapshot ids return 400"""
+        client.post("/admin/diagnostics/memory/start", headers=ADMIN_HEADERS)
+        response = client.get("/admin/diagnostics/memory/snapshots/missing",
+                              headers=ADMIN_HEADERS)
+        assert response.status_code == 400
@@ -0,0 +1,131 @@
+"""
+Tests for the streaming calculation export
+"""
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+from export_calculations import (
+    COLUMNS, build_export_query, iter_calculation_batches, iter_csv, write_parquet, main
+)
+from main import app
+
+client = TestClient(app)
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+
+
+def parse_csv(data: bytes):
+    """Parse exported CSV into a list of dicts"""
+    return list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+
+
+class TestExportFormatting:
+    """Test cases that do not need a database"""
+
+    def test_query_filters(self):
+        """Test that filters become parameters and aware times become naive UTC"""
+        start = datetime(2025, 1, 1, 2, 0, tzinfo=timezone(timedelta(hours=2)))
+        query, params = build_export_query(True, user_id=3, start=start)
+        assert "operation_codes" in query
+        assert "c.timestamp < " not in query
+        assert params == {"user_id": 3, "start": datetime(2025, 1, 1, 0, 0)}
+
+    def test_iter_csv_chunks_per_batch(self):
+        """Test that each batch becomes one CSV chunk after the header"""
+        ts = datetime(2025, 1, 1, 12, 0)
+        batches = [[(1, "add", 2.0, 3.0, 5.0, ts, 1)], [(2, "divide", 1.0, 4.0, 0.25, None, 2)]]
+        chunks = list(iter_csv(batches))
+        assert len(chunks) == 3
+        assert chunks[0].decode().strip() == ",".join(COLUMNS)
+        rows = parse_csv(b"".join(chunks))
+        assert rows[0]["timestamp"] == "2025-01-01T12:00:00"
+        assert rows[1]["result"] == "0.25"
+        assert rows[1]["timestamp"] == ""
+
+    def test_write_parquet(self, tmp_path):
+        """Test that each batch becomes a Parquet row group"""
+        pq = pytest.importorskip("pyarrow.parquet")
+        ts = datetime(2025, 1, 1, 12, 0)
+        batches = [[(1, "add", 2.0, 3.0, 5.0, ts, 1)] * 2, [(3, "divide", 1.0, 4.0, 0.25, ts, 2)]]
+        path = tmp_path / "out.parquet"
+        assert write_parquet(batches, path) == 3
+        parquet = pq.ParquetFile(path)
+        assert parquet.metadata.num_row_groups == 2
+        table = parquet.read()
+        assert table.column_names == list(COLUMNS)
+        assert table.column("operation").to_pylist() == ["add", "add", "divide"]
+
+    def test_export_unavailable_without_database(self, monkeypatch):
+        """Test that the endpoint returns 503 when no database is configured"""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        response = client.get("/calculations/export")
+        assert response.status_code == 503
+
+    def test_export_rejects_bad_batch_size(self):
+        """Test that the endpoint validates batch_size"""
+        response = client.get("/calculations/export", params={"batch_size": 0})
+        assert response.status_code == 400
+
+
+class TestExportFromDatabase:
+    """Test cases reading from PostgreSQL through a server-side cursor"""
+
+    SCRIPTS = ("01_create_tables.sql", "02_insert_records.sql")
+
+    def test_batches_and_user_filter(self, postgres_url):
+        """Test fixed-size batches in id order, filtered by user"""
+        url = postgres_url(*self.SCRIPTS)
+        with psycopg.connect(url) as conn:
+            batches = list(iter_calculation_batches(conn, batch_size=2))
+            assert [len(batch) for batch in batches] == [2, 1]
+            assert [row[0] for batch in batches for row in batch] == [1, 2, 3]
+            rows = [row for batch in iter_calculation_batches(conn, user_id=2) for row in batch]
+        assert [(row[1], row[4]) for row in rows] == [("multiply", 20.0)]
+
+    def test_time_range_on_partitioned_layout(self, postgres_url):
+        """Test that start is inclusive, end exclusive and codes become names"""
+        url = postgres_url("01_create_tables.sql")
+        now = datetime.now().replace(microsecond=0)
+        with psycopg.connect(url) as conn:
+            conn.execute("DROP TABLE calculations")
+            conn.execute((SQL_DIR / "06_partitioned_calculations.sql").read_text())
+            conn.execute("INSERT INTO users (username, email) VALUES ('alice', 'a@example.com')")
+            conn.execute(
+                "INSERT INTO calculations (operation, operand_a, operand_b, result, user_id, timestamp) "
+                "VALUES (1, 2, 3, 5, 1, %(a)s), (4, 10, 2, 5, 1, %(b)s), (3, 2, 2, 4, 1, %(c)s)",
+                {"a": now - timedelta(hours=2), "b": now - timedelta(hours=1), "c": now},
+            )
+            batches = iter_calculation_batches(
+                conn, start=now - timedelta(hours=1), end=now
+            )
+            rows = [row for batch in batches for row in batch]
+        assert [row[1] for row in rows] == ["divide"]
+
+    def test_export_endpoint_streams_csv(self, postgres_url, monkeypatch):
+        """Test the CSV endpoint against a real database"""
+        monkeypatch.setenv("DATABASE_URL", postgres_url(*self.SCRIPTS))
+        response = client.get("/calculations/export", params={"user_id": 1, "batch_size": 1})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        rows = parse_csv(response.content)
+        assert [row["operation"] for row in rows] == ["add", "divide"]
+
+    def test_cli_parquet(self, postgres_url, tmp_path):
+        """Test the CLI writing Parquet"""
+        pq = pytest.importorskip("pyarrow.parquet")
+        url = postgres_url(*self.SCRIPTS)
+        output = tmp_path / "history.parquet"
+        assert main(["--format", "parquet", "--output", str(output),
+                     "--database-url", url, "--batch-size", "2"]) == 0
+        assert pq.read_table(output).num_rows == 3
+
+    def test_cli_csv_to_stdout(self, postgres_url, capsysbinary):
+        """Test the CLI writing CSV to stdout"""
+        url = postgres_url(*self.SCRIPTS)
+        assert main(["--database-url", url, "--user-id", "2"]) == 0
+        rows = parse_csv(capsysbinary.readouterr().out)
+        assert [row["operation"] for row in rows] == ["multiply"]
@@ -0,0 +1,142 @@
+"""
+Tests for the batch expression evaluator
+"""
+import pytest
+from fastapi.testclient import TestClient
+import main
+from expressions import ExpressionDAG, ExpressionError, evaluate_expressions, parse
+from operations import DivisionByZeroError
+
+client = TestClient(main.app)
+
+
+class TestParse:
+    """Test cases for parse"""
+
+    def test_operators_and_functions(self):
+        """Test that operators and registered operations map to the same trees"""
+        assert parse("(1 + 2) / 4") == parse("divide(add(1, 2), 4)")
+        assert parse("-3") == ("const", -3.0)
+        assert parse("-(1 * 2)") == ("multiply", ("const", -1.0), ("multiply", ("const", 1.0),
+                                                                    ("const", 2.0)))
+
+    @pytest.mark.parametrize("expression", [
+        "1 +", "x + 1", "2 ** 3", "__import__('os')", "power(1, 2)", "1" * 1001,
+    ])
+    def test_rejects(self, expression):
+        """Test that anything beyond arithmetic is refused"""
+        with pytest.raises(ExpressionError):
+            parse(expression)
+
+
+class TestExpressionDAG:
+    """Test cases for ExpressionDAG"""
+
+    def test_shared_subexpressions(self):
+        """Test that identical and commuted subexpressions share one node"""
+        dag = ExpressionDAG()
+        first = dag.add(parse("(1 + 2) / 3"))
+        second = dag.add(parse("(2 + 1) / 3"))
+        third = dag.add(parse("(1 + 2) / 5"))
+        assert first == second != third
+        assert dag.submitted == 6
+        assert sum(1 for depth in dag.depth if depth) == 3
+
+    def test_subtraction_is_not_commuted(self):
+        """Test that operand order is kept for non-commutative operations"""
+        dag = ExpressionDAG()
+        assert dag.add(parse("1 - 2")) != dag.add(parse("2 - 1"))
+
+    def test_failed_add_is_rolled_back(self):
+        """Test that an add stopped by RecursionError leaves no nodes behind"""
+        dag = ExpressionDAG()
+        root = dag.add(parse("1 + 2"))
+        with pytest.raises(RecursionError):
+            dag.add(deep_tree(100000))
+        assert (len(dag), dag.submitted) == (3, 1)
+        assert dag.add(parse("1 + 2")) == root
+        assert dag.add(parse("1 + 0")) == 4
+
+    def test_negative_zero_constant(self):
+        """Test that 0.0 and -0.0 stay distinct constants"""
+        dag = ExpressionDAG()
+        assert dag.add(parse("0.0")) != dag.add(parse("-0.0"))
+
+
+def deep_tree(depth):
+    """Tree of nested additions, deeper than the recursion limit allows"""
+    tree = ("const", 1.0)
+    for i in range(depth):
+        tree = ("add", tree, ("const", float(i)))
+    return tree
+
+
+class TestEvaluateExpressions:
+    """Test cases for evaluate_expressions"""
+
+    def test_results_and_report(self):
+        """Test that each unique operation runs once across the batch"""
+        expressions = [f"(10 + 20) / {divisor}" for divisor in range(1, 1001)]
+        outcomes, report = evaluate_expressions(expressions)
+        assert outcomes[0] == 30.0
+        assert outcomes[2] == 10.0
+        assert report.operations_submitted == 2000
+        assert report.operations_evaluated == 1001
+        assert report.operations_saved == 999
+        assert report.kernel_calls == 2
+        assert report.depth == 2
+
+    def test_too_deep_expression_not_counted(self, monkeypatch):
+        """Test that an over-deep expression does not skew the report"""
+        monkeypatch.setattr("expressions.parse",
+                            lambda text: deep_tree(100000) if text == "deep" else parse(text))
+        outcomes, report = evaluate_expressions(["2 * 3", "deep"])
+        assert outcomes[0] == 6.0
+        assert isinstance(outcomes[1], ExpressionError)
+        assert (report.operations_submitted, report.operations_evaluated) == (1, 1)
+        assert (report.kernel_calls, report.depth) == (1, 1)
+
+    def test_errors_propagate(self):
+        """Test that division by zero fails every expression using it"""
+        outcomes, _ = evaluate_expressions(["1 / 0", "(1 / 0) + 5", "2 * 3", "oops("])
+        assert isinstance(outcomes[0], DivisionByZeroError)
+        assert isinstance(outcomes[1], DivisionByZeroError)
+        assert outcomes[2] == 6.0
+        assert isinstance(outcomes[3], ExpressionError)
+
+    def test_matches_scalar_evaluation(self):
+        """Test agreement with Python arithmetic"""
+        expressions = ["1.5 * (2 - 7) / 3", "multiply(4, subtract(10, 2.5))", "-(2 + 3) * 2"]
+        outcomes, _ = evaluate_expressions(expressions)
+        assert outcomes == [1.5 * (2 - 7) / 3, 4 * (10 - 2.5), -(2 + 3) * 2]
+
+
+class TestExpressionsEndpoint:
+    """Test cases for POST /calculate/expressions"""
+
+    def test_batch(self):
+        """Test results, errors and the report"""
+        response = client.post("/calculate/expressions", json={
+            "expressions": ["(1 + 2) / 3", "(2 + 1) / 0", "1 +"]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"][0] == {"expression": "(1 + 2) / 3", "result": 1.0, "error": None}
+        assert data["results"][1]["error"] == "Cannot divide by zero"
+        assert data["results"][2]["result"] is None
+        assert data["report"]["operations_submitted"] == 4
+        assert data["report"]["operations_evaluated"] == 3
+
+    def test_overflow_is_a_per_expression_error(self):
+        """Test that a result overflowing to infinity fails only its expression"""
+        response = client.post("/calculate/expressions", json={
+            "expressions": ["1e308 * 10", "1e308 * 10 - 1e308 * 10", "2 + 2"]
+        })
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["error"] for r in results] == ["Result out of range", "Result out of range", None]
+        assert results[2]["result"] == 4.0
+
+    def test_empty_batch(self):
+        """Test that an empty batch is rejected"""
+        assert client.post("/calculate/expressions", json={"expressions": []}).status_code == 400
@@ -0,0 +1,109 @@
+"""
+Tests for the calculation history stores
+"""
+import sqlite3
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+import main
+from history_store import (
+    create_history_store, NullHistoryStore, SQLiteHistoryStore, PostgresHistoryStore,
+    HistoryStoreError
+)
+
+client = TestClient(main.app)
+
+
+class TestStoreSelection:
+    """Test cases for choosing a backend from DATABASE_URL"""
+
+    def test_no_url_records_nothing(self, monkeypatch):
+        """Test that history is off without DATABASE_URL"""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        store = create_history_store()
+        assert isinstance(store, NullHistoryStore)
+        assert store.record("add", 1, 2, 3) is False
+
+    def test_sqlite_url(self, tmp_path):
+        """Test that sqlite:/// URLs select the embedded store"""
+        store = create_history_store(f"sqlite:///{tmp_path / 'history.db'}")
+        try:
+            assert isinstance(store, SQLiteHistoryStore)
+        finally:
+            store.close()
+
+    def test_unsupported_url(self):
+        """Test that unknown schemes are rejected"""
+        with pytest.raises(HistoryStoreError):
+            create_history_store("mysql://localhost/db")
+
+
+class TestSQLiteHistoryStore:
+    """Test cases for the embedded SQLite backend"""
+
+    def test_batched_writes(self, tmp_path):
+        """Test that recorded calculations are written in WAL mode"""
+        path = tmp_path / "history.db"
+        store = SQLiteHistoryStore(str(path), batch_size=100)
+        for i in range(250):
+            assert store.record("add", i, 1, i + 1)
+        assert store.flush(timeout=5)
+        assert store.stats()["written"] == 250
+        store.close()
+
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            count, total = conn.execute("SELECT count(*), sum(result) FROM calculations").fetchone()
+        assert count == 250
+        assert total == sum(range(1, 251))
+
+    def test_user_ids_recorded(self, tmp_path):
+        """Test that calculations made for a user are kept without a users row"""
+        path = tmp_path / "history.db"
+        store = SQLiteHistoryStore(str(path))
+        store.record("add", 1, 1, 2, user_id=1)
+        store.record("add", 2, 2, 4, user_id=99)
+        store.record("add", 3, 3, 6)
+        store.close()
+        assert store.stats()["written"] == 3
+        assert store.stats()["failed"] == 0
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT user_id FROM calculations ORDER BY id").fetchall()
+        assert rows == [(1,), (99,), (None,)]
+
+    def test_closed_store_refuses(self, tmp_path):
+        """Test that nothing is accepted after close"""
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+        store.close()
+        assert store.record("add", 1, 1, 2) is False
+
+    def test_calculate_endpoint_records(self, tmp_path, monkeypatch):
+        """Test that successful API calculations reach the store"""
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+        monkeypatch.setattr(main, "history_store", store)
+        client.post("/calculate", json={"num1": 6, "num2": 3, "operation": "DIVIDE"})
+        client.post("/calculate", json={"num1": 1, "num2": 0, "operation": "divide"})
+        client.post("/calculate", json={"num1": 2, "num2": 5, "operation": "add", "user_id": 7})
+        store.close()
+        with sqlite3.connect(tmp_path / "history.db") as conn:
+            rows = conn.execute(
+                "SELECT operation, operand_a, result, user_id FROM calculations ORDER BY id"
+            ).fetchall()
+        assert rows == [("divide", 6.0, 2.0, None), ("add", 2.0, 7.0, 7)]
+
+
+class TestPostgresHistoryStore:
+    """Test cases for the PostgreSQL backend"""
+
+    def test_records_only_user_calculations(self, postgres_url):
+        """Test that only calculations with a user_id are written"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql")
+        store = PostgresHistoryStore(url)
+        assert store.record("add", 1, 1, 2) is False
+        assert store.record("multiply", 2, 4, 8, user_id=2)
+        store.close()
+        with psycopg.connect(url) as conn:
+            row = conn.execute(
+                "SELECT operation, result FROM calculations WHERE user_id = 2 ORDER BY id DESC"
+            ).fetchone()
+        assert row == ("multiply", 8.0)
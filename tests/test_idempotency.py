@@ -0,0 +1,187 @@
+"""
+Tests for Idempotency-Key handling
+"""
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+import main
+from idempotency import (
+    IdempotencyManager, MemoryIdempotencyStore, SQLiteIdempotencyStore,
+    create_idempotency_store, validate_key, IdempotencyError,
+    IdempotencyKeyMismatchError, IdempotencyInProgressError
+)
+from recent_history import RecentHistory
+
+client = TestClient(main.app)
+
+
+class TestStores:
+    """Test cases for the idempotency stores"""
+
+    def test_memory_claim_complete_replay(self):
+        """Test that the first claim wins and later claims see the response"""
+        store = MemoryIdempotencyStore()
+        assert store.claim("k", "fp") == (True, None)
+        claimed, record = store.claim("k", "fp")
+        assert not claimed and record.pending
+        store.complete("k", 200, b"{}")
+        claimed, record = store.claim("k", "fp")
+        assert not claimed and (record.status_code, record.body) == (200, b"{}")
+
+    def test_memory_bounded_and_expiring(self, monkeypatch):
+        """Test that the oldest keys are evicted and expired keys are forgotten"""
+        store = MemoryIdempotencyStore(ttl=10, max_entries=3)
+        for key in "abcde":
+            store.claim(key, "fp")
+            store.complete(key, 200, b"")
+        assert len(store) == 3
+        assert store.get("a") is None and store.get("e") is not None
+        now = time.time()
+        monkeypatch.setattr("idempotency.time.time", lambda: now + 11)
+        assert store.get("e") is None
+        assert store.claim("e", "other")[0] is True
+
+    def test_release(self):
+        """Test that a released claim can be taken again"""
+        store = MemoryIdempotencyStore()
+        store.claim("k", "fp")
+        store.release("k")
+        assert store.claim("k", "fp")[0] is True
+
+    def test_sqlite_shared_between_instances(self, tmp_path):
+        """Test that two processes' stores see each other's keys"""
+        path = str(tmp_path / "keys.db")
+        first, second = SQLiteIdempotencyStore(path), SQLiteIdempotencyStore(path)
+        try:
+            assert first.claim("k", "fp") == (True, None)
+            assert second.claim("k", "fp")[1].pending
+            first.complete("k", 400, b'{"detail":"x"}')
+            record = second.get("k")
+            assert (record.status_code, record.body) == (400, b'{"detail":"x"}')
+        finally:
+            first.close()
+            second.close()
+
+    def test_selection(self, tmp_path):
+        """Test backend selection from IDEMPOTENCY_STORE"""
+        assert isinstance(create_idempotency_store("memory"), MemoryIdempotencyStore)
+        store = create_idempotency_store(f"sqlite:///{tmp_path / 'keys.db'}")
+        assert isinstance(store, SQLiteIdempotencyStore)
+        store.close()
+        with pytest.raises(IdempotencyError):
+            create_idempotency_store("redis://localhost")
+
+    def test_key_validation(self):
+        """Test that keys must be short printable ASCII"""
+        assert validate_key("abc-123") == "abc-123"
+        for key in ("", "a b", "x" * 256, "clé"):
+            with pytest.raises(IdempotencyError):
+                validate_key(key)
+
+
+class TestIdempotencyManager:
+    """Test cases for IdempotencyManager"""
+
+    @pytest.mark.parametrize("store_factory", [
+        lambda tmp_path: MemoryIdempotencyStore(),
+        lambda tmp_path: SQLiteIdempotencyStore(str(tmp_path / "keys.db")),
+    ])
+    def test_concurrent_duplicates_compute_once(self, tmp_path, store_factory):
+        """Test that duplicates arriving together wait for the first result"""
+        manager = IdempotencyManager(store_factory(tmp_path))
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 200, b"done"
+
+        async def scenario():
+            return await asyncio.gather(*[manager.run("k", "fp", compute) for _ in range(5)])
+
+        results = asyncio.run(scenario())
+        manager.close()
+        assert len(calls) == 1
+        assert [r[:2] for r in results] == [(200, b"done")] * 5
+        assert sorted(r[2] for r in results) == [False] + [True] * 4
+
+    def test_failure_is_not_stored(self):
+        """Test that a failed first request lets the retry compute"""
+        manager = IdempotencyManager(MemoryIdempotencyStore())
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def succeed():
+            return 200, b"ok"
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(manager.run("k", "fp", fail))
+        assert asyncio.run(manager.run("k", "fp", succeed)) == (200, b"ok", False)
+
+    def test_mismatch_and_timeout(self):
+        """Test reuse with another request and a first request that never ends"""
+        store = MemoryIdempotencyStore()
+        manager = IdempotencyManager(store, wait_timeout=0.05)
+
+        async def succeed():
+            return 200, b"ok"
+
+        asyncio.run(manager.run("k", "fp", succeed))
+        with pytest.raises(IdempotencyKeyMismatchError):
+            asyncio.run(manager.run("k", "other", succeed))
+        store.claim("stuck", "fp")
+        with pytest.raises(IdempotencyInProgressError):
+            asyncio.run(manager.run("stuck", "fp", succeed))
+
+
+class TestCalculateIdempotency:
+    """Test cases for Idempotency-Key on POST /calculate"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_state(self, monkeypatch):
+        monkeypatch.setattr(main, "idempotency", IdempotencyManager(MemoryIdempotencyStore()))
+        monkeypatch.setattr(main, "recent_history", RecentHistory(capacity=10))
+
+    def test_retry_is_replayed_not_recomputed(self):
+        """Test that a retry returns the stored response and records once"""
+        payload = {"num1": 6, "num2": 3, "operation": "divide"}
+        headers = {"Idempotency-Key": "req-1"}
+        first = client.post("/calculate", json=payload, headers=headers)
+        second = client.post("/calculate", json=payload, headers=headers)
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json() == {
+            "result": 2.0, "operation": "divide", "num1": 6.0, "num2": 3.0
+        }
+        assert "idempotent-replayed" not in first.headers
+        assert second.headers["idempotent-replayed"] == "true"
+        assert len(main.recent_history) == 1
+
+    def test_error_responses_are_replayed(self):
+        """Test that a client error is stored like a success"""
+        payload = {"num1": 1, "num2": 0, "operation": "divide"}
+        headers = {"Idempotency-Key": "req-2"}
+        client.post("/calculate", json=payload, headers=headers)
+        response = client.post("/calculate", json=payload, headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Cannot divide by zero"
+        assert response.headers["idempotent-replayed"] == "true"
+
+    def test_key_reuse_and_bad_key(self):
+        """Test 422 for a reused key and 400 for a malformed key"""
+        headers = {"Idempotency-Key": "req-3"}
+        client.post("/calculate", json={"num1": 1, "num2": 2, "operation": "add"}, headers=headers)
+        response = client.post("/calculate", json={"num1": 1, "num2": 3, "operation": "add"},
+                               headers=headers)
+        assert response.status_code == 422
+        response = client.post("/calculate", json={"num1": 1, "num2": 3, "operation": "add"},
+                               headers={"Idempotency-Key": "x" * 300})
+        assert response.status_code == 400
+
+    def test_without_key_unchanged(self):
+        """Test that requests without the header are always computed"""
+        payload = {"num1": 1, "num2": 2, "operation": "add"}
+        client.post("/calculate", json=payload)
+        client.post("/calculate", json=payload)
+        assert len(main.recent_history) == 2
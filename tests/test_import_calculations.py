@@ -0,0 +1,181 @@
+"""
+Tests for the bulk calculation importer
+"""
+import csv
+import json
+from pathlib import Path
+import psycopg
+import pytest
+from import_calculations import (
+    read_rows, chunked, validate_record, validate_chunk, validated_chunks, import_file, main
+)
+
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+CSV_HEADER = "operation,operand_a,operand_b,result,user_id,timestamp\n"
+
+
+class TestReading:
+    """Test cases for streaming input files"""
+
+    def test_read_csv(self, tmp_path):
+        """Test reading CSV rows with line numbers"""
+        path = tmp_path / "in.csv"
+        path.write_text(CSV_HEADER + "add,1,2,3,1,\nmultiply,2,3,6,2,2025-01-01T10:00:00\n")
+        rows = list(read_rows(path))
+        assert [line for line, _ in rows] == [2, 3]
+        assert rows[1][1]["operation"] == "multiply"
+
+    def test_read_ndjson_with_bad_line(self, tmp_path):
+        """Test that unparsable NDJSON lines are kept for the reject file"""
+        path = tmp_path / "in.ndjson"
+        path.write_text('{"operation": "add"}\nnot json\n\n[1, 2]\n')
+        rows = list(read_rows(path))
+        assert [line for line, _ in rows] == [1, 2, 4]
+        assert "_raw" in rows[1][1]
+        assert "_raw" in rows[2][1]
+
+    def test_chunked(self):
+        """Test grouping rows into chunks"""
+        assert [len(c) for c in chunked(((i, {}) for i in range(5)), 2)] == [2, 2, 1]
+
+
+class TestValidation:
+    """Test cases for row validation"""
+
+    def test_valid_record(self):
+        """Test that a correct record is normalized"""
+        operation, a, b, result, timestamp, user_id, username = validate_record({
+            "operation": "DIVIDE", "operand_a": "10", "operand_b": "4", "result": "2.5",
+            "user_id": "3", "timestamp": "2025-01-01T12:00:00Z",
+        })
+        assert (operation, a, b, result, user_id, username) == ("divide", 10.0, 4.0, 2.5, 3, None)
+        assert timestamp.isoformat() == "2025-01-01T12:00:00"
+
+    @pytest.mark.parametrize("record, reason", [
+        ({"operation": "add", "operand_a": 1, "operand_b": 2, "result": 4, "user_id": 1}, "result mismatch"),
+        ({"operation": "divide", "operand_a": 1, "operand_b": 0, "result": 0, "user_id": 1}, "division by zero"),
+        ({"operation": "power", "operand_a": 1, "operand_b": 2, "result": 1, "user_id": 1}, "invalid operation"),
+        ({"operation": "add", "operand_a": "x", "operand_b": 2, "result": 1, "user_id": 1}, "non-numeric"),
+        ({"operation": "add", "operand_a": 1, "operand_b": 2, "result": 3}, "missing user_id"),
+        ({"operation": "add", "operand_a": 1, "operand_b": 2}, "missing field result"),
+        ({"operation": "add", "operand_a": 1, "operand_b": 2, "result": 3, "user_id": 1,
+          "timestamp": "yesterday"}, "invalid timestamp"),
+    ])
+    def test_rejections(self, record, reason):
+        """Test that invalid records are rejected with a reason"""
+        with pytest.raises(ValueError, match=reason):
+            validate_record(record)
+
+    def test_validate_chunk_keeps_order(self):
+        """Test that valid and rejected rows keep their line numbers"""
+        chunk = [
+            (1, {"operation": "add", "operand_a": 1, "operand_b": 1, "result": 2, "username": "alice"}),
+            (2, {"_raw": "garbage"}),
+            (3, {"operation": "subtract", "operand_a": 5, "operand_b": 1, "result": 4, "user_id": 2}),
+        ]
+        valid, rejects = validate_chunk(chunk)
+        assert [row[0] for row in valid] == [1, 3]
+        assert rejects[0][:2] == (2, "unparsable line")
+
+    def test_parallel_validation_matches_inline(self):
+        """Test that the process pool yields the same results in order"""
+        chunks = [
+            [(i, {"operation": "multiply", "operand_a": i, "operand_b": 2,
+                  "result": i * 2 + (i % 3 == 0), "user_id": 1}) for i in range(start, start + 50)]
+            for start in range(0, 500, 50)
+        ]
+        inline = list(validated_chunks(chunks, workers=1))
+        parallel = list(validated_chunks(chunks, workers=2))
+        assert parallel == inline
+        assert sum(len(rejects) for _, rejects in parallel) == 167
+
+
+class TestImportIntoPostgres:
+    """Test cases for COPY loading (requires TEST_DATABASE_URL)"""
+
+    def _write_input(self, path):
+        path.write_text(
+            CSV_HEADER
+            + "add,2,3,5,1,2025-01-01T10:00:00\n"
+            + "divide,1,0,0,1,\n"
+            + "multiply,4,5,20,2,\n"
+            + "add,1,1,2,99,\n"
+            + "subtract,9,4,5,1,2025-01-02T10:00:00\n"
+        )
+
+    def test_import_legacy_layout(self, postgres_url, tmp_path):
+        """Test importing into the layout from 01_create_tables.sql"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql")
+        source, rejects = tmp_path / "in.csv", tmp_path / "rejects.csv"
+        self._write_input(source)
+        with psycopg.connect(url) as conn:
+            summary = import_file(source, conn, rejects, batch_rows=2)
+            count = conn.execute("SELECT count(*) FROM calculations").fetchone()[0]
+        assert summary["rows_loaded"] == 3
+        assert summary["rows_rejected"] == 2
+        assert summary["last_committed_line"] == 6
+        assert count == 6
+        reasons = [row["reason"] for row in csv.DictReader(open(rejects))]
+        assert reasons == ["division by zero", "unknown user"]
+
+    def test_import_partitioned_layout(self, postgres_url, tmp_path):
+        """Test importing into the partitioned layout with operation codes"""
+        url = postgres_url("01_create_tables.sql")
+        with psycopg.connect(url) as conn:
+            conn.execute("DROP TABLE calculations")
+            conn.execute((SQL_DIR / "06_partitioned_calculations.sql").read_text())
+            conn.execute("INSERT INTO users (username, email) VALUES ('a', 'a@x'), ('b', 'b@x')")
+        source = tmp_path / "in.ndjson"
+        source.write_text(
+            json.dumps({"operation": "add", "operand_a": 2, "operand_b": 3, "result": 5,
+                        "username": "b", "timestamp": "2019-03-01T10:00:00"}) + "\n"
+        )
+        with psycopg.connect(url) as conn:
+            summary = import_file(source, conn, None)
+            row = conn.execute("SELECT operation, user_id FROM calculations_named").fetchone()
+            in_month = conn.execute("SELECT count(*) FROM calculations_p201903").fetchone()[0]
+        assert summary["rows_loaded"] == 1
+        assert row == ("add", 2)
+        assert in_month == 1
+
+    def test_refused_batch_is_rejected(self, postgres_url, tmp_path):
+        """Test that a batch the database refuses is rejected and the import goes on"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql")
+        with psycopg.connect(url) as conn:
+            conn.execute("ALTER TABLE calculations ADD CHECK (operand_a < 9) NOT VALID")
+        source, rejects = tmp_path / "in.csv", tmp_path / "rejects.csv"
+        self._write_input(source)
+        with psycopg.connect(url) as conn:
+            summary = import_file(source, conn, rejects, chunk_rows=1, batch_rows=1)
+        assert summary["rows_loaded"] == 2
+        assert summary["batches_failed"] == 1
+        assert summary["last_committed_line"] == 6
+        rows = list(csv.DictReader(open(rejects)))
+        assert rows[-1]["line"] == "6"
+        assert rows[-1]["reason"].startswith("batch failed")
+        assert json.loads(rows[-1]["record"])["operand_a"] == 9.0
+
+    def test_cli_resume(self, postgres_url, tmp_path, capsys):
+        """Test the CLI with --start-line skipping already imported lines"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql")
+        source = tmp_path / "in.csv"
+        self._write_input(source)
+        exit_code = main([str(source), "--database-url", url, "--workers", "1",
+                          "--start-line", "4"])
+        summary = json.loads(capsys.readouterr().out)
+        assert exit_code == 1
+        assert summary["rows_read"] == 2
+        assert summary["rows_loaded"] == 1
+
+    def test_cli_resume_appends_rejects(self, postgres_url, tmp_path, capsys):
+        """Test that resuming keeps rejects from the interrupted run"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql")
+        source, rejects = tmp_path / "in.csv", tmp_path / "rejects.csv"
+        self._write_input(source)
+        args = [str(source), "--database-url", url, "--workers", "1", "--rejects", str(rejects)]
+        main(args + ["--batch-rows", "1"])
+        main(args + ["--start-line", "3"])
+        capsys.readouterr()
+        rows = list(csv.DictReader(open(rejects)))
+        assert [row["line"] for row in rows] == ["3", "5", "5"]
+        assert json.loads(rows[-1]["record"])["user_id"] == "99"
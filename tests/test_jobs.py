@@ -0,0 +1,178 @@
+"""
+Tests for background calculation jobs
+"""
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import main
+from jobs import (
+    JobManager, JobError, JobNotFoundError, JobNotReadyError,
+    STATUS_COMPLETED, STATUS_FAILED, STATUS_RUNNING
+)
+from metrics import MetricsRegistry
+
+client = TestClient(main.app)
+
+
+def wait_for(manager, job_id, timeout=10):
+    """Poll until the job reaches a final status"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job.status in (STATUS_COMPLETED, STATUS_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def pairs_bytes(num1, num2):
+    return np.column_stack([num1, num2]).astype("<f8").tobytes()
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(tmp_path / "jobs", workers=2, chunk_rows=100, input_dir=tmp_path)
+    yield manager
+    manager.close()
+
+
+def upload(manager, operation, fmt, data):
+    job = manager.create(operation, fmt)
+    manager.upload_path(job).write_bytes(data)
+    return manager.submit(job)
+
+
+class TestJobManager:
+    """Test cases for JobManager"""
+
+    def test_f8_job_in_chunks(self, manager):
+        """Test that a packed job is split into chunks and matches the kernel"""
+        num1 = np.arange(1050, dtype=float)
+        num2 = np.arange(1050, dtype=float) % 5
+        job = wait_for(manager, upload(manager, "divide", "f8", pairs_bytes(num1, num2)).id)
+        assert job.status == STATUS_COMPLETED
+        assert (job.rows, job.chunks, job.chunks_done) == (1050, 11, 11)
+        assert job.invalid_rows == 210
+        assert job.progress == 1.0
+
+        results = np.frombuffer(b"".join(manager.iter_result(job.id)), dtype="<f8")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = np.where(num2 == 0, np.nan, num1 / num2)
+        assert np.array_equal(results, expected, equal_nan=True)
+        mask = np.frombuffer(b"".join(manager.iter_result(job.id, "mask")), dtype=np.uint8)
+        invalid = np.unpackbits(mask, bitorder="little")[:1050].astype(bool)
+        assert np.array_equal(invalid, num2 == 0)
+
+    def test_csv_job(self, manager):
+        """Test that CSV input produces result,error lines"""
+        data = b"num2,num1\n2,10\n0,1\n4,2\n"
+        job = wait_for(manager, upload(manager, "DIVIDE", "csv", data).id)
+        assert job.status == STATUS_COMPLETED
+        output = b"".join(manager.iter_result(job.id)).decode()
+        assert output == "result,error\n5.0,\n,Cannot divide by zero\n0.5,\n"
+
+    def test_bad_input_fails_job(self, manager):
+        """Test that malformed input fails the job with a reason"""
+        job = wait_for(manager, upload(manager, "add", "f8", b"\x00" * 20).id)
+        assert job.status == STATUS_FAILED
+        assert "multiple of 16" in job.error
+        job = wait_for(manager, upload(manager, "add", "csv", b"num1,num2\n1,x\n").id)
+        assert job.status == STATUS_FAILED
+        assert "Line 2" in job.error
+        with pytest.raises(JobNotReadyError):
+            manager.iter_result(job.id)
+
+    def test_rejects_bad_jobs(self, manager, tmp_path):
+        """Test validation of operation, format and local paths"""
+        with pytest.raises(JobError):
+            manager.create("power", "f8")
+        with pytest.raises(JobError):
+            manager.create("add", "parquet")
+        with pytest.raises(JobError):
+            manager.submit_path("add", "f8", "/etc/passwd")
+        with pytest.raises(JobNotFoundError):
+            manager.get("../../etc")
+
+    def test_local_path(self, manager, tmp_path):
+        """Test that local inputs are read in place"""
+        source = tmp_path / "input.f8"
+        source.write_bytes(pairs_bytes([1.0, 2.0], [3.0, 4.0]))
+        job = wait_for(manager, manager.submit_path("multiply", "f8", str(source)).id)
+        assert np.frombuffer(b"".join(manager.iter_result(job.id)), "<f8").tolist() == [3.0, 8.0]
+
+    def test_resume_after_restart(self, tmp_path, monkeypatch):
+        """Test that a restarted manager only evaluates the missing chunks"""
+        directory = tmp_path / "jobs"
+        directory.mkdir()
+        first = JobManager(directory, workers=1, chunk_rows=8)
+        monkeypatch.setattr(first, "start", lambda: None)
+        job = upload(first, "add", "f8", pairs_bytes(np.arange(40.0), np.ones(40)))
+        # Evaluate ingest and two chunks by hand, as if the process then died
+        first._tasks.get()
+        first._ingest(job)
+        assert job.status == STATUS_RUNNING
+        for _ in range(2):
+            task = first._tasks.get()
+            first._evaluate(job, task[2])
+
+        second = JobManager(directory, workers=1, chunk_rows=8)
+        second.start()
+        try:
+            resumed = wait_for(second, job.id)
+            assert resumed.status == STATUS_COMPLETED
+            assert resumed.chunks_done == 5
+            results = np.frombuffer(b"".join(second.iter_result(job.id)), "<f8")
+            assert results.tolist() == list(np.arange(40.0) + 1)
+        finally:
+            second.close()
+
+
+class TestMetrics:
+    """Test cases for the metrics registry"""
+
+    def test_render(self):
+        """Test the Prometheus text format"""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests", ("status",))
+        requests.inc(status="200")
+        requests.inc(2, status="500")
+        registry.gauge("depth", "Queue depth", function=lambda: 3)
+        text = registry.render()
+        assert '# TYPE requests_total counter' in text
+        assert 'requests_total{status="500"} 2' in text
+        assert "depth 3" in text
+        with pytest.raises(ValueError):
+            requests.inc(-1, status="200")
+
+
+class TestJobEndpoints:
+    """Test cases for the /jobs endpoints"""
+
+    def test_upload_poll_and_stream(self, manager, monkeypatch):
+        """Test the full job lifecycle over HTTP"""
+        monkeypatch.setattr(main, "job_manager", manager)
+        response = client.post("/jobs", params={"operation": "subtract"},
+                               content=pairs_bytes([5.0, 7.0], [1.0, 2.0]))
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        wait_for(manager, job_id)
+
+        status = client.get(f"/jobs/{job_id}").json()
+        assert status["status"] == "completed"
+        assert status["rows"] == 2
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 200
+        assert result.headers["x-row-count"] == "2"
+        assert np.frombuffer(result.content, "<f8").tolist() == [4.0, 5.0]
+
+        metrics = client.get("/metrics").text
+        assert 'calculator_jobs{status="completed"} 1' in metrics
+        assert "calculator_job_rows_processed_total" in metrics
+
+    def test_errors(self, manager, monkeypatch):
+        """Test status codes for bad submissions and unknown jobs"""
+        monkeypatch.setattr(main, "job_manager", manager)
+        assert client.post("/jobs", params={"operation": "power"}, content=b"").status_code == 400
+        assert client.get("/jobs/" + "0" * 32).status_code == 404
+        assert client.get("/jobs/" + "0" * 32 + "/result").status_code == 404
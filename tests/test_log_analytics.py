@@ -0,0 +1,189 @@
+"""
+Tests for the incremental log analytics CLI
+"""
+import gzip
+import json
+import os
+import logging
+import pytest
+from log_analytics import LatencyHistogram, LogAnalytics, find_log_files, main
+from logger_config import CompressingRotatingFileHandler
+
+
+def text_line(ts, method, path, status, duration):
+    """Build a completion line in the detailed text format"""
+    return (
+        f"{ts} - fastapi_calculator - INFO - main.py:80 - log_requests() - "
+        f"Request completed: {method} {path} - Status: {status} - Duration: {duration:.3f}s\n"
+    )
+
+
+def json_line(ts, method, path, status, duration):
+    """Build a completion line in the JSON format"""
+    return json.dumps({
+        "timestamp": ts.replace(" ", "T") + ".123",
+        "level": "INFO",
+        "message": f"Request completed: {method} {path} - Status: {status} - Duration: {duration:.3f}s",
+    }) + "\n"
+
+
+class TestLatencyHistogram:
+    """Test cases for LatencyHistogram"""
+
+    def test_percentiles_within_error(self):
+        """Test that percentiles stay within the histogram's relative error"""
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.add(ms / 1000)
+        assert histogram.count == 1000
+        assert histogram.percentile(50) == pytest.approx(0.5, rel=0.02)
+        assert histogram.percentile(99) == pytest.approx(0.99, rel=0.02)
+        assert histogram.percentile(100) <= histogram.maximum
+
+    def test_round_trip(self):
+        """Test that histograms survive serialization"""
+        histogram = LatencyHistogram()
+        histogram.add(0.0)
+        histogram.add(0.25)
+        restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+        assert restored.count == 2
+        assert restored.percentile(100) == histogram.percentile(100)
+
+
+class TestLogAnalytics:
+    """Test cases for parsing and checkpointing"""
+
+    def test_groups_by_route_status_and_bucket(self, tmp_path):
+        """Test that lines are grouped per route, status and time bucket"""
+        log = tmp_path / "app.log"
+        log.write_text(
+            text_line("2025-01-01 12:00:05", "GET", "/health", 200, 0.002)
+            + "2025-01-01 12:00:06 - fastapi_calculator - INFO - unrelated line\n"
+            + json_line("2025-01-01 12:01:10", "POST", "/calculate", 400, 0.010)
+            + text_line("2025-01-01 12:01:30", "POST", "/calculate", 200, 0.020)
+        )
+        analytics = LogAnalytics(bucket_seconds=60)
+        analytics.process([log])
+        report = analytics.report([50])
+
+        assert report["lines_parsed"] == 3
+        assert report["route"]["POST /calculate"]["count"] == 2
+        assert report["status"]["400"]["count"] == 1
+        assert report["bucket"]["2025-01-01 12:00:00"]["count"] == 1
+        assert report["bucket"]["2025-01-01 12:01:00"]["count"] == 2
+        assert report["route"]["GET /health"]["p50_ms"] == pytest.approx(2.0, rel=0.02)
+
+    def test_checkpoint_reads_only_new_bytes(self, tmp_path):
+        """Test that a second run only parses appended lines"""
+        log = tmp_path / "app.log"
+        checkpoint = tmp_path / "checkpoint.json"
+        log.write_text(text_line("2025-01-01 12:00:00", "GET", "/", 200, 0.001))
+
+        first = LogAnalytics.load(checkpoint, 60)
+        first.process([log])
+        first.save(checkpoint)
+
+        with open(log, "a") as handle:
+            handle.write(text_line("2025-01-01 12:00:01", "GET", "/", 200, 0.003))
+            handle.write("2025-01-01 12:00:02 - partial line without newline")
+
+        second = LogAnalytics.load(checkpoint, 60)
+        second.process([log])
+        assert second.lines_parsed == 1
+        assert second.report()["route"]["GET /"]["count"] == 2
+        offset = next(iter(second.files.values()))["offset"]
+        assert offset < log.stat().st_size
+
+    def test_follows_rotation_rename(self, tmp_path):
+        """Test that a renamed backup is not parsed twice"""
+        log = tmp_path / "app.log"
+        checkpoint = tmp_path / "checkpoint.json"
+        log.write_text(text_line("2025-01-01 12:00:00", "GET", "/", 200, 0.001))
+        analytics = LogAnalytics.load(checkpoint, 60)
+        analytics.process(find_log_files(tmp_path))
+        analytics.save(checkpoint)
+
+        os.rename(log, tmp_path / "app.log.1")
+        log.write_text(text_line("2025-01-01 12:05:00", "GET", "/", 200, 0.001))
+        analytics = LogAnalytics.load(checkpoint, 60)
+        analytics.process(find_log_files(tmp_path))
+        assert analytics.lines_parsed == 1
+        assert analytics.report()["route"]["GET /"]["count"] == 2
+
+    def test_compressed_segment_skips_read_prefix(self, tmp_path):
+        """Test that compressing a partly read segment does not double count"""
+        segment = tmp_path / "app.log.20250101-120000"
+        checkpoint = tmp_path / "checkpoint.json"
+        segment.write_text(text_line("2025-01-01 12:00:00", "GET", "/", 200, 0.001))
+        analytics = LogAnalytics.load(checkpoint, 60)
+        analytics.process(find_log_files(tmp_path))
+        analytics.save(checkpoint)
+
+        with open(segment, "a") as handle:
+            handle.write(text_line("2025-01-01 12:00:01", "GET", "/", 200, 0.001))
+        with open(segment, "rb") as src, gzip.open(str(segment) + ".gz", "wb") as dst:
+            dst.write(src.read())
+        segment.unlink()
+
+        analytics = LogAnalytics.load(checkpoint, 60)
+        analytics.process(find_log_files(tmp_path))
+        assert analytics.lines_parsed == 1
+        assert analytics.report()["route"]["GET /"]["count"] == 2
+
+    def test_managed_rotation_not_double_counted(self, tmp_path):
+        """Test a live file that is rotated and compressed between runs"""
+        checkpoint = tmp_path / "checkpoint.json"
+        handler = CompressingRotatingFileHandler(tmp_path / "app.log")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        def write(count, start):
+            for i in range(start, start + count):
+                line = text_line(f"2025-01-01 12:00:{i:02d}", "GET", "/", 200, 0.001)
+                handler.emit(logging.makeLogRecord({"msg": line.rstrip("\n")}))
+
+        try:
+            write(10, 0)
+            analytics = LogAnalytics.load(checkpoint, 60)
+            analytics.process(find_log_files(tmp_path))
+            analytics.save(checkpoint)
+
+            handler.doRollover()
+            handler.wait_for_maintenance()
+            write(5, 10)
+        finally:
+            handler.close()
+        assert [p.suffix for p in find_log_files(tmp_path)].count(".gz") == 1
+
+        analytics = LogAnalytics.load(checkpoint, 60)
+        analytics.process(find_log_files(tmp_path))
+        assert analytics.lines_parsed == 5
+        assert analytics.report()["route"]["GET /"]["count"] == 15
+
+    def test_bucket_mismatch_rejected(self, tmp_path):
+        """Test that changing the bucket size requires a reset"""
+        checkpoint = tmp_path / "checkpoint.json"
+        LogAnalytics(60).save(checkpoint)
+        with pytest.raises(ValueError):
+            LogAnalytics.load(checkpoint, 300)
+
+
+class TestCommandLine:
+    """Test cases for the CLI entry point"""
+
+    def test_json_output(self, tmp_path, capsys):
+        """Test that the CLI prints a JSON report and writes a checkpoint"""
+        (tmp_path / "app.log").write_text(
+            text_line("2025-01-01 12:00:00", "GET", "/health", 200, 0.004)
+        )
+        assert main(["--log-dir", str(tmp_path), "--format", "json"]) == 0
+        report = json.loads(capsys.readouterr().out)
+        assert report["status"]["200"]["count"] == 1
+        assert (tmp_path / ".analytics_checkpoint.json").exists()
+
+    def test_text_output(self, tmp_path, capsys):
+        """Test the plain-text report"""
+        (tmp_path / "app.log").write_text(
+            text_line("2025-01-01 12:00:00", "GET", "/health", 200, 0.004)
+        )
+        assert main(["--log-dir", str(tmp_path)]) == 0
+        assert "GET /health" in capsys.readouterr().out
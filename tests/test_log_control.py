@@ -0,0 +1,115 @@
+"""
+Tests for runtime log level and sampling control
+"""
+import json
+import logging
+import pytest
+from fastapi.testclient import TestClient
+import main
+from log_control import LogControl, LogControlError, validate_settings
+from logger_config import get_sampling_filter
+
+client = TestClient(main.app)
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def control(tmp_path):
+    """LogControl on a temporary file; restores startup settings afterwards"""
+    control = LogControl(str(tmp_path / "log_control.json"), main.logger, poll_interval=0.02)
+    yield control
+    control.close()
+    control.apply({})
+
+
+class TestValidateSettings:
+    """Test cases for validate_settings"""
+
+    def test_normalises(self):
+        """Test that level names are upper-cased and rates made floats"""
+        assert validate_settings({"levels": {"uvicorn": "error"}, "sample_rates": {"x": 1}}) == {
+            "levels": {"uvicorn": "ERROR"}, "sample_rates": {"x": 1.0}
+        }
+
+    @pytest.mark.parametrize("settings", [
+        [], {"level": {}}, {"levels": {"a": "LOUD"}}, {"levels": {"a": 10}},
+        {"sample_rates": {"calculate": 1.5}}, {"sample_rates": {"calculate": True}},
+    ])
+    def test_rejects(self, settings):
+        """Test that malformed settings are refused"""
+        with pytest.raises(LogControlError):
+            validate_settings(settings)
+
+
+class TestLogControl:
+    """Test cases for LogControl"""
+
+    def test_apply_and_restore(self, control):
+        """Test that dropped overrides return to the startup settings"""
+        sampling = get_sampling_filter(main.logger)
+        startup_level = main.logger.level
+        startup_rates = dict(sampling.rates)
+        control.apply({"levels": {"fastapi_calculator": "WARNING"},
+                       "sample_rates": {"calculate": 0.0}})
+        assert not main.logger.isEnabledFor(logging.INFO)
+        assert sampling.rates["calculate"] == 0.0
+        control.apply({})
+        assert main.logger.level == startup_level
+        assert sampling.rates == startup_rates
+
+    def test_update_writes_shared_file(self, control, tmp_path):
+        """Test that another worker's control picks up an update"""
+        other = LogControl(control.path, main.logger)
+        control.update({"levels": {"uvicorn.access": "error"}})
+        control.update({"sample_rates": {"http.request": 0.25}})
+        assert json.loads(control.path.read_text()) == {
+            "levels": {"uvicorn.access": "ERROR"}, "sample_rates": {"http.request": 0.25}
+        }
+        assert other.reload()
+        assert other.settings == control.settings
+        assert not other.reload()
+        status = control.update({"levels": {"uvicorn.access": None}})
+        assert status["overrides"]["levels"] == {}
+        assert logging.getLogger("uvicorn.access").level == logging.NOTSET
+
+    def test_watcher(self, control):
+        """Test that edits to the file are applied by the polling thread"""
+        control.start()
+        control.path.write_text(json.dumps({"levels": {"calculator.test": "DEBUG"}}))
+        for _ in range(200):
+            if logging.getLogger("calculator.test").level == logging.DEBUG:
+                break
+            control._stop.wait(0.02)
+        assert logging.getLogger("calculator.test").level == logging.DEBUG
+
+    def test_invalid_file_is_ignored(self, control):
+        """Test that a broken file keeps the current settings"""
+        control.apply({"levels": {"calculator.test": "ERROR"}})
+        control.path.write_text("{not json")
+        assert not control.reload()
+        assert control.settings["levels"] == {"calculator.test": "ERROR"}
+
+
+class TestLoggingAdminEndpoints:
+    """Test cases for /admin/logging"""
+
+    def test_requires_admin(self, monkeypatch):
+        """Test that the endpoints are hidden without ADMIN_TOKEN"""
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/admin/logging").status_code == 404
+
+    def test_update(self, control, monkeypatch):
+        """Test changing a level and a sample rate over HTTP"""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        monkeypatch.setattr(main, "log_control", control)
+        response = client.patch("/admin/logging", headers=ADMIN_HEADERS, json={
+            "levels": {"fastapi_calculator": "warning"}, "sample_rates": {"calculate": 0.5}
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["levels"]["fastapi_calculator"] == "WARNING"
+        assert data["sample_rates"]["calculate"] == 0.5
+        assert client.get("/admin/logging", headers=ADMIN_HEADERS).json() == data
+        response = client.patch("/admin/logging", headers=ADMIN_HEADERS,
+                                json={"levels": {"fastapi_calculator": "LOUD"}})
+        assert response.status_code == 400
@@ -5,9 +5,15 @@ Ensures logging is working correctly throughout the application
 import pytest
 import logging
 import os
+import sys
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from logger_config import setup_logging, get_logger
+import json
+from logger_config import (
+    setup_logging, get_logger, JsonFormatter, SamplingFilter,
+    RequestContextFilter, parse_sample_rates, request_id_var,
+    DuplicateSuppressionFilter, parse_dedup_limits, CompressingRotatingFileHandler
+)
 from operations import add, subtract, multiply, divide, calculate
 from fastapi.testclient import TestClient
 from main import app
@@ -277,3 +283,299 @@ class TestLogLevels:
         # Note: caplog will capture all levels, but logger won't emit DEBUG
         # Check the logger's level instead
         assert logger.level == logging.INFO
+
+
+class TestStructuredLogging:
+    """Test JSON formatting and request ID propagation"""
+    
+    def _record(self, level=logging.INFO, msg="Value: %s", args=(42,), **extra):
+        record = logging.LogRecord("fastapi_calculator", level, __file__, 10, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+        
+    def test_json_formatter_output(self):
+        """Test that JsonFormatter emits one JSON object with lazy args applied"""
+        record = self._record(duration_ms=1.5)
+        token = request_id_var.set("req-123")
+        try:
+            RequestContextFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["message"] == "Value: 42"
+        assert entry["level"] == "INFO"
+        assert entry["request_id"] == "req-123"
+        assert entry["duration_ms"] == 1.5
+        
+    def test_json_formatter_includes_exception(self):
+        """Test that errors keep their full traceback"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord(
+                "fastapi_calculator", logging.ERROR, __file__, 10, "failed", (),
+                sys.exc_info()
+            )
+        entry = json.loads(JsonFormatter().format(record))
+        assert "ValueError: boom" in entry["exception"]
+        
+    def test_request_id_header_generated(self):
+        """Test that responses carry a generated X-Request-ID"""
+        response = TestClient(app).get("/health")
+        assert len(response.headers["X-Request-ID"]) == 32
+        
+    def test_request_id_header_propagated(self, caplog):
+        """Test that a client request ID reaches operations.calculate"""
+        seen = []
+        handler = logging.Handler()
+        handler.emit = lambda record: seen.append(request_id_var.get())
+        logger = get_logger()
+        logger.addHandler(handler)
+        try:
+            response = TestClient(app).post(
+                "/calculate", json={"num1": 1, "num2": 2, "operation": "add"},
+                headers={"X-Request-ID": "client-abc"}
+            )
+        finally:
+            logger.removeHandler(handler)
+        assert response.headers["X-Request-ID"] == "client-abc"
+        assert "client-abc" in seen
+        
+    def test_invalid_request_id_replaced(self):
+        """Test that malformed client request IDs are not echoed"""
+        response = TestClient(app).get("/health", headers={"X-Request-ID": "bad id\n"})
+        assert response.headers["X-Request-ID"] != "bad id\n"
+
+
+class TestLogSampling:
+    """Test sampling of high-volume log lines"""
+    
+    def _record(self, level, sample_key):
+        record = logging.LogRecord("fastapi_calculator", level, __file__, 10, "msg", (), None)
+        record.sample_key = sample_key
+        return record
+        
+    def test_zero_rate_drops_info(self):
+        """Test that a zero rate drops sampled INFO records"""
+        sampler = SamplingFilter({"http.request": 0.0})
+        assert not sampler.filter(self._record(logging.INFO, "http.request"))
+        
+    def test_errors_never_sampled(self):
+        """Test that WARNING and above are always kept"""
+        sampler = SamplingFilter({"http.request": 0.0})
+        assert sampler.filter(self._record(logging.ERROR, "http.request"))
+        assert sampler.filter(self._record(logging.WARNING, "http.request"))
+        
+    def test_unconfigured_keys_kept(self):
+        """Test that records without a configured rate are kept"""
+        sampler = SamplingFilter({"http.request": 0.0})
+        assert sampler.filter(self._record(logging.INFO, "calculate"))
+        assert sampler.filter(self._record(logging.INFO, None))
+        
+    def test_partial_rate(self):
+        """Test that a partial rate keeps roughly that fraction"""
+        sampler = SamplingFilter({"calculate": 0.5})
+        kept = sum(sampler.filter(self._record(logging.INFO, "calculate")) for _ in range(2000))
+        assert 800 < kept < 1200
+        
+    def test_request_lines_sampled_together(self):
+        """Test that one decision per request ID covers all its sampled lines"""
+        sampler = SamplingFilter({"http.request": 0.3, "calculate": 0.3})
+        kept = 0
+        for i in range(500):
+            token = request_id_var.set(f"{i:032x}")
+            try:
+                decisions = {sampler.filter(self._record(logging.INFO, key))
+                             for key in ("http.request", "http.request", "calculate")}
+            finally:
+                request_id_var.reset(token)
+            assert len(decisions) == 1
+            kept += decisions.pop()
+        assert 100 < kept < 200
+        
+    def test_parse_sample_rates(self):
+        """Test parsing of LOG_SAMPLE_RATES values"""
+        assert parse_sample_rates("http.request=0.1, calculate=2") == {
+            "http.request": 0.1, "calculate": 1.0
+        }
+        assert parse_sample_rates("") == {}
+        with pytest.raises(ValueError):
+            parse_sample_rates("calculate=often")
+
+
+class TestDuplicateSuppression:
+    """Test collapsing of repeated records during error storms"""
+    
+    def _record(self, created, msg="Division by zero attempted: %s / %s",
+                level=logging.ERROR, name="fastapi_calculator", args=(10, 0)):
+        record = logging.LogRecord(name, level, __file__, 10, msg, args, None)
+        record.created = created
+        return record
+        
+    def test_duplicates_suppressed_within_window(self):
+        """Test that identical records inside the window are dropped"""
+        dedup = DuplicateSuppressionFilter(window=10)
+        assert dedup.filter(self._record(100.0))
+        assert not dedup.filter(self._record(101.0))
+        assert not dedup.filter(self._record(102.0))
+        
+    def test_repeat_count_reported_after_window(self):
+        """Test that the next record after the window carries the count"""
+        dedup = DuplicateSuppressionFilter(window=10)
+        dedup.filter(self._record(100.0))
+        for t in range(101, 105):
+            dedup.filter(self._record(float(t)))
+        record = self._record(111.0)
+        assert dedup.filter(record)
+        assert record.repeat_count == 4
+        assert "repeated 4 more times" in record.getMessage()
+        assert record.getMessage().startswith("Division by zero attempted: 10 / 0")
+        
+    def test_arguments_do_not_split_keys(self):
+        """Test that one logging call with varying arguments is collapsed"""
+        dedup = DuplicateSuppressionFilter(window=10)
+        assert dedup.filter(self._record(100.0, args=(1, 0)))
+        assert not dedup.filter(self._record(101.0, args=(2, 0)))
+        assert not dedup.filter(self._record(102.0, args=(3, 0)))
+        
+    def test_summary_emitted_when_storm_stops(self):
+        """Test that a count is logged even if the message never recurs"""
+        name = "calculator.test.dedup"
+        dedup = DuplicateSuppressionFilter(window=10)
+        target = logging.getLogger(name)
+        target.addFilter(dedup)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        target.addHandler(handler)
+        try:
+            for t in range(100, 104):
+                dedup.filter(self._record(float(t), name=name, args=(t, 0)))
+            assert records == []
+            assert dedup.filter(self._record(110.5, msg="Calculation requested", name=name,
+                                             level=logging.INFO))
+        finally:
+            target.removeFilter(dedup)
+            target.removeHandler(handler)
+        [summary] = records
+        assert summary.repeat_count == 3
+        assert summary.getMessage() == (
+            "Division by zero attempted: 103 / 0 [repeated 3 more times in 10s]"
+        )
+        
+    def test_distinct_messages_not_collapsed(self):
+        """Test that different messages are tracked separately"""
+        dedup = DuplicateSuppressionFilter(window=10)
+        assert dedup.filter(self._record(100.0))
+        assert dedup.filter(self._record(100.5, msg="Invalid operation requested: %s %s"))
+        
+    def test_info_records_untouched(self):
+        """Test that records below min_level are never suppressed"""
+        dedup = DuplicateSuppressionFilter(window=10)
+        assert dedup.filter(self._record(100.0, level=logging.INFO))
+        assert dedup.filter(self._record(100.1, level=logging.INFO))
+        
+    def test_per_logger_limits(self):
+        """Test per-logger window and burst overrides"""
+        dedup = DuplicateSuppressionFilter(
+            window=10, limits={"noisy": (10, 3), "fastapi_calculator": (0, 1)}
+        )
+        kept = [dedup.filter(self._record(100.0 + i, name="noisy")) for i in range(5)]
+        assert kept == [True, True, True, False, False]
+        assert all(dedup.filter(self._record(100.0 + i)) for i in range(5))
+        
+    def test_state_bounded(self):
+        """Test that tracked keys are pruned beyond max_keys"""
+        dedup = DuplicateSuppressionFilter(window=10, max_keys=10)
+        for i in range(50):
+            dedup.filter(self._record(100.0, msg=f"error {i} %s %s"))
+        assert len(dedup._state) <= 10
+        
+    def test_parse_dedup_limits(self):
+        """Test parsing of LOG_DEDUP_LIMITS values"""
+        assert parse_dedup_limits("fastapi_calculator=10:2, uvicorn.error=60") == {
+            "fastapi_calculator": (10.0, 2), "uvicorn.error": (60.0, 1)
+        }
+        with pytest.raises(ValueError):
+            parse_dedup_limits("fastapi_calculator=soon")
+
+
+class TestCompressingRotation:
+    """Test the managed rotation handler"""
+    
+    def _handler(self, tmp_path, **kwargs):
+        handler = CompressingRotatingFileHandler(tmp_path / "app.log", **kwargs)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        return handler
+        
+    def _emit(self, handler, message, created=None):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, message, (), None)
+        if created is not None:
+            record.created = created
+        handler.handle(record)
+        
+    def test_size_rotation_compresses_segments(self, tmp_path):
+        """Test that size-based rollovers produce gzip segments"""
+        import gzip
+        handler = self._handler(tmp_path, max_bytes=100)
+        try:
+            for i in range(30):
+                self._emit(handler, f"line {i:02d} " + "x" * 20)
+            handler.wait_for_maintenance()
+            segments = handler.segments()
+        finally:
+            handler.close()
+        assert segments
+        assert all(path.endswith(".gz") for path in segments)
+        restored = "".join(gzip.open(path, "rt").read() for path in segments)
+        restored += (tmp_path / "app.log").read_text()
+        assert all(f"line {i:02d}" in restored for i in range(30))
+        
+    def test_time_rotation(self, tmp_path):
+        """Test that interval-based rollovers happen when the deadline passes"""
+        handler = self._handler(tmp_path, interval_seconds=60)
+        try:
+            self._emit(handler, "before")
+            self._emit(handler, "after", created=handler.rollover_at + 1)
+            handler.wait_for_maintenance()
+            segments = handler.segments()
+        finally:
+            handler.close()
+        assert len(segments) == 1
+        assert (tmp_path / "app.log").read_text() == "after\n"
+        
+    def test_total_bytes_retention(self, tmp_path):
+        """Test that the oldest segments are removed beyond the byte budget"""
+        handler = self._handler(tmp_path, max_bytes=50, compress=False, max_total_bytes=200)
+        try:
+            for i in range(40):
+                self._emit(handler, f"line {i:02d} " + "y" * 30)
+            handler.wait_for_maintenance()
+            segments = handler.segments()
+        finally:
+            handler.close()
+        assert sum(os.path.getsize(path) for path in segments) <= 200
+        
+    def test_age_retention(self, tmp_path):
+        """Test that segments older than the retention age are removed"""
+        old = tmp_path / "app.log.20000101-000000.gz"
+        old.write_bytes(b"old")
+        os.utime(old, (0, 0))
+        handler = self._handler(tmp_path, max_age_seconds=3600)
+        try:
+            handler.wait_for_maintenance()
+        finally:
+            handler.close()
+        assert not old.exists()
+        
+    def test_leftover_segments_compressed_on_start(self, tmp_path):
+        """Test that uncompressed segments from a previous run are compressed"""
+        leftover = tmp_path / "app.log.20000101-000000"
+        leftover.write_text("leftover\n")
+        handler = self._handler(tmp_path)
+        try:
+            handler.wait_for_maintenance()
+        finally:
+            handler.close()
+        assert not leftover.exists()
+        assert (tmp_path / "app.log.20000101-000000.gz").exists()
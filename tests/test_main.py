@@ -2,8 +2,11 @@
 Integration tests for FastAPI endpoints in main.py
 Tests all API endpoints with various scenarios
 """
+import asyncio
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+import main
 from main import app
 
 # Create test client
@@ -294,6 +297,204 @@ class TestCalculateEndpointEdgeCases:
         assert response.json()["result"] == 15.5
 
 
+class TestNumericModes:
+    """Test cases for the mode field"""
+
+    def test_int_mode_keeps_precision(self):
+        """Test that large integers survive exact integer mode"""
+        big = 2 ** 80 + 1
+        payload = {"num1": big, "num2": 2, "operation": "multiply", "mode": "int"}
+        response = client.post("/calculate", json=payload)
+        assert response.status_code == 200
+        assert response.json()["result"] == big * 2
+        assert response.json()["num1"] == big
+
+    def test_decimal_and_fraction_results_are_strings(self):
+        """Test that non-integral exact results are returned as strings"""
+        payload = {"num1": 0.1, "num2": 0.2, "operation": "add", "mode": "decimal"}
+        assert client.post("/calculate", json=payload).json()["result"] == "0.3"
+        payload = {"num1": 1, "num2": 3, "operation": "divide", "mode": "fraction"}
+        assert client.post("/calculate", json=payload).json()["result"] == "1/3"
+
+    def test_inexact_integer_division(self):
+        """Test that integer mode rejects non-whole quotients"""
+        payload = {"num1": 1, "num2": 3, "operation": "divide", "mode": "int"}
+        response = client.post("/calculate", json=payload)
+        assert response.status_code == 400
+        assert "not a whole number" in response.json()["detail"]
+
+    def test_unknown_mode(self):
+        """Test that unknown modes fail validation"""
+        payload = {"num1": 1, "num2": 3, "operation": "add", "mode": "complex"}
+        assert client.post("/calculate", json=payload).status_code == 422
+
+
+class TestBatchEndpoint:
+    """Test cases for POST /calculate/batch and GET /operations"""
+
+    def test_batch(self):
+        """Test a batch with a failing item"""
+        payload = {"items": [
+            {"num1": 10, "num2": 5, "operation": "add"},
+            {"num1": 1, "num2": 0, "operation": "divide"},
+            {"num1": 3, "num2": 4, "operation": "MULTIPLY"},
+        ]}
+        response = client.post("/calculate/batch", json=payload)
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["result"] == 15.0
+        assert results[1]["result"] is None
+        assert "Cannot divide by zero" in results[1]["error"]
+        assert results[2] == {"result": 12.0, "error": None, "operation": "multiply",
+                              "num1": 3.0, "num2": 4.0}
+
+    def test_batch_overflow_item(self):
+        """Test that a result overflowing to infinity fails only its item"""
+        payload = {"items": [
+            {"num1": 1e308, "num2": 10, "operation": "multiply"},
+            {"num1": 1, "num2": 2, "operation": "add"},
+        ]}
+        response = client.post("/calculate/batch", json=payload)
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["result"] is None
+        assert results[0]["error"] == "Result out of range"
+        assert results[1]["result"] == 3.0
+
+    def test_batch_size_limits(self):
+        """Test that empty and oversized batches are rejected"""
+        assert client.post("/calculate/batch", json={"items": []}).status_code == 400
+        items = [{"num1": 1, "num2": 1, "operation": "add"}] * 10001
+        assert client.post("/calculate/batch", json={"items": items}).status_code == 400
+
+    def test_operations_listing(self):
+        """Test that registered operations are listed"""
+        response = client.get("/operations")
+        assert response.status_code == 200
+        names = [op["name"] for op in response.json()]
+        assert names[:4] == ["add", "subtract", "multiply", "divide"]
+
+
+class TestOfflineInterface:
+    """Test cases for the service worker and POST /history/batch"""
+
+    def test_service_worker_served_from_root(self):
+        """Test that the service worker may control the whole site"""
+        response = client.get("/sw.js")
+        assert response.status_code == 200
+        assert "javascript" in response.headers["content-type"]
+        assert response.headers["service-worker-allowed"] == "/"
+
+    def test_history_batch(self):
+        """Test that matching results are recorded and the rest rejected"""
+        payload = {"items": [
+            {"num1": 0.1, "num2": 0.2, "operation": "add", "result": 0.1 + 0.2},
+            {"num1": 1, "num2": 0, "operation": "divide", "result": 0},
+            {"num1": 2, "num2": 3, "operation": "multiply", "result": 7},
+            {"num1": 9, "num2": 3, "operation": "Divide", "result": 3},
+        ]}
+        response = client.post("/history/batch", json=payload)
+        assert response.status_code == 200
+        assert response.json() == {"recorded": 2, "rejected": [1, 2]}
+        latest = client.get("/history/recent?limit=1").json()[0]
+        assert (latest["operation"], latest["result"]) == ("divide", 3.0)
+
+    def test_history_batch_replay(self):
+        """Test that a retried sync with the same key is not recorded again"""
+        payload = {"items": [{"num1": 1, "num2": 2, "operation": "add", "result": 3}]}
+        headers = {"Idempotency-Key": "sync-test-batch"}
+        first = client.post("/history/batch", json=payload, headers=headers)
+        second = client.post("/history/batch", json=payload, headers=headers)
+        assert first.json() == second.json() == {"recorded": 1, "rejected": []}
+        assert second.headers["idempotent-replayed"] == "true"
+
+    def test_history_batch_runs_off_the_event_loop(self, monkeypatch):
+        """Test that batches are checked in the threadpool, with or without a key"""
+        threads = []
+        record = main._record_history_batch
+
+        def spy(request):
+            try:
+                asyncio.get_running_loop()
+                threads.append("event loop")
+            except RuntimeError:
+                threads.append("threadpool")
+            return record(request)
+
+        monkeypatch.setattr(main, "_record_history_batch", spy)
+        payload = {"items": [{"num1": 1, "num2": 2, "operation": "add", "result": 3}]}
+        client.post("/history/batch", json=payload)
+        client.post("/history/batch", json=payload,
+                    headers={"Idempotency-Key": "sync-test-threadpool"})
+        assert threads == ["threadpool", "threadpool"]
+
+    def test_history_batch_size_limits(self):
+        """Test that empty and oversized batches are rejected"""
+        assert client.post("/history/batch", json={"items": []}).status_code == 400
+        items = [{"num1": 1, "num2": 1, "operation": "add", "result": 2}] * 1001
+        assert client.post("/history/batch", json={"items": items}).status_code == 400
+
+
+class TestArrayEndpoint:
+    """Test cases for POST /calculate/array/{operation}"""
+
+    @staticmethod
+    def post_arrays(operation, num1, num2, **headers):
+        """Send two float64 arrays in the packed binary format"""
+        num1 = np.asarray(num1, dtype="<f8")
+        num2 = np.asarray(num2, dtype="<f8")
+        headers = {"X-Num1-Length": str(num1.nbytes), "X-Num2-Length": str(num2.nbytes), **headers}
+        return client.post(f"/calculate/array/{operation}",
+                           content=num1.tobytes() + num2.tobytes(), headers=headers)
+
+    def test_results_and_bitmask(self):
+        """Test the result buffer and the division-by-zero bitmask"""
+        response = self.post_arrays("divide", [1, 2, 3, 4, 5, 6, 7, 8, 9], [1, 0, 1, 1, 1, 1, 1, 1, 0])
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/octet-stream"
+        result_length = int(response.headers["x-result-length"])
+        assert result_length == 72
+        assert int(response.headers["x-mask-length"]) == 2
+        assert response.headers["x-invalid-count"] == "2"
+        results = np.frombuffer(response.content[:result_length], dtype="<f8")
+        mask = np.unpackbits(np.frombuffer(response.content[result_length:], dtype=np.uint8),
+                             count=9, bitorder="little")
+        assert mask.tolist() == [0, 1, 0, 0, 0, 0, 0, 0, 1]
+        assert results[0] == 1.0 and results[2] == 3.0
+        assert np.isnan(results[1]) and np.isnan(results[8])
+
+    def test_empty_arrays(self):
+        """Test that empty arrays give an empty result"""
+        response = self.post_arrays("add", [], [])
+        assert response.status_code == 200
+        assert response.content == b""
+
+    def test_length_errors(self):
+        """Test header and body length validation"""
+        assert self.post_arrays("add", [1.0, 2.0], [1.0]).status_code == 400
+        assert self.post_arrays("add", [1.0], [1.0], **{"X-Num1-Length": "7"}).status_code == 400
+        response = client.post("/calculate/array/add", content=b"\0" * 16)
+        assert response.status_code == 400
+        response = client.post("/calculate/array/add", content=b"\0" * 8,
+                               headers={"X-Num1-Length": "8", "X-Num2-Length": "8"})
+        assert response.status_code == 400
+
+    def test_unknown_operation(self):
+        """Test that unknown operations are rejected"""
+        assert self.post_arrays("power", [1.0], [2.0]).status_code == 400
+
+    def test_oversized_body(self, monkeypatch):
+        """Test that a body past ARRAY_MAX_BYTES gets 413, whatever the headers say"""
+        monkeypatch.setattr("main.ARRAY_MAX_BYTES", 64)
+        headers = {"X-Num1-Length": "8", "X-Num2-Length": "8"}
+        response = client.post("/calculate/array/add", content=b"\0" * 72, headers=headers)
+        assert response.status_code == 413
+        chunks = (b"\0" * 16 for _ in range(5))
+        response = client.post("/calculate/array/add", content=chunks, headers=headers)
+        assert response.status_code == 413
+        assert self.post_arrays("add", [1.0] * 4, [1.0] * 4).status_code == 200
+
+
 class TestNonExistentEndpoints:
     """Test non-existent endpoints return 404"""
     
@@ -2,12 +2,20 @@
 Unit tests for operations.py
 Tests all calculator functions individually
 """
+import importlib.metadata
+from decimal import Decimal
+from fractions import Fraction
 import pytest
 from operations import (
-    add, subtract, multiply, divide, calculate,
-    DivisionByZeroError, InvalidOperationError
+    add, subtract, multiply, divide, calculate, calculate_batch,
+    Operation, OperationRegistry, ValidationRule, registry, OPERATION_CODES,
+    ENTRY_POINT_GROUP, to_mode, DivisionByZeroError, InvalidOperationError,
+    InvalidOperandError
 )
 
+# Published through a fake entry point in TestOperationRegistry
+POWER = Operation("power", 200, lambda a, b: a ** b, cost_class="moderate")
+
 
 class TestAddition:
     """Test cases for add function"""
@@ -227,3 +235,126 @@ class TestEdgeCases:
         nan = float('nan')
         result = add(nan, 5)
         assert math.isnan(result)
+
+
+class TestOperationRegistry:
+    """Test cases for the operation registry"""
+
+    def test_builtin_operations(self):
+        """Test that the built-ins are registered with their storage codes"""
+        assert registry.names()[:4] == ["add", "subtract", "multiply", "divide"]
+        assert {name: registry.get(name).code for name in OPERATION_CODES} == OPERATION_CODES
+        assert registry.by_code(4).name == "divide"
+
+    def test_register_rejects_conflicts(self):
+        """Test that names and codes must be unique"""
+        local = OperationRegistry()
+        local.register(Operation("add", 1, add))
+        with pytest.raises(ValueError):
+            local.register(Operation("add", 2, add))
+        with pytest.raises(ValueError):
+            local.register(Operation("plus", 1, add))
+        with pytest.raises(ValueError):
+            local.register(Operation("Plus", 3, add))
+        local.register(Operation("add", 1, subtract), replace=True)
+        assert local.get("add").scalar is subtract
+
+    def test_validation_rule(self):
+        """Test that rules raise their configured error"""
+        rule = ValidationRule(lambda a, b: a < 0, "negative operand")
+        rule.check(1, 0)
+        with pytest.raises(InvalidOperationError, match="negative operand"):
+            rule.check(-1, 0)
+
+    def test_entry_points(self, monkeypatch):
+        """Test loading operations published by installed packages"""
+        good = importlib.metadata.EntryPoint("power", "tests.test_operations:POWER", ENTRY_POINT_GROUP)
+        broken = importlib.metadata.EntryPoint("broken", "tests.missing:OP", ENTRY_POINT_GROUP)
+        monkeypatch.setattr(importlib.metadata, "entry_points",
+                            lambda: {ENTRY_POINT_GROUP: [good, broken]})
+        local = OperationRegistry()
+        assert local.load_entry_points() == ["power"]
+        assert local.get("power").scalar(2, 10) == 1024
+
+
+class TestCalculateBatch:
+    """Test cases for calculate_batch"""
+
+    def test_mixed_operations(self):
+        """Test that results come back in input order"""
+        results = calculate_batch([(1, 2, "add"), (6, 3, "DIVIDE"), (2, 3, "multiply")])
+        assert results == [3.0, 2.0, 6.0]
+        assert all(type(result) is float for result in results)
+
+    def test_errors_per_item(self):
+        """Test that failing items do not affect the others"""
+        results = calculate_batch([(1, 0, "divide"), (4, 2, "divide"), (1, 1, "power")])
+        assert isinstance(results[0], DivisionByZeroError)
+        assert results[1] == 2.0
+        assert isinstance(results[2], InvalidOperationError)
+
+    def test_matches_scalar_path(self):
+        """Test that vectorized kernels agree with the scalar functions"""
+        items = [(a / 7, b / 3, op) for a in range(-5, 6) for b in range(-3, 4)
+                 for op in ("add", "subtract", "multiply", "divide") if not (op == "divide" and b == 0)]
+        assert calculate_batch(items) == [calculate(a, b, op) for a, b, op in items]
+
+    def test_scalar_fallback(self, monkeypatch):
+        """Test operations without a vectorized kernel"""
+        monkeypatch.setattr("operations.np", None)
+        results = calculate_batch([(2, 3, "add"), (1, 0, "divide")])
+        assert results[0] == 5
+        assert isinstance(results[1], DivisionByZeroError)
+
+
+class TestNumericModes:
+    """Test cases for the int, decimal and fraction modes"""
+
+    def test_float_mode_is_default(self):
+        """Test that float mode leaves operands untouched"""
+        assert calculate(0.1, 0.2, "add") == 0.1 + 0.2
+        assert calculate(0.1, 0.2, "add", "float") == 0.1 + 0.2
+
+    def test_int_mode_is_exact(self):
+        """Test exact arithmetic on integers beyond float precision"""
+        big = 2 ** 64 + 1
+        assert calculate(big, big, "multiply", "int") == big * big
+        assert calculate(big * 3, 3, "divide", "int") == big
+        assert calculate(4.0, 2, "add", "int") == 6
+
+    def test_int_mode_rejects_inexact(self):
+        """Test that integer mode refuses fractions"""
+        with pytest.raises(InvalidOperandError):
+            calculate(1.5, 1, "add", "int")
+        with pytest.raises(InvalidOperandError):
+            calculate(1, 3, "divide", "int")
+        with pytest.raises(DivisionByZeroError):
+            calculate(1, 0, "divide", "int")
+
+    def test_decimal_mode(self):
+        """Test decimal arithmetic with the shared context"""
+        assert calculate(0.1, 0.2, "add", "decimal") == Decimal("0.3")
+        third = calculate(1, 3, "divide", "decimal")
+        assert isinstance(third, Decimal)
+        assert len(third.as_tuple().digits) == 50
+
+    def test_fraction_mode(self):
+        """Test exact rational arithmetic"""
+        assert calculate(1, 3, "divide", "fraction") == Fraction(1, 3)
+        assert calculate(0.1, 0.2, "add", "fraction") == Fraction(3, 10)
+        with pytest.raises(DivisionByZeroError):
+            calculate(1, 0, "divide", "fraction")
+
+    def test_to_mode_errors(self):
+        """Test operands that cannot be converted"""
+        with pytest.raises(InvalidOperandError):
+            to_mode(float("inf"), "fraction")
+        with pytest.raises(InvalidOperandError):
+            to_mode(10 ** 400, "float")
+        with pytest.raises(InvalidOperationError):
+            calculate(1, 2, "add", "complex")
+
+    def test_batch_in_exact_mode(self):
+        """Test that batches honour the numeric mode"""
+        results = calculate_batch([(2 ** 70, 1, "add"), (1, 3, "divide")], mode="fraction")
+        assert results == [2 ** 70 + 1, Fraction(1, 3)]
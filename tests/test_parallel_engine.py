@@ -0,0 +1,81 @@
+"""
+Tests for the shared-memory parallel engine
+"""
+import logging
+import os
+import numpy as np
+import pytest
+from operations import calculate_arrays, registry, Operation, InvalidOperationError
+from parallel_engine import ParallelEngine
+
+
+@pytest.fixture(scope="module")
+def engine():
+    """Two-worker engine that goes parallel from 1000 rows in 300-row chunks"""
+    engine = ParallelEngine(workers=2, threshold=1000, chunk_size=300)
+    yield engine
+    engine.close()
+
+
+def shm_segments():
+    """Names of SharedMemory segments, where the platform exposes them"""
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def worker_handlers():
+    """Handler types and level of the app logger inside a pool worker"""
+    worker_logger = logging.getLogger("fastapi_calculator")
+    return [type(handler).__name__ for handler in worker_logger.handlers], worker_logger.level
+
+
+class TestParallelEngine:
+    """Test cases for ParallelEngine"""
+
+    def test_matches_single_process(self, engine):
+        """Test that chunked results equal the in-process kernel"""
+        rng = np.random.default_rng(1)
+        num1 = rng.random(5000)
+        num2 = rng.random(5000)
+        num2[::7] = 0
+        before = shm_segments()
+        results, invalid = engine.calculate(num1, num2, "divide")
+        expected, expected_invalid = calculate_arrays(num1, num2, registry.get("divide"))
+        assert np.array_equal(results, expected, equal_nan=True)
+        assert np.array_equal(invalid, expected_invalid)
+        assert invalid.sum() == len(range(0, 5000, 7))
+        assert shm_segments() <= before
+
+    def test_small_arrays_stay_in_process(self, engine):
+        """Test that arrays below the threshold skip the pool"""
+        results, invalid = engine.calculate([1.0, 2.0], [3.0, 4.0], "ADD")
+        assert results.tolist() == [4.0, 6.0]
+        assert not invalid.any()
+
+    def test_threshold_scales_with_cost_class(self, engine, monkeypatch):
+        """Test that expensive operations go parallel at smaller sizes"""
+        calls = []
+        monkeypatch.setattr(engine, "_calculate_parallel",
+                            lambda num1, num2, op: calls.append(len(num1)))
+        expensive = Operation("slow_add", 250, lambda a, b: a + b, np.add,
+                              cost_class="expensive")
+        engine.calculate(np.ones(10), np.ones(10), expensive)
+        engine.calculate(np.ones(10), np.ones(10), "add")
+        assert calls == [10]
+
+    def test_rejects_bad_input(self, engine):
+        """Test operation and shape validation"""
+        with pytest.raises(ValueError):
+            engine.calculate(np.ones(3), np.ones(4), "add")
+        with pytest.raises(InvalidOperationError):
+            engine.calculate(np.ones(3), np.ones(3), "power")
+        scalar_only = Operation("scalar_add", 251, lambda a, b: a + b)
+        with pytest.raises(InvalidOperationError):
+            engine.calculate(np.ones(3), np.ones(3), scalar_only)
+
+    def test_workers_do_not_share_log_files(self, engine):
+        """Test that workers log to stderr only, not to the parent's files"""
+        handlers, level = engine._get_pool().submit(worker_handlers).result(timeout=60)
+        assert handlers == ["StreamHandler"]
+        assert level == logging.CRITICAL
@@ -0,0 +1,123 @@
+"""
+Tests for per-client rate limiting
+"""
+import pytest
+from fastapi.testclient import TestClient
+import main
+from metrics import metrics
+from rate_limit import (
+    RateLimiter, RateLimitMiddleware, api_keys_from_env, client_key, limiter_from_env
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    """Test cases for RateLimiter"""
+
+    def test_burst_then_refill(self):
+        """Test that a bucket empties and refills at the configured rate"""
+        clock = FakeClock()
+        limiter = RateLimiter(rate=2, burst=3, clock=clock)
+        assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert limiter.acquire("a") == pytest.approx(0.5)
+        assert limiter.acquire("b") == 0.0
+        clock.now += 0.5
+        assert limiter.acquire("a") == 0.0
+        assert limiter.acquire("a") > 0
+        clock.now += 60
+        assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    def test_memory_is_bounded(self):
+        """Test that the table never grows past its slots"""
+        limiter = RateLimiter(rate=1, table_size=64, ways=4)
+        for i in range(10000):
+            limiter.acquire(f"client-{i}")
+        assert limiter.tracked_clients() == 64
+        assert len(limiter._keys) == 64
+
+    def test_evicts_least_recently_seen(self):
+        """Test that a new client replaces the idlest one in its set"""
+        clock = FakeClock()
+        limiter = RateLimiter(rate=1, burst=1, table_size=2, ways=2, clock=clock)
+        limiter.acquire("old")
+        clock.now += 0.1
+        limiter.acquire("recent")
+        clock.now += 0.1
+        limiter.acquire("new")
+        assert set(limiter._keys) == {"recent", "new"}
+        # The recent client kept its empty bucket
+        assert limiter.acquire("recent") > 0
+
+    def test_invalid_settings(self):
+        """Test that nonsensical settings are rejected"""
+        with pytest.raises(ValueError):
+            RateLimiter(rate=0)
+        with pytest.raises(ValueError):
+            RateLimiter(rate=1, burst=0.5)
+
+
+class TestRateLimitMiddleware:
+    """Test cases for RateLimitMiddleware"""
+
+    def test_client_key(self):
+        """Test that an allow-listed API key takes precedence over the client IP"""
+        scope = {"headers": [(b"x-api-key", b"secret")], "client": ("10.0.0.1", 1234)}
+        assert client_key(scope, frozenset({"secret"})) == ("api_key", "secret")
+        assert client_key(scope) == ("ip", "10.0.0.1")
+        assert client_key(scope, frozenset({"other"})) == ("ip", "10.0.0.1")
+        assert client_key({"headers": [], "client": ("10.0.0.1", 1234)}) == ("ip", "10.0.0.1")
+
+    def test_unknown_keys_share_the_ip_bucket(self):
+        """Test that rotating made-up API keys does not escape the limit"""
+        client = TestClient(RateLimitMiddleware(main.app, RateLimiter(rate=0.5, burst=2)))
+        payload = {"num1": 1, "num2": 2, "operation": "add"}
+        codes = [client.post("/calculate", json=payload,
+                             headers={"X-API-Key": f"made-up-{i}"}).status_code
+                 for i in range(3)]
+        assert codes == [200, 200, 429]
+
+    def test_throttles_per_client(self):
+        """Test 429 with Retry-After once the bucket is empty"""
+        client = TestClient(RateLimitMiddleware(main.app, RateLimiter(rate=0.5, burst=2),
+                                                api_keys=frozenset({"noisy", "quiet"})))
+        payload = {"num1": 1, "num2": 2, "operation": "add"}
+        before = metrics.counter(
+            "calculator_rate_limited_requests_total", "", ("client_type",)
+        ).value(client_type="api_key")
+        headers = {"X-API-Key": "noisy"}
+        codes = [client.post("/calculate", json=payload, headers=headers).status_code
+                 for _ in range(3)]
+        assert codes == [200, 200, 429]
+        response = client.post("/calculate", json=payload, headers=headers)
+        assert response.headers["retry-after"] == "2"
+        assert response.json() == {"detail": "Too many requests"}
+        assert client.get("/health").status_code == 200
+        assert client.post("/calculate", json=payload,
+                           headers={"X-API-Key": "quiet"}).status_code == 200
+        after = metrics.counter(
+            "calculator_rate_limited_requests_total", "", ("client_type",)
+        ).value(client_type="api_key")
+        assert after - before == 2
+
+    def test_disabled_by_default(self, monkeypatch):
+        """Test that no limiter is created without RATE_LIMIT_PER_SECOND"""
+        monkeypatch.delenv("RATE_LIMIT_PER_SECOND", raising=False)
+        assert limiter_from_env() is None
+        monkeypatch.setenv("RATE_LIMIT_PER_SECOND", "50")
+        monkeypatch.setenv("RATE_LIMIT_BURST", "100")
+        limiter = limiter_from_env()
+        assert (limiter.rate, limiter.burst) == (50.0, 100.0)
+
+    def test_api_keys_from_env(self, monkeypatch):
+        """Test parsing the RATE_LIMIT_API_KEYS allow-list"""
+        monkeypatch.delenv("RATE_LIMIT_API_KEYS", raising=False)
+        assert api_keys_from_env() == frozenset()
+        monkeypatch.setenv("RATE_LIMIT_API_KEYS", "alpha, beta,,")
+        assert api_keys_from_env() == frozenset({"alpha", "beta"})
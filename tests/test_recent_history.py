@@ -0,0 +1,71 @@
+"""
+Tests for the recent calculations ring buffer
+"""
+import pytest
+from fastapi.testclient import TestClient
+import main
+from operations import OPERATION_CODES, InvalidOperationError
+from recent_history import RecentHistory, BYTES_PER_ENTRY
+
+client = TestClient(main.app)
+
+
+class TestRecentHistory:
+    """Test cases for RecentHistory"""
+
+    def test_newest_first(self):
+        """Test that entries come back newest first"""
+        history = RecentHistory(capacity=5)
+        history.append("add", 1, 2, 3, timestamp_ns=1_000_000_000)
+        history.append("divide", 8, 2, 4, timestamp_ns=2_000_000_000)
+        rows = history.recent()
+        assert [row["operation"] for row in rows] == ["divide", "add"]
+        assert rows[0]["result"] == 4.0
+        assert rows[1]["timestamp"].timestamp() == 1.0
+
+    def test_wraps_around(self):
+        """Test that the oldest entries are overwritten when full"""
+        history = RecentHistory(capacity=3)
+        for i in range(7):
+            history.append("add", i, 0, i)
+        assert len(history) == 3
+        assert [row["num1"] for row in history.recent()] == [6.0, 5.0, 4.0]
+        assert [row["num1"] for row in history.recent(limit=1)] == [6.0]
+
+    def test_fixed_memory(self):
+        """Test that storage is preallocated at 33 bytes per entry"""
+        history = RecentHistory(capacity=1000)
+        assert BYTES_PER_ENTRY == 33
+        assert history.nbytes == 33000
+        for _ in range(5000):
+            history.append("multiply", 2, 3, 6)
+        assert history.nbytes == 33000
+
+    def test_unknown_operation(self):
+        """Test that only known operations can be stored"""
+        with pytest.raises(InvalidOperationError):
+            RecentHistory().append("modulo", 1, 2, 1)
+
+    def test_operation_codes_fit_uint8(self):
+        """Test that every operation code fits the uint8 column"""
+        assert all(0 < code < 256 for code in OPERATION_CODES.values())
+
+
+class TestRecentHistoryEndpoint:
+    """Test cases for GET /history/recent"""
+
+    def test_records_successful_calculations(self, monkeypatch):
+        """Test that the endpoint shows successful calculations only"""
+        monkeypatch.setattr(main, "recent_history", RecentHistory(capacity=10))
+        client.post("/calculate", json={"num1": 2, "num2": 5, "operation": "MULTIPLY"})
+        client.post("/calculate", json={"num1": 1, "num2": 0, "operation": "divide"})
+        response = client.get("/history/recent")
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["operation"] == "multiply"
+        assert data[0]["result"] == 10.0
+
+    def test_rejects_bad_limit(self):
+        """Test that limit must be positive"""
+        assert client.get("/history/recent", params={"limit": 0}).status_code == 400
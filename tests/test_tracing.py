@@ -0,0 +1,146 @@
+"""
+Tests for request tracing
+"""
+import json
+import pytest
+from fastapi.testclient import TestClient
+import main
+import tracing
+from history_store import SQLiteHistoryStore
+from tracing import Exporter, JsonlExporter, Tracer, TracingError, create_exporter, span
+
+client = TestClient(main.app)
+
+
+class ListExporter(Exporter):
+    """Keeps exported traces in memory"""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+@pytest.fixture
+def exporter():
+    """Trace every request into a ListExporter"""
+    exporter = ListExporter()
+    tracing.tracer.configure(1.0, exporter)
+    yield exporter
+    tracing.tracer.configure(0.0, None)
+
+
+class TestTracer:
+    """Test cases for Tracer and span"""
+
+    def test_nested_spans(self):
+        """Test parent links and durations"""
+        exporter = ListExporter()
+        tracer = Tracer(1.0, exporter)
+        with tracer.trace("root", job="x") as trace:
+            with span("outer"):
+                with span("inner", size=3):
+                    pass
+        spans = {record["name"]: record for record in exporter.traces[0]}
+        assert spans["inner"]["parent_id"] == spans["outer"]["span_id"]
+        assert spans["outer"]["parent_id"] == spans["root"]["span_id"]
+        assert spans["root"]["attributes"] == {"job": "x"}
+        assert {record["trace_id"] for record in spans.values()} == {trace.trace_id}
+
+    def test_unsampled(self):
+        """Test that spans outside a sampled trace are no-ops"""
+        tracer = Tracer(0.0, ListExporter())
+        with tracer.trace("root") as trace:
+            with span("inner") as inner:
+                inner.set(ignored=True)
+        assert trace is None
+        assert tracer.exporter.traces == []
+
+    def test_traceparent(self):
+        """Test that an incoming trace ID and sampled flag are followed"""
+        tracer = Tracer(0.01, ListExporter())
+        parent = "00-" + "a" * 32 + "-" + "b" * 16
+        with tracer.trace("root", traceparent=parent + "-01") as trace:
+            pass
+        assert trace.trace_id == "a" * 32
+        assert trace.root.parent_id == "b" * 16
+        with tracer.trace("root", traceparent=parent + "-00") as trace:
+            pass
+        assert trace is None
+
+    def test_errors_are_recorded(self):
+        """Test that a span records the exception type it exited with"""
+        exporter = ListExporter()
+        with pytest.raises(ZeroDivisionError):
+            with Tracer(1.0, exporter).trace("root"):
+                1 / 0
+        assert exporter.traces[0][0]["attributes"]["error"] == "ZeroDivisionError"
+
+
+class TestExporters:
+    """Test cases for trace exporters"""
+
+    def test_jsonl_rotation(self, tmp_path):
+        """Test that spans are written one per line and the file rotates"""
+        path = tmp_path / "traces.jsonl"
+        exporter = JsonlExporter(str(path), max_bytes=2000, backups=2)
+        tracer = Tracer(1.0, exporter)
+        for i in range(50):
+            with tracer.trace("root", i=i):
+                with span("child"):
+                    pass
+        exporter.close()
+        lines = path.read_text().splitlines()
+        assert all(json.loads(line)["name"] in ("root", "child") for line in lines)
+        assert (tmp_path / "traces.jsonl.1").exists()
+        assert not (tmp_path / "traces.jsonl.3").exists()
+
+    def test_pluggable(self):
+        """Test loading an exporter by module:attribute"""
+        assert isinstance(create_exporter("tests.test_tracing:ListExporter"), ListExporter)
+        assert create_exporter("none") is None
+        with pytest.raises(TracingError):
+            create_exporter("tests.test_tracing:missing")
+        with pytest.raises(TracingError):
+            create_exporter("bogus")
+
+
+class TestRequestTracing:
+    """Test cases for traced requests"""
+
+    def test_calculate_spans_and_server_timing(self, exporter):
+        """Test that a request covers middleware, validation, compute and logging"""
+        response = client.post("/calculate", json={"num1": 6, "num2": 3, "operation": "divide"})
+        assert response.status_code == 200
+        timing = dict(
+            item.split(";dur=") for item in response.headers["server-timing"].split(", ")
+        )
+        assert {"validation", "endpoint", "calculate", "route", "logging", "total"} <= set(timing)
+        names = {record["name"] for record in exporter.traces[-1]}
+        assert {"log_requests", "route", "validation", "endpoint", "calculate",
+                "logging"} <= names
+        root = next(r for r in exporter.traces[-1] if r["name"] == "log_requests")
+        assert root["attributes"]["status_code"] == 200
+        assert root["attributes"]["request_id"] == response.headers["x-request-id"]
+
+    def test_sync_endpoint(self, exporter):
+        """Test that spans from thread-pool endpoints join the request's trace"""
+        client.post("/calculate/batch", json={"items": [
+            {"num1": 1, "num2": 2, "operation": "add"}, {"num1": 1, "num2": 2, "operation": "multiply"}
+        ]})
+        calculate = [r for r in exporter.traces[-1] if r["name"] == "calculate"]
+        assert sorted(r["attributes"]["operation"] for r in calculate) == ["add", "multiply"]
+
+    def test_no_header_when_off(self):
+        """Test that untraced requests carry no Server-Timing header"""
+        response = client.get("/health")
+        assert "server-timing" not in response.headers
+
+    def test_database_writes(self, exporter, tmp_path):
+        """Test that history batches are traced by the writer thread"""
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+        store.record("add", 1, 2, 3)
+        store.close()
+        writes = [spans for spans in exporter.traces if spans[0]["name"] == "history.write"]
+        assert writes[0][0]["attributes"] == {"backend": "sqlite", "rows": 1}
@@ -0,0 +1,102 @@
+"""
+Tests for the Unix domain socket listener
+"""
+import asyncio
+import socket
+import struct
+import tempfile
+import threading
+from pathlib import Path
+import pytest
+from operations import DivisionByZeroError, InvalidOperationError
+from uds_server import (
+    UnixSocketServer, UnixSocketClient, encode_request, decode_response, LENGTH,
+    STATUS_INVALID_OPERATION, STATUS_MALFORMED
+)
+
+
+@pytest.fixture
+def server():
+    """Listener running on an event loop in a background thread"""
+    directory = tempfile.mkdtemp()
+    path = str(Path(directory) / "calc.sock")
+    recorded = []
+    server = UnixSocketServer(path, on_result=lambda *args: recorded.append(args))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    server.recorded = recorded
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def raw_exchange(path, frame):
+    """Send raw bytes and read one response payload"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(path)
+        sock.sendall(frame)
+        header = sock.recv(LENGTH.size, socket.MSG_WAITALL)
+        (length,) = LENGTH.unpack(header)
+        return decode_response(sock.recv(length, socket.MSG_WAITALL))
+
+
+class TestUnixSocketServer:
+    """Test cases for the binary protocol"""
+
+    def test_calculate(self, server):
+        """Test single calculations and error mapping"""
+        with UnixSocketClient(server.path) as client:
+            assert client.calculate("add", 2, 3) == 5.0
+            assert client.calculate("DIVIDE", 1, 4) == 0.25
+            with pytest.raises(DivisionByZeroError):
+                client.calculate("divide", 1, 0)
+        assert server.recorded == [("add", 2.0, 3.0, 5.0), ("divide", 1.0, 4.0, 0.25)]
+
+    def test_pipelined(self, server):
+        """Test that pipelined requests are answered in order"""
+        items = [("multiply", float(i), 2.0) for i in range(3000)]
+        items[10] = ("divide", 1.0, 0.0)
+        with UnixSocketClient(server.path) as client:
+            outcomes = client.calculate_many(items)
+        assert outcomes[11] == 22.0
+        assert outcomes[2999] == 5998.0
+        assert isinstance(outcomes[10], DivisionByZeroError)
+
+    def test_unknown_code_and_malformed_frame(self, server):
+        """Test status codes for bad requests"""
+        request_id, status, _, message = raw_exchange(server.path, encode_request(7, 250, 1, 2))
+        assert (request_id, status) == (7, STATUS_INVALID_OPERATION)
+        assert "250" in message
+        short = struct.pack("<I", 5) + struct.pack("<IB", 9, 1)
+        request_id, status, _, _ = raw_exchange(server.path, short)
+        assert (request_id, status) == (9, STATUS_MALFORMED)
+
+    def test_client_rejects_unknown_operation(self, server):
+        """Test that the client validates operation names locally"""
+        with UnixSocketClient(server.path) as client:
+            with pytest.raises(InvalidOperationError):
+                client.calculate("power", 2, 3)
+
+    def test_refuses_live_socket(self, server):
+        """Test that a second listener does not steal a live socket"""
+        with pytest.raises(OSError):
+            asyncio.run(UnixSocketServer(server.path).start())
+
+    def test_replaces_stale_socket(self):
+        """Test that a socket file without a listener is replaced"""
+        path = str(Path(tempfile.mkdtemp()) / "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        async def start_and_stop():
+            server = UnixSocketServer(path)
+            await server.start()
+            await server.close()
+
+        asyncio.run(start_and_stop())
+        assert not Path(path).exists()
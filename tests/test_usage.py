@@ -0,0 +1,177 @@
+"""
+Tests for per-user usage counters
+"""
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+import main
+import usage
+from usage import ShardedCounter, UsageTracker, UsageError
+
+client = TestClient(main.app)
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """SQLite database with users 1 and 2"""
+    path = tmp_path / "usage.db"
+    tracker = UsageTracker(f"sqlite:///{path}", flush_interval=3600)
+    conn = tracker._connection()
+    conn.execute("INSERT INTO users (id, username, email) VALUES (1, 'alice', 'a@example.com')")
+    conn.execute("INSERT INTO users (id, username, email) VALUES (2, 'bob', 'b@example.com')")
+    conn.commit()
+    tracker.close()
+    return f"sqlite:///{path}"
+
+
+class TestShardedCounter:
+    """Test cases for ShardedCounter"""
+
+    def test_concurrent_adds(self):
+        """Test that no increment is lost across threads and drains"""
+        counter = ShardedCounter(shards=4)
+        drained = {}
+
+        def work(i):
+            for _ in range(1000):
+                counter.add(i % 3)
+            if i % 4 == 0:
+                for key, count in counter.drain().items():
+                    drained[key] = drained.get(key, 0) + count
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(work, range(16)))
+        for key, count in counter.drain().items():
+            drained[key] = drained.get(key, 0) + count
+        assert sum(drained.values()) == 16000
+        assert counter.snapshot() == {}
+
+    def test_threads_use_different_shards(self):
+        """Test that concurrent threads are spread over the shards"""
+        counter = ShardedCounter(shards=4)
+        barrier = threading.Barrier(4)
+
+        def work(i):
+            barrier.wait()
+            counter.add(i)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [len(counts) for _, counts in counter._shards] == [1, 1, 1, 1]
+
+
+class TestUsageTracker:
+    """Test cases for UsageTracker"""
+
+    def test_memory_only(self):
+        """Test counting without a database"""
+        tracker = UsageTracker()
+        tracker.record(1, "add")
+        tracker.record(1, "add")
+        tracker.record(2, "divide")
+        assert tracker.flush()
+        assert tracker.usage(1) == ({"add": 2}, 2)
+        tracker.close()
+
+    def test_flush_merges_with_memory(self, sqlite_url):
+        """Test that reads add unflushed counts to the flushed totals"""
+        tracker = UsageTracker(sqlite_url, flush_interval=3600)
+        for _ in range(3):
+            tracker.record(1, "add")
+        tracker.record(1, "divide")
+        assert tracker.flush()
+        tracker.record(1, "add")
+        tracker.record(3, "add")  # not in users: kept, like the history store
+        assert tracker.usage(1) == ({"add": 4, "divide": 1}, 1)
+        tracker.close()
+        path = sqlite_url[len("sqlite:///"):]
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute(
+                "SELECT user_id, operation, calculation_count FROM user_usage ORDER BY 1, 2"
+            ).fetchall()
+        assert rows == [(1, "add", 4), (1, "divide", 1), (3, "add", 1)]
+
+    def test_failed_flush_keeps_counts(self, sqlite_url, monkeypatch):
+        """Test that deltas survive a failed write"""
+        tracker = UsageTracker(sqlite_url, flush_interval=3600)
+        tracker.record(2, "multiply", 5)
+
+        def fail(rows):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(tracker, "_write", fail)
+        assert not tracker.flush()
+        monkeypatch.undo()
+        assert tracker.usage(2) == ({"multiply": 5}, 5)
+        assert tracker.flush()
+        assert tracker.usage(2) == ({"multiply": 5}, 0)
+        tracker.close()
+
+    def test_background_flush(self, sqlite_url):
+        """Test that the flusher thread writes on its interval"""
+        tracker = UsageTracker(sqlite_url, flush_interval=0.05)
+        tracker.record(1, "subtract")
+        for _ in range(100):
+            if tracker.usage(1)[1] == 0:
+                break
+            tracker._stop.wait(0.05)
+        assert tracker.usage(1) == ({"subtract": 1}, 0)
+        tracker.close()
+
+    def test_postgres(self, postgres_url):
+        """Test the upsert against user_usage in PostgreSQL"""
+        url = postgres_url("01_create_tables.sql", "02_insert_records.sql", "09_user_usage.sql")
+        tracker = UsageTracker(url, flush_interval=3600)
+        tracker.record(1, "add", 2)
+        tracker.record(999, "add")
+        skipped = usage.usage_skipped_rows.value()
+        assert tracker.flush()
+        assert usage.usage_skipped_rows.value() == skipped + 1
+        tracker.record(1, "add")
+        assert tracker.flush()
+        assert tracker.usage(1) == ({"add": 3}, 0)
+        tracker.close()
+        with psycopg.connect(url) as conn:
+            assert conn.execute("SELECT count(*) FROM user_usage").fetchone()[0] == 1
+
+    def test_missing_table(self, postgres_url):
+        """Test that reads fail cleanly without user_usage"""
+        tracker = UsageTracker(postgres_url("01_create_tables.sql"), flush_interval=3600)
+        with pytest.raises(UsageError):
+            tracker.usage(1)
+        tracker.close()
+
+
+class TestUsageEndpoint:
+    """Test cases for GET /users/{user_id}/usage"""
+
+    def test_counts_user_calculations(self, monkeypatch):
+        """Test that successful calculations with a user_id are counted"""
+        monkeypatch.setattr(main, "usage_tracker", UsageTracker())
+        client.post("/calculate", json={"num1": 1, "num2": 2, "operation": "ADD", "user_id": 7})
+        client.post("/calculate", json={"num1": 1, "num2": 0, "operation": "divide", "user_id": 7})
+        client.post("/calculate/batch", json={"items": [
+            {"num1": 1, "num2": 2, "operation": "multiply", "user_id": 7},
+            {"num1": 1, "num2": 2, "operation": "multiply"},
+        ]})
+        response = client.get("/users/7/usage")
+        assert response.status_code == 200
+        assert response.json() == {"user_id": 7, "total": 2, "unflushed": 2,
+                                   "operations": {"add": 1, "multiply": 1}}
+
+    def test_unavailable(self, monkeypatch):
+        """Test that a database failure returns 503"""
+        tracker = UsageTracker()
+
+        def fail(user_id):
+            raise UsageError("Usage totals are unavailable")
+
+        monkeypatch.setattr(tracker, "usage", fail)
+        monkeypatch.setattr(main, "usage_tracker", tracker)
+        assert client.get("/users/1/usage").status_code == 503
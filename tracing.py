@@ -0,0 +1,413 @@
+"""
+Request tracing
+Lightweight spans showing where a request's time goes: the log_requests
+middleware, request validation, the endpoint, operations.calculate,
+logging handlers and database writes. Whether a trace is recorded is
+decided once at its root (head-based sampling, TRACE_SAMPLE_RATE, or the
+sampled flag of an incoming W3C traceparent header); spans of unsampled
+traces cost one context variable lookup. Sampled traces are summarised in
+a Server-Timing response header and handed to an exporter, by default a
+rotating JSONL file.
+"""
+import importlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import metrics
+
+DEFAULT_TRACE_FILE = "logs/traces.jsonl"
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+traces_exported = metrics.counter(
+    "calculator_traces_exported_total", "Sampled traces handed to the exporter"
+)
+traces_dropped = metrics.counter(
+    "calculator_traces_dropped_total", "Sampled traces dropped because the exporter fell behind"
+)
+
+
+class TracingError(Exception):
+    """Custom exception for an unusable tracing configuration"""
+    pass
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    """Spans of one sampled request or background task"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or _new_id(128)
+        self.spans: List[Dict] = []
+        self.logging_seconds = 0.0
+        self.logging_records = 0
+        self.root: Optional["Span"] = None
+
+    def add(self, name: str, start: float, duration: float, parent_id: Optional[str],
+            attributes: Dict, span_id: Optional[str] = None) -> None:
+        """Add a finished span (start in epoch seconds, duration in seconds)"""
+        self.spans.append({
+            "trace_id": self.trace_id,
+            "span_id": span_id or _new_id(64),
+            "parent_id": parent_id,
+            "name": name,
+            "start": start,
+            "duration_ms": round(duration * 1000, 3),
+            "attributes": attributes,
+        })
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: time per span name, summed, in ms
+
+        Open spans are left out except the root, reported as "total".
+        """
+        totals: Dict[str, float] = {}
+        for record in self.spans:
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration_ms"]
+        if self.logging_records:
+            totals["logging"] = self.logging_seconds * 1000
+        if self.root is not None:
+            totals["total"] = (time.perf_counter() - self.root.perf_start) * 1000
+        return ", ".join(
+            f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)};dur={duration:.3f}"
+            for name, duration in totals.items()
+        )
+
+    def records(self) -> List[Dict]:
+        """Finished spans, with logging handler time as one synthetic span"""
+        if self.logging_records and self.root is not None:
+            self.add("logging", self.root.start, self.logging_seconds, self.root.span_id,
+                     {"records": self.logging_records})
+            self.logging_records = 0
+        return self.spans
+
+
+class Span:
+    """A timed, named section of a trace; use as a context manager"""
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = 0.0
+        # time.perf_counter() when the span was entered
+        self.perf_start = 0.0
+        self._token = None
+
+    def set(self, **attributes) -> None:
+        """Add attributes to the span"""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self.perf_start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.perf_start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start, duration, self.parent_id, self.attributes,
+                       self.span_id)
+
+
+class _NoopSpan:
+    """Stand-in returned when no sampled trace is active"""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# Innermost open span of the sampled trace being handled, if any
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def span(name: str, **attributes):
+    """
+    Time a section of the current trace
+
+    Returns a no-op context manager outside sampled traces, so call sites
+    need no checks of their own.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def record_since(name: str, perf_start: float, **attributes) -> None:
+    """
+    Add a span to the current trace that began at perf_start
+    (a time.perf_counter() value) and ends now
+
+    For stages with no single place to open a span around, such as request
+    validation inside the framework.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    duration = time.perf_counter() - perf_start
+    parent.trace.add(name, time.time() - duration, duration, parent.span_id, attributes)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost open span of the sampled trace being handled, if any"""
+    return _current_span.get()
+
+
+def current_trace() -> Optional[Trace]:
+    """The sampled trace being handled, if any"""
+    parent = _current_span.get()
+    return parent.trace if parent is not None else None
+
+
+class Exporter(ABC):
+    """Destination for the spans of sampled traces"""
+
+    @abstractmethod
+    def export(self, spans: List[Dict]) -> None:
+        """Accept a finished trace's spans; must not block on I/O"""
+
+    def close(self) -> None:
+        """Write anything pending and release resources"""
+
+
+class JsonlExporter(Exporter):
+    """
+    One JSON object per span in a size-rotated file
+
+    Spans are queued and written by a background thread; if it falls
+    behind by max_queue traces, new traces are dropped and counted.
+    """
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE, max_bytes: int = 10 * 1024 * 1024,
+                 backups: int = 5, max_queue: int = 10000):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                            encoding="utf-8", delay=True)
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Dict]) -> None:
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            traces_dropped.inc()
+
+    def flush(self) -> None:
+        """Wait until every queued trace is written"""
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._handler.close()
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            try:
+                if spans is None:
+                    return
+                for record in spans:
+                    self._handler.handle(logging.makeLogRecord(
+                        {"msg": json.dumps(record, default=str), "args": None}
+                    ))
+            finally:
+                self._queue.task_done()
+
+
+class Tracer:
+    """Starts traces, samples them at the root and exports sampled ones"""
+
+    def __init__(self, sample_rate: float = 0.0, exporter: Optional[Exporter] = None):
+        """
+        Args:
+            sample_rate: Fraction of traces recorded (0.0 - 1.0)
+            exporter: Receives sampled traces; None keeps them for
+                Server-Timing only
+        """
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """
+        Start a trace whose root span is name
+
+        Args:
+            name: Root span name
+            traceparent: Incoming W3C traceparent header; while tracing
+                is enabled its trace ID and sampled flag are followed
+            attributes: Root span attributes
+
+        Returns:
+            Context manager yielding the Trace, or None if not sampled
+        """
+        if self.sample_rate <= 0:
+            return _NOOP_TRACE
+        parent_id = None
+        match = _TRACEPARENT.match(traceparent) if traceparent else None
+        if match is not None:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1)
+        else:
+            trace_id = None
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return _NOOP_TRACE
+        return _TraceScope(self, Trace(trace_id), name, parent_id, attributes)
+
+    def configure(self, sample_rate: float, exporter: Optional[Exporter] = None) -> None:
+        """Replace the sampling rate and exporter, closing the old exporter"""
+        old, self.exporter = self.exporter, exporter
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        if old is not None and old is not exporter:
+            old.close()
+
+    def close(self) -> None:
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+
+class _NoopTrace:
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_TRACE = _NoopTrace()
+
+
+class _TraceScope:
+    def __init__(self, tracer: Tracer, trace: Trace, name: str, parent_id: Optional[str],
+                 attributes: Dict):
+        self.tracer = tracer
+        self.trace = trace
+        trace.root = Span(trace, name, parent_id, attributes)
+
+    def __enter__(self) -> Trace:
+        self.trace.root.__enter__()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.trace.root.__exit__(exc_type, exc, tb)
+        if self.tracer.exporter is not None:
+            self.tracer.exporter.export(self.trace.records())
+            traces_exported.inc()
+
+
+def instrument_logging(logger: logging.Logger) -> None:
+    """
+    Count the time a logger's handlers spend on records in the current trace
+
+    Each handler's handle() is wrapped once; outside sampled traces the
+    wrapper only adds a context variable lookup.
+    """
+    for handler in logger.handlers:
+        if getattr(handler, "_traced", False):
+            continue
+        original = handler.handle
+
+        def handle(record, original=original):
+            parent = _current_span.get()
+            if parent is None:
+                return original(record)
+            started = time.perf_counter()
+            try:
+                return original(record)
+            finally:
+                parent.trace.logging_seconds += time.perf_counter() - started
+                parent.trace.logging_records += 1
+
+        handler.handle = handle
+        handler._traced = True
+
+
+def create_exporter(name: str) -> Optional[Exporter]:
+    """
+    Exporter selected by TRACE_EXPORTER
+
+    Args:
+        name: "jsonl" (TRACE_FILE, default logs/traces.jsonl, rotated at
+            TRACE_FILE_MAX_BYTES with TRACE_FILE_BACKUPS old files), "none",
+            or "module:attribute" naming an Exporter or a callable returning one
+
+    Raises:
+        TracingError: If the exporter cannot be created
+    """
+    name = name.strip()
+    if name == "none":
+        return None
+    if name == "jsonl":
+        return JsonlExporter(
+            os.getenv("TRACE_FILE", DEFAULT_TRACE_FILE),
+            max_bytes=int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+            backups=int(os.getenv("TRACE_FILE_BACKUPS", "5")),
+        )
+    module_name, _, attribute = name.partition(":")
+    if not attribute:
+        raise TracingError(f"Unknown trace exporter: {name!r}")
+    try:
+        loaded = getattr(importlib.import_module(module_name), attribute)
+        exporter = loaded if isinstance(loaded, Exporter) else loaded()
+    except Exception as e:
+        raise TracingError(f"Cannot load trace exporter {name!r}: {e}")
+    if not isinstance(exporter, Exporter):
+        raise TracingError(f"{name!r} is not an Exporter")
+    return exporter
+
+
+def configure_from_env() -> Tracer:
+    """
+    Configure the shared tracer from the environment
+
+    TRACE_SAMPLE_RATE (default 0, off) is the fraction of requests traced;
+    TRACE_EXPORTER (default jsonl) is only created when tracing is on.
+
+    Raises:
+        TracingError: If the exporter cannot be created
+    """
+    sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0") or 0)
+    exporter = None
+    if sample_rate > 0:
+        exporter = create_exporter(os.getenv("TRACE_EXPORTER", "jsonl"))
+    tracer.configure(sample_rate, exporter)
+    return tracer
+
+
+# Shared tracer, off until configured; background writers start their own traces on it
+tracer = Tracer()
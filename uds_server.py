@@ -0,0 +1,264 @@
+"""
+Unix domain socket listener
+A binary alternative to POST /calculate for clients on the same host. It
+runs in the FastAPI process and event loop when UDS_PATH is set, and
+dispatches straight to operations.calculate without HTTP parsing or JSON.
+
+Every frame is a little-endian uint32 payload length followed by the payload:
+    request   uint32 request_id, uint8 operation code, float64 num1, float64 num2
+    response  uint32 request_id, uint8 status, float64 result, then a UTF-8
+              error message when status is not STATUS_OK
+
+Clients may pipeline: many requests can be written before reading any
+response. Responses come back in request order and echo the request_id.
+"""
+import asyncio
+import os
+import socket
+import struct
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+from logger_config import get_logger
+from operations import (
+    calculate, registry, DivisionByZeroError, InvalidOperationError, InvalidOperandError
+)
+
+# Initialize logger
+logger = get_logger(__name__)
+
+LENGTH = struct.Struct("<I")
+REQUEST = struct.Struct("<IBdd")
+RESPONSE = struct.Struct("<IBd")
+MAX_FRAME = 4096
+READ_SIZE = 64 * 1024
+
+STATUS_OK = 0
+STATUS_DIVISION_BY_ZERO = 1
+STATUS_INVALID_OPERATION = 2
+STATUS_INVALID_OPERAND = 3
+STATUS_MALFORMED = 4
+STATUS_ERROR = 5
+
+_STATUS_ERRORS = {
+    STATUS_DIVISION_BY_ZERO: DivisionByZeroError,
+    STATUS_INVALID_OPERATION: InvalidOperationError,
+    STATUS_INVALID_OPERAND: InvalidOperandError,
+}
+
+
+class UnixSocketError(Exception):
+    """Raised for protocol errors and server-side failures"""
+    pass
+
+
+def encode_request(request_id: int, code: int, num1: float, num2: float) -> bytes:
+    """Length-prefixed request frame"""
+    return LENGTH.pack(REQUEST.size) + REQUEST.pack(request_id, code, num1, num2)
+
+
+def encode_response(request_id: int, status: int, result: float = 0.0, message: str = "") -> bytes:
+    """Length-prefixed response frame"""
+    payload = RESPONSE.pack(request_id, status, result) + message.encode()
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode_response(payload: bytes) -> Tuple[int, int, float, str]:
+    """(request_id, status, result, message) from a response payload"""
+    request_id, status, result = RESPONSE.unpack_from(payload)
+    return request_id, status, result, bytes(payload[RESPONSE.size:]).decode()
+
+
+class UnixSocketServer:
+    """Serve calculations over a Unix domain socket in the running event loop"""
+
+    def __init__(self, path: str,
+                 on_result: Optional[Callable[[str, float, float, float], None]] = None):
+        """
+        Args:
+            path: Socket file to create
+            on_result: Called with (operation, num1, num2, result) after
+                each successful calculation, e.g. to record history
+        """
+        self.path = path
+        self.on_result = on_result
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        """
+        Bind the socket and start accepting connections
+
+        Raises:
+            OSError: If another live process is listening on the path
+        """
+        _remove_stale_socket(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o660)
+        logger.info("Unix socket listener started on %s", self.path)
+
+    async def close(self) -> None:
+        """Stop accepting connections and remove the socket file"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        logger.info("Unix socket listener on %s stopped", self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                buffer += data
+                # Answer every complete frame in the read with one write
+                out = bytearray()
+                offset = 0
+                while len(buffer) - offset >= LENGTH.size:
+                    (length,) = LENGTH.unpack_from(buffer, offset)
+                    if length > MAX_FRAME:
+                        logger.warning("Closing Unix socket client: %d-byte frame", length)
+                        out += encode_response(0, STATUS_MALFORMED, message="Frame too large")
+                        writer.write(out)
+                        return
+                    end = offset + LENGTH.size + length
+                    if end > len(buffer):
+                        break
+                    out += self._dispatch(buffer, offset + LENGTH.size, length)
+                    offset = end
+                del buffer[:offset]
+                if out:
+                    writer.write(out)
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, buffer: bytearray, offset: int, length: int) -> bytes:
+        if length != REQUEST.size:
+            request_id = LENGTH.unpack_from(buffer, offset)[0] if length >= LENGTH.size else 0
+            return encode_response(request_id, STATUS_MALFORMED,
+                                   message=f"Request payload must be {REQUEST.size} bytes")
+        request_id, code, num1, num2 = REQUEST.unpack_from(buffer, offset)
+        try:
+            operation = registry.by_code(code).name
+        except KeyError:
+            logger.warning("Invalid operation requested over Unix socket: code %d", code)
+            return encode_response(request_id, STATUS_INVALID_OPERATION,
+                                   message=f"Unknown operation code {code}")
+        try:
+            result = calculate(num1, num2, operation)
+        except DivisionByZeroError as e:
+            return encode_response(request_id, STATUS_DIVISION_BY_ZERO, message=str(e))
+        except InvalidOperationError as e:
+            return encode_response(request_id, STATUS_INVALID_OPERATION, message=str(e))
+        except InvalidOperandError as e:
+            return encode_response(request_id, STATUS_INVALID_OPERAND, message=str(e))
+        except Exception as e:
+            logger.error("Unexpected error in Unix socket calculation: %s", e, exc_info=True)
+            return encode_response(request_id, STATUS_ERROR, message="Internal server error")
+        if self.on_result is not None:
+            self.on_result(operation, num1, num2, result)
+        return encode_response(request_id, STATUS_OK, result)
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Remove a socket file left by a dead process; refuse to steal a live one"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"Another process is listening on {path}")
+
+
+class UnixSocketClient:
+    """Blocking client for UnixSocketServer"""
+
+    # Requests in flight per round trip when pipelining; small enough that
+    # neither side's socket buffer fills while the other is still writing
+    WINDOW = 1024
+
+    def __init__(self, path: str, timeout: Optional[float] = 5.0):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(path)
+        self._buffer = bytearray()
+        self._next_id = 0
+
+    def __enter__(self) -> "UnixSocketClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def calculate(self, operation: str, num1: float, num2: float) -> float:
+        """
+        One calculation, waiting for its response
+
+        Raises:
+            DivisionByZeroError, InvalidOperationError, InvalidOperandError:
+                As raised by operations.calculate on the server
+            UnixSocketError: On a protocol or server error
+        """
+        outcome = self.calculate_many([(operation, num1, num2)])[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def calculate_many(self, items: Iterable[Tuple[str, float, float]]
+                       ) -> List[Union[float, Exception]]:
+        """
+        Pipelined calculations
+
+        Args:
+            items: (operation, num1, num2) tuples
+
+        Returns:
+            Per item, the result or the exception the server reported
+        """
+        items = list(items)
+        outcomes: List[Union[float, Exception]] = []
+        for start in range(0, len(items), self.WINDOW):
+            window = items[start:start + self.WINDOW]
+            frames = bytearray()
+            for operation, num1, num2 in window:
+                code = registry.get(operation.lower()).code
+                frames += encode_request(self._next_id, code, num1, num2)
+                self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            self._sock.sendall(frames)
+            for _ in window:
+                _, status, result, message = decode_response(self._read_frame())
+                if status == STATUS_OK:
+                    outcomes.append(result)
+                else:
+                    outcomes.append(_STATUS_ERRORS.get(status, UnixSocketError)(message))
+        return outcomes
+
+    def _read_frame(self) -> bytes:
+        while True:
+            if len(self._buffer) >= LENGTH.size:
+                (length,) = LENGTH.unpack_from(self._buffer)
+                end = LENGTH.size + length
+                if len(self._buffer) >= end:
+                    payload = bytes(self._buffer[LENGTH.size:end])
+                    del self._buffer[:end]
+                    return payload
+            data = self._sock.recv(READ_SIZE)
+            if not data:
+                raise UnixSocketError("Connection closed by server")
+            self._buffer += data
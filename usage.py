@@ -0,0 +1,325 @@
+"""
+Per-user usage accounting
+Counts successful calculations per (user, operation) for quotas without a
+database write per request. Counts accumulate in sharded in-process
+counters and a flusher thread adds the deltas to the user_usage table
+(sql/09_user_usage.sql) in one batched upsert every few seconds. The
+database follows DATABASE_URL like the history store; without one, counts
+are kept in memory only.
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from database import get_database_url, is_postgres_url
+from history_store import SQLITE_PREFIX, SQLITE_SCHEMA
+from logger_config import get_logger
+from metrics import metrics
+from tracing import tracer
+
+# Initialize logger
+logger = get_logger(__name__)
+
+DEFAULT_SHARDS = 16
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+UsageKey = Tuple[int, str]
+
+# Mirrors sql/09_user_usage.sql
+SQLITE_USAGE_SCHEMA = SQLITE_SCHEMA + """
+CREATE TABLE IF NOT EXISTS user_usage (
+    user_id INTEGER NOT NULL,
+    operation VARCHAR(20) NOT NULL,
+    calculation_count BIGINT NOT NULL,
+    last_activity TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, operation),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+"""
+
+UPSERT = (
+    "INSERT INTO user_usage (user_id, operation, calculation_count, last_activity) "
+    "VALUES ({p}, {p}, {p}, {p}) "
+    "ON CONFLICT (user_id, operation) DO UPDATE SET "
+    "calculation_count = user_usage.calculation_count + excluded.calculation_count, "
+    "last_activity = excluded.last_activity"
+)
+
+# PostgreSQL enforces the users foreign key, so deltas for unknown users are
+# set aside before the upsert instead of failing the whole batch
+SELECT_KNOWN_USERS = "SELECT id FROM users WHERE id = ANY(%s)"
+
+SELECT_USAGE = "SELECT operation, calculation_count FROM user_usage WHERE user_id = {p}"
+
+usage_flushes = metrics.counter(
+    "calculator_usage_flushes_total", "Usage counter flushes to the database", ("outcome",)
+)
+usage_flushed_rows = metrics.counter(
+    "calculator_usage_flushed_rows_total", "(user, operation) deltas written to user_usage"
+)
+usage_skipped_rows = metrics.counter(
+    "calculator_usage_skipped_rows_total",
+    "(user, operation) deltas dropped at flush because the user does not exist"
+)
+
+
+class UsageError(Exception):
+    """Custom exception for usage that cannot be read from the database"""
+    pass
+
+
+class ShardedCounter:
+    """
+    Counts per key, spread over independently locked shards
+
+    Threads are assigned shards round-robin on their first add and keep
+    them, so threads rarely contend for a lock. Reads and drains visit every
+    shard.
+    """
+
+    def __init__(self, shards: int = DEFAULT_SHARDS):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self._shards: List[Tuple[threading.Lock, Dict]] = [
+            (threading.Lock(), {}) for _ in range(shards)
+        ]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def add(self, key, amount: int = 1) -> None:
+        """Add amount to the count for key"""
+        # Thread ids are aligned addresses, so ident % shards would be 0 for all
+        index = getattr(self._local, "index", None)
+        if index is None:
+            index = self._local.index = next(self._next_shard) % len(self._shards)
+        lock, counts = self._shards[index]
+        with lock:
+            counts[key] = counts.get(key, 0) + amount
+
+    def drain(self) -> Dict:
+        """Remove and return all counts, summed over the shards"""
+        totals: Dict = defaultdict(int)
+        for lock, counts in self._shards:
+            with lock:
+                items = list(counts.items())
+                counts.clear()
+            for key, count in items:
+                totals[key] += count
+        return dict(totals)
+
+    def snapshot(self) -> Dict:
+        """Current counts, summed over the shards, without removing them"""
+        totals: Dict = defaultdict(int)
+        for lock, counts in self._shards:
+            with lock:
+                items = list(counts.items())
+            for key, count in items:
+                totals[key] += count
+        return dict(totals)
+
+    def __len__(self) -> int:
+        return len(self.snapshot())
+
+
+class UsageTracker:
+    """Per-user, per-operation calculation counts, flushed periodically"""
+
+    def __init__(self, url: Optional[str] = None, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 shards: int = DEFAULT_SHARDS):
+        """
+        Args:
+            url: sqlite:/// or postgresql:// URL of the database holding
+                user_usage; None keeps counts in memory only
+            flush_interval: Seconds between flushes
+            shards: Number of counter shards
+        """
+        self.url = url
+        self.flush_interval = flush_interval
+        self._pending = ShardedCounter(shards)
+        self._last_activity: Dict[UsageKey, datetime] = {}
+        # Held across a flush so readers never see a delta both in memory
+        # and in the table, or in neither
+        self._flush_lock = threading.Lock()
+        self._conn = None
+        self._placeholder = "%s" if is_postgres_url(url) else "?"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if url is not None:
+            self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+            self._thread.start()
+        metrics.gauge(
+            "calculator_usage_pending_keys", "(user, operation) counts not yet flushed",
+            function=lambda: len(self._pending)
+        )
+
+    def record(self, user_id: int, operation: str, amount: int = 1) -> None:
+        """Count calculations for a user; never touches the database"""
+        key = (user_id, operation)
+        self._pending.add(key, amount)
+        self._last_activity[key] = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def usage(self, user_id: int) -> Tuple[Dict[str, int], int]:
+        """
+        Calculation counts for a user
+
+        Args:
+            user_id: User to report
+
+        Returns:
+            (counts per operation including unflushed ones, unflushed total)
+
+        Raises:
+            UsageError: If the flushed totals cannot be read
+        """
+        with self._flush_lock:
+            counts: Dict[str, int] = defaultdict(int)
+            if self.url is not None:
+                try:
+                    conn = self._connection()
+                    rows = conn.execute(
+                        SELECT_USAGE.format(p=self._placeholder), (user_id,)
+                    ).fetchall()
+                    conn.commit()
+                except Exception as e:
+                    self._discard_connection()
+                    logger.warning("Reading usage for user %s failed: %s", user_id, e)
+                    raise UsageError("Usage totals are unavailable")
+                for operation, count in rows:
+                    counts[operation] += count
+            unflushed = 0
+            for (key_user, operation), count in self._pending.snapshot().items():
+                if key_user == user_id:
+                    counts[operation] += count
+                    unflushed += count
+        return dict(counts), unflushed
+
+    def flush(self) -> bool:
+        """
+        Write the pending deltas in one transaction
+
+        On PostgreSQL, deltas for users missing from the users table are
+        dropped, counted in calculator_usage_skipped_rows_total and logged.
+
+        Returns:
+            False if the write failed; the deltas are kept for the next flush
+        """
+        if self.url is None:
+            return True
+        with self._flush_lock:
+            deltas = self._pending.drain()
+            if not deltas:
+                return True
+            rows = []
+            for (user_id, operation), count in deltas.items():
+                last_activity = self._last_activity.pop((user_id, operation), None)
+                rows.append((user_id, operation, count,
+                             last_activity or datetime.now(timezone.utc).replace(tzinfo=None)))
+            try:
+                with tracer.trace("usage.flush", rows=len(rows)):
+                    skipped = self._write(rows)
+            except Exception as e:
+                self._discard_connection()
+                for user_id, operation, count, last_activity in rows:
+                    self._pending.add((user_id, operation), count)
+                    self._last_activity.setdefault((user_id, operation), last_activity)
+                usage_flushes.inc(outcome="failed")
+                logger.warning("Usage flush of %d counters failed, retrying later: %s",
+                               len(rows), e)
+                return False
+        usage_flushes.inc(outcome="ok")
+        usage_flushed_rows.inc(len(rows) - len(skipped))
+        if skipped:
+            usage_skipped_rows.inc(len(skipped))
+            logger.warning("Dropped %d usage counters for unknown users %s", len(skipped),
+                           sorted({user_id for user_id, _, _, _ in skipped}))
+        logger.debug("Flushed %d usage counters", len(rows) - len(skipped))
+        return True
+
+    def close(self) -> None:
+        """Stop the flusher and write what is still pending"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._flush_lock:
+            self._discard_connection()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            started = time.monotonic()
+            self.flush()
+            logger.debug("Usage flush took %.3fs", time.monotonic() - started)
+
+    def _connection(self):
+        if self._conn is None:
+            if is_postgres_url(self.url):
+                import psycopg
+                self._conn = psycopg.connect(self.url)
+            else:
+                path = self.url[len(SQLITE_PREFIX):]
+                if path != ":memory:":
+                    Path(path).parent.mkdir(parents=True, exist_ok=True)
+                # Used by the flusher and request threads, always under _flush_lock
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                # Like the history store, keep counts whose user is not in users
+                self._conn.execute("PRAGMA foreign_keys=OFF")
+                self._conn.executescript(SQLITE_USAGE_SCHEMA)
+        return self._conn
+
+    def _discard_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _write(self, rows: List[Tuple]) -> List[Tuple]:
+        """Upsert rows and return those skipped for unknown users"""
+        conn = self._connection()
+        skipped: List[Tuple] = []
+        try:
+            if is_postgres_url(self.url):
+                with conn.cursor() as cur:
+                    cur.execute(SELECT_KNOWN_USERS, (sorted({row[0] for row in rows}),))
+                    known = {user_id for user_id, in cur.fetchall()}
+                    skipped = [row for row in rows if row[0] not in known]
+                    written = [row for row in rows if row[0] in known]
+                    if written:
+                        # psycopg pipelines executemany into a single round trip
+                        cur.executemany(UPSERT.format(p="%s"), written)
+            else:
+                conn.executemany(UPSERT.format(p="?"), [
+                    (user_id, operation, count, last_activity.isoformat(sep=" "))
+                    for user_id, operation, count, last_activity in rows
+                ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return skipped
+
+
+def tracker_from_env() -> UsageTracker:
+    """
+    Create the usage tracker configured by the environment
+
+    DATABASE_URL selects the database (sqlite:/// or postgresql://; anything
+    else keeps counts in memory), USAGE_FLUSH_SECONDS the flush interval and
+    USAGE_SHARDS the number of counter shards.
+    """
+    url = get_database_url()
+    if url is not None and not (url.startswith(SQLITE_PREFIX) or is_postgres_url(url)):
+        url = None
+    return UsageTracker(
+        url,
+        flush_interval=float(os.getenv("USAGE_FLUSH_SECONDS", str(DEFAULT_FLUSH_INTERVAL))),
+        shards=int(os.getenv("USAGE_SHARDS", str(DEFAULT_SHARDS))),
+    )